@@ -0,0 +1,115 @@
+# benchmarks/bench_calendar_parser.py
+"""
+Benchmark: calendar_parser.parse_calendar_html (lxml, อ่าน cell ตามคลาส) เทียบกับเส้นทางเดิม
+(BeautifulSoup select + get_text ทุก cell แล้วซ่อมคอลัมน์ด้วย heuristics ของ _normalize_ff_events เดิม)
+วัดเวลา parse และ memory allocation (tracemalloc) บนไฟล์ HTML ที่บันทึกไว้
+
+รัน:    python benchmarks/bench_calendar_parser.py [--html file.html ...] [--repeat 50]
+บันทึก: python benchmarks/bench_calendar_parser.py --record   (เซฟหน้า forexfactory.com ลง fixtures/)
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, ROOT)
+from calendar_parser import parse_calendar_html  # noqa: E402
+
+# ---- เส้นทางเดิม (สำเนาจาก forex_daily_news.py ก่อนเปลี่ยน parser) ----
+_CCY = {"USD", "EUR", "GBP", "JPY", "AUD", "NZD", "CAD", "CHF", "CNY", "CNH", "SEK", "NOK"}
+_TIME_RE = re.compile(r"^\d{1,2}:\d{2}(am|pm)$")
+
+def _legacy_rows(html):
+    soup = BeautifulSoup(html, 'lxml')
+    table = soup.select_one("table.calendar__table")
+    if not table:
+        return []
+    extracted = []
+    keys = ["Time", "Currency", "Impact", "Event", "Actual", "Forecast", "Previous"]
+    for row in table.select("tr.calendar__row"):
+        cells = row.find_all('td')
+        if len(cells) < 6: continue
+        row_data = [cell.get_text(strip=True) for cell in cells]
+        full_row_data = row_data[:7] + [""] * (7 - len(row_data))
+        if not full_row_data[0] or full_row_data[0].lower() in ['all day', 'time', '']: continue
+        if not any(full_row_data[1:4]): continue
+        extracted.append(dict(zip(keys, full_row_data)))
+    return extracted
+
+def _legacy_normalize(events):
+    def is_time(s):
+        s = (s or "").strip().lower()
+        return s in {"tentative", "all day", "all-day"} or bool(_TIME_RE.match(s))
+    fixed = []
+    for ev in events:
+        cur = next((v for v in ((ev.get(k) or "").strip().upper() for k in ("Currency", "Impact", "Event")) if v in _CCY), "")
+        tim = next((v for v in ((ev.get(k) or "").strip() for k in ("Time", "Currency", "Event", "Actual", "Forecast")) if is_time(v)), "Tentative")
+        name = next((v for v in ((ev.get(k) or "").strip() for k in ("Event", "Actual", "Forecast")) if v and v.upper() not in _CCY and len(v) >= 3), "")
+        imp = (ev.get("Impact") or "").strip().title()
+        if cur and name:
+            fixed.append({"Time": tim, "Currency": cur, "Impact": "" if imp.upper() in _CCY else imp, "Event": name,
+                          "Actual": (ev.get("Actual") or "").strip(), "Forecast": (ev.get("Forecast") or "").strip(),
+                          "Previous": (ev.get("Previous") or "").strip()})
+    return fixed
+
+def legacy_parse(html):
+    return _legacy_normalize(_legacy_rows(html))
+
+# ---- วัดผล ----
+def measure(fn, html, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        events = fn(html)
+        best = min(best, time.perf_counter() - started)
+    # peak = หน่วยความจำสูงสุดระหว่าง parse, retained = ขนาดผลลัพธ์ที่ยังถือไว้
+    tracemalloc.start()
+    events = fn(html)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, retained, events
+
+def record():
+    import requests
+    os.makedirs(FIXTURES, exist_ok=True)
+    response = requests.get("https://www.forexfactory.com/", timeout=20, cookies={'fftimezone': 'Asia%2FNovosibirsk'},
+                            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                                                   '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'})
+    response.raise_for_status()
+    path = os.path.join(FIXTURES, f"ff_homepage_{datetime.utcnow():%Y%m%d_%H%M}.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(response.text)
+    print(f"💾 Saved {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--html", nargs="*", help="HTML files (default: benchmarks/fixtures/*.html)")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--record", action="store_true", help="save the live homepage into fixtures/ and exit")
+    args = parser.parse_args()
+    if args.record:
+        record()
+        return 0
+
+    files = args.html or sorted(glob.glob(os.path.join(FIXTURES, "*.html")))
+    print(f"{'fixture':<32} {'path':<8} {'events':>6} {'best':>10} {'peak mem':>10} {'retained':>10}")
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        name = os.path.basename(path)[:32]
+        for label, fn in (("legacy", legacy_parse), ("lxml", parse_calendar_html)):
+            best, peak, retained, events = measure(fn, html, args.repeat)
+            print(f"{name:<32} {label:<8} {len(events):>6} {best * 1000:>8.2f}ms "
+                  f"{peak / 1024:>8.1f}KB {retained / 1024:>8.1f}KB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# benchmarks/bench_iq_fetch.py
+"""
+Load test ของ IQDataFetcher.get_technical_data_batch กับ ReplayIQBackend (ไม่ใช้ network)
+แท่งเทียน synthetic เป็นค่าเริ่มต้น (--recording ชี้ไฟล์ที่บันทึกด้วย bench_pipeline.py --record-candles)
+- N คู่เงิน x 4 timeframe, แบ่งคู่เงินให้หลาย thread ดึงพร้อมกัน (fetcher ตัวเดียวกัน)
+- ตั้งความเร็ว, latency/jitter ของ stream, อัตราการไหลของแท่ง และโอกาสหลุดการเชื่อมต่อได้
+- รายงานเวลารวม, สถานะของ stream (ready/stable/deadline/disconnected), คู่ที่ไม่ได้ข้อมูล
+  และ metrics ของ ConnectionSupervisor (reconnect, เวลาที่ใช้ reconnect)
+- --compare-resampled: ตรวจแท่ง H1/H4/D1 ที่ resample จาก M15 เทียบกับแท่งที่ดึงตรง (IQDataFetcher.compare_resampled)
+  ผ่าน backend ตาม IQ_BACKEND (live ต้องมี IQ_USER/IQ_PASS; replay ใช้ไฟล์ IQ_REPLAY_PATH ที่บันทึกจาก live)
+  เทียบด้วยขอบเขตแท่ง UTC (tz_offset_hours=0) แบบเดียวกับ IQ Option; โหมด resample ที่ใช้จริงตั้งขอบเขต
+  H4/D1 ตามเที่ยงคืน ICT (RESAMPLE_TZ_OFFSET_HOURS=7) จึงต่างจากแท่งของ IQ Option โดยตั้งใจ
+
+รัน: python benchmarks/bench_iq_fetch.py --pairs 25 100 --threads 1 4 --pool 4 --speed 10 --disconnect-prob 0.001
+ตรวจ resample: python benchmarks/bench_iq_fetch.py --compare-resampled EUR/USD USD/JPY [--tolerance 1e-5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+from bench_pipeline import make_pairs  # noqa: E402
+from get_data import IQDataFetcher  # noqa: E402
+from iq_backends import ReplayIQBackend, load_recording  # noqa: E402
+from stubs import CANDLE_FIXTURE  # noqa: E402
+
+COMPARE_TIMEFRAMES = (3600, 14400, 86400)
+
+def run_once(pairs, threads, recorded, args):
+    backends = []
+
+    def factory():
+        backend = ReplayIQBackend(recorded, speed=args.speed, latency=args.latency, jitter=args.jitter,
+                                  fill_rate=args.fill_rate, disconnect_prob=args.disconnect_prob,
+                                  connect_latency=args.connect_latency, seed=len(backends))
+        backends.append(backend)
+        return backend
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetcher = IQDataFetcher(fetch_deadline=args.deadline, poll_interval=args.poll, store_path=None,
+                                pool_size=args.pool, backend_factory=factory)
+        shards = [pairs[i::threads] for i in range(threads)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = {}
+            for part in pool.map(fetcher.get_technical_data_batch, shards):
+                results.update(part)
+        elapsed = time.perf_counter() - started
+    statuses = Counter(status for *_, status in fetcher.fetch_waits)
+    missing = sum(1 for value in results.values() if value is None)
+    return elapsed, statuses, missing, fetcher.connection_metrics()
+
+def compare_resampled(pairs, tolerance):
+    """รายงานผลเทียบต่อคู่/timeframe คืน 1 ถ้ามี timeframe ที่ไม่มีแท่งตรงกัน หรือต่างเกิน tolerance"""
+    fetcher = IQDataFetcher(store_path=None, snapshots=False)
+    if fetcher.api is None:
+        print("❌ No IQ connection (check IQ_BACKEND / IQ_USER / IQ_PASS).")
+        return 1
+    failures = 0
+    try:
+        print(f"{'pair':<9}{'tf':>7}{'matched':>9}{'max diff':>12}  ok")
+        for pair in pairs:
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = fetcher.compare_resampled(pair, COMPARE_TIMEFRAMES, tz_offset_hours=0)
+            for tf, result in report.items():
+                diff = result["max_abs_diff"]
+                ok = result["matched"] > 0 and diff is not None and diff <= tolerance
+                failures += not ok
+                print(f"{pair:<9}{tf:>7}{result['matched']:>9}{'-' if diff is None else f'{diff:.2e}':>12}  "
+                      f"{'✅' if ok else '❌'}")
+    finally:
+        fetcher.close_connection()
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, nargs="+", default=[25, 100])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--fill-rate", type=float, default=0.0, help="แท่ง/วินาที (0 = มาครบทีเดียว)")
+    parser.add_argument("--disconnect-prob", type=float, default=0.0)
+    parser.add_argument("--connect-latency", type=float, default=1.0, help="เวลา login/reconnect ต่อ session")
+    parser.add_argument("--pool", type=int, default=1, help="จำนวน session ใน pool ของ IQDataFetcher")
+    parser.add_argument("--deadline", type=float, default=6.0)
+    parser.add_argument("--poll", type=float, default=0.05)
+    parser.add_argument("--recording", default=CANDLE_FIXTURE)
+    parser.add_argument("--compare-resampled", nargs="+", metavar="PAIR",
+                        help="เทียบแท่ง H1/H4/D1 ที่ resample จาก M15 กับแท่งที่ดึงตรง (UTC) แล้วจบ")
+    parser.add_argument("--tolerance", type=float, default=1e-5, help="ผลต่างราคาสูงสุดที่ยอมรับ (--compare-resampled)")
+    args = parser.parse_args()
+    if args.compare_resampled:
+        return compare_resampled(args.compare_resampled, args.tolerance)
+
+    recorded = load_recording(args.recording)
+    print(f"candles: {'recorded' if recorded else 'synthetic'} | speed x{args.speed} "
+          f"| disconnect_prob={args.disconnect_prob} | pool={args.pool}")
+    print(f"{'pairs':>6}{'threads':>8}{'streams':>9}{'time s':>9}{'missing':>9}  statuses / sessions")
+    for count in args.pairs:
+        pairs = make_pairs(count)
+        for threads in args.threads:
+            elapsed, statuses, missing, stats = run_once(pairs, threads, recorded, args)
+            print(f"{count:>6}{threads:>8}{sum(statuses.values()):>9}{elapsed:>9.2f}{missing:>9}  "
+                  f"{dict(statuses)} {stats}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# benchmarks/bench_pipeline.py
+"""
+Benchmark แบบ offline ของทั้ง pipeline (calendar -> macro -> technicals -> GPT/Typhoon -> Telegram)
+โดยใช้ stub ในเครื่องแทนบริการภายนอกทั้งหมด (ดู stubs.py)
+- แท่งเทียน: ค่าเริ่มต้นเป็น synthetic random walk แบบ deterministic (iq_backends.synthetic_payload)
+  ถ้ามี fixtures/candles.json (ไม่ได้ commit ไว้ สร้างด้วย --record-candles) จะใช้แท่งที่บันทึกไว้แทน
+- วัดเวลาแต่ละ stage และทั้งรอบ สำหรับ N คู่เงิน (ค่าเริ่มต้น 5, 25, 100)
+- ต่อท้ายผลลงใน results/pipeline_history.jsonl (พร้อม hash ของ commit; ไฟล์ในเครื่อง ไม่อยู่ใน git)
+
+รัน:    python benchmarks/bench_pipeline.py [--pairs 5 25 100] [--gpt-latency 6 --typhoon-latency 2 ...]
+บันทึก: python benchmarks/bench_pipeline.py --record-candles   (ดึงแท่งเทียนจริงจาก IQ Option ลง fixtures/candles.json
+        ต้องมี IQ_USER/IQ_PASS)
+
+หมายเหตุ: Telegram จริงจำกัด ~1 ข้อความ/วินาที ต่อแชท ค่าเริ่มต้น --telegram-interval จึงต่ำกว่าจริง
+เพื่อให้วัดโค้ดของเราได้ (ตั้ง 1.0 เพื่อดูเวลาที่ถูก rate limit จริง)
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(HERE, "results", "pipeline_history.jsonl")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+from stubs import CANDLE_FIXTURE, FIXTURES, StubServices  # noqa: E402
+from iq_backends import ReplayIQBackend, load_recording, save_recording  # noqa: E402
+
+CURRENCIES = ["EUR", "USD", "GBP", "JPY", "AUD", "NZD", "CAD", "CHF", "SEK", "NOK", "SGD", "HKD", "MXN", "ZAR"]
+CORE_PAIRS = ["EUR/USD", "GBP/USD", "USD/JPY", "EUR/GBP", "EUR/CHF"]
+
+def make_pairs(count):
+    """5 คู่หลักของรันจริงก่อน แล้วเติมด้วยคู่ cross จากรายการสกุลเงิน"""
+    pairs = list(CORE_PAIRS)
+    for base, quote in itertools.permutations(CURRENCIES, 2):
+        if len(pairs) >= count:
+            break
+        pair = f"{base}/{quote}"
+        if pair not in pairs:
+            pairs.append(pair)
+    return pairs[:count]
+
+def configure_env(stubs, args, workdir):
+    """ชี้ทุก client ไปที่ stub ก่อน import forex_daily_news (ค่าถูกอ่านตอน import)"""
+    os.environ.update({
+        "OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": f"{stubs.url}/v1",
+        "TYPHOON_API_KEY": "stub", "TELEGRAM_BOT_TOKEN": "stub-main", "SIGNAL_BOT_TOKEN": "stub-signal",
+        "CHAT_ID": "1000", "TELEGRAM_API_URL": stubs.url,
+        "TELEGRAM_SEND_INTERVAL": str(args.telegram_interval),
+        "PIPELINE_CONCURRENCY": str(args.concurrency),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm.sqlite"), "LLM_CACHE_BYPASS": "1",
+        "CANDLE_STORE_PATH": "", "TRACE_PATH": os.path.join(workdir, "trace.json"),
+    })
+
+def run_once(fdn, pairs, stubs, recorded, args, workdir):
+    import tracing
+    from calendar_cache import CalendarCache
+    from get_data import IQDataFetcher
+    from tele_signals import ForexBot, TelegramNotifier, TyphoonForexAnalyzer
+
+    tracing.TRACER.reset()
+    stages = {}
+    started = time.perf_counter()
+
+    def stage(name, fn):
+        t0 = time.perf_counter()
+        value = fn()
+        stages[name] = time.perf_counter() - t0
+        return value
+
+    cache = CalendarCache(tempfile.mkdtemp(dir=workdir), ttl_seconds=0)
+    events = stage("calendar", lambda: fdn.load_calendar(cache=cache, refresh_actuals=False))
+    index = fdn.build_event_index(events)
+    stage("macro", lambda: fdn.set_global_macro_from_events(index))
+
+    iq = ReplayIQBackend(recorded, latency=args.iq_latency, jitter=args.iq_jitter, connect_latency=0)
+    fetcher = IQDataFetcher(poll_interval=0.05, store_path=None, backend=iq)
+    analyzer = TyphoonForexAnalyzer("stub", base_url=f"{stubs.url}/v1", cache=fdn.LLM_CACHE)
+    bot = ForexBot(analyzer, TelegramNotifier("stub-signal", "1000", outbox=fdn.TELEGRAM_OUTBOX))
+
+    timer = fdn.StageTimer()
+    stage("pipeline", lambda: fdn.run_pipeline(index, pairs, fetcher, bot, args.concurrency, timer))
+    stages["technicals"] = sum(sec for _, sec in timer.records.get("technicals", []))
+    stages["llm+enqueue"] = stages.pop("pipeline") - stages["technicals"]
+    stage("telegram drain", fdn.TELEGRAM_OUTBOX.flush)
+    total = time.perf_counter() - started
+
+    spans = {name: {"count": row["count"], "total": round(row["total"], 4), "mean": round(row["mean"], 4)}
+             for name, row in tracing.TRACER.summary().items()}
+    return {"stages": {k: round(v, 4) for k, v in stages.items()}, "total": round(total, 4), "spans": spans}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def record_candles(pairs):
+    """บันทึก payload จริงของ get_realtime_candles ลง fixtures/candles.json"""
+    from get_data import IQDataFetcher, TECHNICAL_TIMEFRAMES
+    fetcher = IQDataFetcher(store_path=None)
+    if not fetcher.api:
+        sys.exit("❌ Could not connect to IQ Option.")
+    streams = {(pair.replace("/", ""), tf): count for pair in pairs for tf, count in TECHNICAL_TIMEFRAMES.items()}
+    for (pair, tf), count in streams.items():
+        fetcher.api.start_candles_stream(pair, tf, count)
+    try:
+        raw = fetcher._wait_for_streams(streams)
+    finally:
+        for pair, tf in streams:
+            fetcher.api.stop_candles_stream(pair, tf)
+    payload = {key: candles for key, (candles, _, _) in raw.items()}
+    save_recording(CANDLE_FIXTURE, payload)
+    fetcher.close_connection()
+    print(f"💾 Saved {len(payload)} candle streams to {CANDLE_FIXTURE}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, nargs="+", default=[5, 25, 100])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--html", default=os.path.join(FIXTURES, "ff_homepage_sample.html"))
+    parser.add_argument("--calendar-latency", type=float, default=0.4)
+    parser.add_argument("--gpt-latency", type=float, default=6.0)
+    parser.add_argument("--typhoon-latency", type=float, default=2.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.15)
+    parser.add_argument("--iq-latency", type=float, default=0.5, help="เวลาก่อน stream แรกพร้อม (วินาที)")
+    parser.add_argument("--iq-jitter", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2, help="jitter ของ HTTP stub (วินาที)")
+    parser.add_argument("--telegram-interval", type=float, default=0.05)
+    parser.add_argument("--telegram-429-every", type=int, default=0)
+    parser.add_argument("--no-history", action="store_true", help="ไม่บันทึกผลลง results/")
+    parser.add_argument("--verbose", action="store_true", help="แสดง log ของ pipeline")
+    parser.add_argument("--record-candles", action="store_true")
+    args = parser.parse_args()
+
+    if args.record_candles:
+        record_candles(CORE_PAIRS)
+        return
+
+    with open(args.html, encoding="utf-8") as f:
+        html = f.read()
+    latency = {"calendar": args.calendar_latency, "responses": args.gpt_latency,
+               "chat": args.typhoon_latency, "telegram": args.telegram_latency}
+    stubs = StubServices(html, latency, jitter=args.jitter, telegram_429_every=args.telegram_429_every).start()
+    workdir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    configure_env(stubs, args, workdir)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        import forex_daily_news as fdn
+    fdn.FF_URL = f"{stubs.url}/"
+    recorded = load_recording(CANDLE_FIXTURE)
+    source = "recorded" if recorded else "synthetic"
+    print(f"Stub services at {stubs.url} | candles: {source} | concurrency={args.concurrency}")
+
+    rows = []
+    try:
+        for count in args.pairs:
+            pairs = make_pairs(count)
+            for run in range(args.repeat):
+                quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+                with quiet:
+                    result = run_once(fdn, pairs, stubs, recorded, args, workdir)
+                result.update({"pairs": count, "run": run})
+                rows.append(result)
+                stage_text = "  ".join(f"{k}={v:.2f}s" for k, v in result["stages"].items())
+                print(f"N={count:<4} total={result['total']:.2f}s  {stage_text}")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fdn.TELEGRAM_OUTBOX.close()
+        stubs.stop()
+
+    if not args.no_history:
+        os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+        meta = {"timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z", "commit": git_commit(),
+                "candles": source, "concurrency": args.concurrency, "latency": latency,
+                "iq_latency": args.iq_latency, "telegram_interval": args.telegram_interval}
+        with open(RESULTS, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({**meta, **row}) + "\n")
+        print(f"📈 Appended {len(rows)} results to {RESULTS}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# benchmarks/stubs.py
+"""
+ตัวแทนบริการภายนอกสำหรับ benchmark แบบ offline
+- StubServices: HTTP server ในเครื่องหนึ่งตัว จำลอง ForexFactory (GET /), OpenAI Responses API
+  (POST /v1/responses), Typhoon/Chat Completions (POST /v1/chat/completions) และ Telegram
+  (POST /bot<token>/sendMessage) พร้อม latency + jitter ที่ตั้งได้ต่อบริการ
+IQ Option ใช้ iq_backends.ReplayIQBackend: แท่งเทียน synthetic เป็นค่าเริ่มต้น หรือแท่งที่บันทึกไว้ใน
+fixtures/candles.json ถ้ามีไฟล์ (ไม่ได้ commit ไว้ สร้างด้วย bench_pipeline.py --record-candles)
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CANDLE_FIXTURE = os.path.join(FIXTURES, "candles.json")
+
+# latency (วินาที) เริ่มต้นต่อบริการ ใกล้เคียงค่าที่เห็นจริงตอนรันบน GitHub Actions
+DEFAULT_LATENCY = {"calendar": 0.4, "responses": 6.0, "chat": 2.0, "telegram": 0.15}
+
+STUB_ANALYSIS = """## OVERVIEW
+- Date (ICT): {date}
+- Pair: {pair}
+- Context: Stub analysis for offline benchmarking; structure mirrors the real output.
+
+## BIAS
+- Intraday Bias: Neutral — stub
+
+## KEY LEVELS
+- Supports: [1.00000-PDL] | [0.99500-S1]
+- Resistances: [1.01000-PDH] | [1.01500-R1]
+
+## SETUPS (SAME-DAY CLOSE)
+### LONG
+- Entry: 1.00100
+- TP: 1.00500 (+40 pips, RR 2.0)
+- SL: 1.00000 (-20 pips)
+- Risk: stub
+### SHORT
+- Entry: 1.00900
+- TP: 1.00500 (+40 pips, RR 2.0)
+- SL: 1.01100 (-20 pips)
+- Risk: stub
+
+## RISK ALERTS
+- stub
+"""
+
+STUB_SUMMARY = """**PAIR:** {pair}
+**DATE:** stub
+**BIAS:** Neutral - stub
+
+**KEY ZONES:**
+**SUPPORTS:** 1.00000-PDL | 0.99500-S1
+**RESISTANCES:** 1.01000-PDH | 1.01500-R1
+
+**SETUPS (SAME-DAY CLOSE):**
+🐂 **LONG SETUP:** **ENTRY:** 1.00100 **TP:** 1.00500 **SL:** 1.00000
+🐻 **SHORT SETUP:** **ENTRY:** 1.00900 **TP:** 1.00500 **SL:** 1.01100
+
+**RISK ALERTS:** None"""
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+class StubServices:
+    """
+    latency: {"calendar"|"responses"|"chat"|"telegram": วินาที}, jitter: สุ่มเพิ่ม 0..jitter วินาที
+    telegram_429_every: ตอบ 429 (retry_after=1) ทุก ๆ k ข้อความ (0 = ไม่จำลอง)
+    """
+    def __init__(self, calendar_html, latency=None, jitter=0.0, telegram_429_every=0, seed=7):
+        self.calendar_html = calendar_html.encode("utf-8")
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.jitter = jitter
+        self.telegram_429_every = telegram_429_every
+        self.calls = Counter()
+        self._seen_prefixes = set()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive เหมือนบริการจริง
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Content-Type", "text/html" if isinstance(body, bytes) else "application/json")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                services._delay("calendar")
+                self._reply(200, services.calendar_html, {"ETag": '"stub-calendar"'})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8")
+                if self.path.endswith("/responses"):
+                    services._delay("responses")
+                    self._reply(200, services.responses_body(json.loads(raw)))
+                elif self.path.endswith("/chat/completions"):
+                    services._delay("chat")
+                    self._reply(200, services.chat_body(json.loads(raw)))
+                elif "/sendMessage" in self.path:
+                    services._delay("telegram")
+                    status, body = services.telegram_body()
+                    self._reply(status, body)
+                else:
+                    self._reply(404, {"error": "unknown stub route"})
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-services", daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _delay(self, service):
+        with self._lock:
+            self.calls[service] += 1
+            extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+        time.sleep(self.latency[service] + extra)
+
+    def responses_body(self, request):
+        prompt = request.get("input") or ""
+        match = re.search(r"Analyze (\S+) for intraday trading on (\S+)", prompt)
+        pair, date = match.groups() if match else ("UNKNOWN", "stub")
+        text = STUB_ANALYSIS.format(pair=pair, date=date)
+        input_tokens = _tokens((request.get("instructions") or "") + prompt)
+        # จำลอง prompt caching: prefix (instructions + ส่วนก่อนชื่อคู่เงิน) ที่เคยเห็นแล้วนับเป็น cached
+        prefix = (request.get("instructions") or "") + prompt.split(pair, 1)[0]
+        with self._lock:
+            seen = prefix in self._seen_prefixes
+            self._seen_prefixes.add(prefix)
+        cached = (_tokens(prefix) // 128) * 128 if seen and _tokens(prefix) >= 1024 else 0
+        output_tokens = _tokens(text)
+        return {
+            "id": "resp_stub", "object": "response", "created_at": 0, "status": "completed",
+            "model": request.get("model"),
+            "output": [{
+                "id": "msg_stub", "type": "message", "role": "assistant", "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": input_tokens, "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": output_tokens, "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    def chat_body(self, request):
+        prompt = "\n".join(m.get("content") or "" for m in request.get("messages") or [])
+        batch = re.findall(r"<<<ANALYSIS (.+?)>>>", prompt)
+        if batch:
+            content = "\n\n".join(f"<<<BEGIN {pair}>>>\n{STUB_SUMMARY.format(pair=pair)}\n<<<END {pair}>>>"
+                                  for pair in batch)
+        else:
+            match = re.search(r"- Pair: (\S+)", prompt)
+            content = STUB_SUMMARY.format(pair=match.group(1) if match else "UNKNOWN")
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(content)
+        return {
+            "id": "chatcmpl_stub", "object": "chat.completion", "created": 0, "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def telegram_body(self):
+        with self._lock:
+            sent = self.calls["telegram"]
+        if self.telegram_429_every and sent % self.telegram_429_every == 0:
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}
+        return 200, {"ok": True, "result": {"message_id": sent}}
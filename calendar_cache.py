@@ -0,0 +1,41 @@
+# calendar_cache.py
+import os
+import json
+import time
+
+class CalendarCache:
+    """
+    แคชปฏิทินข่าว ForexFactory บนดิสก์ แยกไฟล์ตามวันที่ (ICT)
+    เก็บ events ที่ normalize แล้ว พร้อม ETag/Last-Modified สำหรับ revalidate
+    """
+    def __init__(self, folder, ttl_seconds):
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, day):
+        return os.path.join(self.folder, f"{day}.json")
+
+    def load(self, day):
+        """entry ของวันนั้น ({fetched_at, etag, last_modified, events}) หรือ None"""
+        try:
+            with open(self._path(day), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry.get("fetched_at", 0) < self.ttl_seconds
+
+    def save(self, day, events, etag=None, last_modified=None):
+        entry = {"fetched_at": time.time(), "etag": etag, "last_modified": last_modified, "events": events}
+        # เขียนไฟล์ชั่วคราวก่อนแล้วค่อยแทนที่ เพื่อไม่ให้ไฟล์เสียถ้าโปรแกรมหยุดกลางคัน
+        tmp = self._path(day) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, self._path(day))
+        return entry
+
+    def touch(self, day, entry):
+        """ต่ออายุ entry เดิม (เช่น เมื่อเว็บตอบ 304 Not Modified)"""
+        return self.save(day, entry["events"], entry.get("etag"), entry.get("last_modified"))
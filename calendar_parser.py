@@ -0,0 +1,83 @@
+# calendar_parser.py
+"""
+Parser ตารางปฏิทิน ForexFactory (ใช้ร่วมกันทั้ง requests tier และ Playwright tier)
+อ่านแต่ละ cell ตามชื่อคลาส calendar__* ด้วย lxml แทนการนับตำแหน่ง cell
+และ carry-forward เวลา/วันที่จากแถวก่อนหน้า (FF แสดงเวลาแค่แถวแรกของกลุ่ม)
+ผลลัพธ์จึงเรียงคอลัมน์ถูกต้องตั้งแต่แรก ไม่ต้องซ่อมด้วย heuristics อีก
+"""
+from lxml import html as lxml_html
+
+CALENDAR_KEYS = ["Date", "Time", "Currency", "Impact", "Event", "Actual", "Forecast", "Previous"]
+
+_ROW_XPATH = (
+    '//table[contains(concat(" ", normalize-space(@class), " "), " calendar__table ")]'
+    '//tr[contains(concat(" ", normalize-space(@class), " "), " calendar__row ")]'
+)
+# คลาสไอคอนของ impact -> label
+_IMPACT_CLASSES = {
+    "icon--ff-impact-red": "High",
+    "icon--ff-impact-ora": "Medium",
+    "icon--ff-impact-yel": "Low",
+    "icon--ff-impact-gra": "Holiday",
+}
+
+def _cell_text(cell):
+    """ข้อความใน cell โดยคั่นแต่ละ text node ด้วยช่องว่าง (เช่น 'Mon Oct 13')"""
+    return " ".join(part.strip() for part in cell.itertext() if part.strip())
+
+def _impact_label(cell):
+    for span in cell.iter("span"):
+        for cls in (span.get("class") or "").split():
+            if cls in _IMPACT_CLASSES:
+                return _IMPACT_CLASSES[cls]
+        title = span.get("title") or ""
+        if title:
+            return title.replace(" Impact Expected", "").strip()
+    return ""
+
+def _row_cells(row):
+    """{ชื่อคอลัมน์: td} จากคลาส calendar__<name> ของแต่ละ cell"""
+    cells = {}
+    for td in row.iterchildren("td"):
+        for cls in (td.get("class") or "").split():
+            if cls.startswith("calendar__") and cls != "calendar__cell":
+                cells[cls[len("calendar__"):]] = td
+    return cells
+
+def parse_calendar_html(html):
+    """แปลง HTML หน้า ForexFactory เป็น list ของ event dict (คีย์ตาม CALENDAR_KEYS)"""
+    if not html:
+        return []
+    root = lxml_html.fromstring(html)
+    events = []
+    current_date, current_time = "", ""
+
+    for row in root.xpath(_ROW_XPATH):
+        cells = _row_cells(row)
+
+        date_cell = cells.get("date")
+        date_text = _cell_text(date_cell) if date_cell is not None else ""
+        if date_text and date_text != current_date:
+            current_date, current_time = date_text, ""
+
+        time_cell = cells.get("time")
+        time_text = _cell_text(time_cell) if time_cell is not None else ""
+        if time_text:
+            current_time = time_text
+
+        currency = _cell_text(cells["currency"]) if "currency" in cells else ""
+        event = _cell_text(cells["event"]) if "event" in cells else ""
+        if not currency or not event:
+            continue  # day-breaker / header / แถวว่าง
+
+        events.append({
+            "Date": current_date,
+            "Time": current_time or "Tentative",
+            "Currency": currency.upper(),
+            "Impact": _impact_label(cells["impact"]) if "impact" in cells else "",
+            "Event": event,
+            "Actual": _cell_text(cells["actual"]) if "actual" in cells else "",
+            "Forecast": _cell_text(cells["forecast"]) if "forecast" in cells else "",
+            "Previous": _cell_text(cells["previous"]) if "previous" in cells else "",
+        })
+    return events
@@ -0,0 +1,123 @@
+# candle_store.py
+import os
+import json
+import sqlite3
+import threading
+
+from candles import Candles
+
+class CandleStore:
+    """
+    ที่เก็บแท่งเทียนบนดิสก์ (SQLite) คีย์เป็น (pair, timeframe, timestamp)
+    ใช้ร่วมกับ IQDataFetcher เพื่อดึงเฉพาะแท่งที่ใหม่กว่าแท่งล่าสุดที่เก็บไว้
+    """
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # ใช้ connection เดียวร่วมกันหลาย thread (คุมด้วย lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS candles (
+                    pair      TEXT    NOT NULL,
+                    timeframe INTEGER NOT NULL,
+                    ts        INTEGER NOT NULL,
+                    open      REAL, high REAL, low REAL, close REAL, volume REAL,
+                    PRIMARY KEY (pair, timeframe, ts)
+                )
+            """)
+            # state ของ streaming indicators (IndicatorState.to_dict เป็น JSON)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    pair      TEXT    NOT NULL,
+                    timeframe INTEGER NOT NULL,
+                    state     TEXT    NOT NULL,
+                    PRIMARY KEY (pair, timeframe)
+                )
+            """)
+            # TechnicalSnapshot ล่าสุดต่อ (pair, timeframe) คีย์ด้วยแท่งที่ปิดล่าสุด (snapshots.py)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS technical_snapshot (
+                    pair      TEXT    NOT NULL,
+                    timeframe INTEGER NOT NULL,
+                    bar_time  INTEGER NOT NULL,
+                    snapshot  TEXT    NOT NULL,
+                    PRIMARY KEY (pair, timeframe)
+                )
+            """)
+
+    def last_timestamp(self, pair, timeframe):
+        """timestamp ของแท่งล่าสุดที่เก็บไว้ (None ถ้ายังไม่มี)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(ts) FROM candles WHERE pair = ? AND timeframe = ?", (pair, timeframe)
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, pair, timeframe, candles):
+        """เพิ่ม/ทับแท่งเทียน (แท่งล่าสุดที่ยังไม่ปิดจะถูกทับด้วยค่าใหม่ในรอบถัดไป)"""
+        rows = [(pair, timeframe) + row for row in candles.rows()]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO candles (pair, timeframe, ts, open, high, low, close, volume) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def load(self, pair, timeframe, count):
+        """คืนค่า `count` แท่งล่าสุด เรียงจากเก่าไปใหม่ เป็น Candles"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM candles "
+                "WHERE pair = ? AND timeframe = ? ORDER BY ts DESC LIMIT ?", (pair, timeframe, count)
+            ).fetchall()
+        return Candles.from_rows(rows[::-1])
+
+    def load_since(self, pair, timeframe, after_ts, limit):
+        """แท่งที่ใหม่กว่า after_ts (ไม่เกิน limit แท่งล่าสุด) เรียงจากเก่าไปใหม่"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM candles "
+                "WHERE pair = ? AND timeframe = ? AND ts > ? ORDER BY ts DESC LIMIT ?",
+                (pair, timeframe, after_ts, limit)
+            ).fetchall()
+        return Candles.from_rows(rows[::-1])
+
+    def load_state(self, pair, timeframe):
+        """state ที่บันทึกไว้ (dict) หรือ None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM indicator_state WHERE pair = ? AND timeframe = ?", (pair, timeframe)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_state(self, pair, timeframe, state):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indicator_state (pair, timeframe, state) VALUES (?, ?, ?)",
+                (pair, timeframe, json.dumps(state))
+            )
+
+    def load_snapshot(self, pair, timeframe):
+        """snapshot ที่บันทึกไว้ (dict ของ TechnicalSnapshot.to_dict) หรือ None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT snapshot FROM technical_snapshot WHERE pair = ? AND timeframe = ?", (pair, timeframe)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_snapshot(self, pair, timeframe, snapshot):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO technical_snapshot (pair, timeframe, bar_time, snapshot) VALUES (?, ?, ?, ?)",
+                (pair, timeframe, snapshot["bar_time"], json.dumps(snapshot))
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,112 @@
+# candles.py
+"""
+แท่งเทียนแบบ columnar: time (int64) + open/high/low/close/volume (float64) เป็น NumPy array ต่อเนื่อง
+แทน list ของ dict ต่อแท่ง (ประหยัด memory และไม่ต้องแปลงไปมาเมื่อถือประวัติยาว ๆ ของหลายคู่เงิน)
+- สร้างตรงจาก payload ของ stream IQ Option ({timestamp: {"from", "open", "max", "min", "close", "volume"}})
+  หรือจากแถวของ CandleStore
+- slice ([-count:], [:-1], tail) คืน view ของ array เดิม ไม่ copy; indicator/pivot/resample ใช้ array โดยตรง
+- แปลงเป็นข้อความเฉพาะตอนเรนเดอร์ prompt (to_records / to_json, prompt_compiler.compact_ohlc)
+"""
+import json
+import math
+
+import numpy as np
+
+FIELDS = ("time", "open", "high", "low", "close", "volume")
+# ชื่อ key ใน payload ของ get_realtime_candles ตามลำดับ open/high/low/close/volume
+_PAYLOAD_KEYS = ("open", "max", "min", "close", "volume")
+
+class Candles:
+    __slots__ = FIELDS
+
+    def __init__(self, time, open, high, low, close, volume):
+        # np.asarray ไม่ copy ถ้า dtype ตรงอยู่แล้ว (เช่น slice ของ Candles อื่น)
+        self.time = np.asarray(time, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+
+    @classmethod
+    def empty(cls):
+        return cls(*(() for _ in FIELDS))
+
+    @classmethod
+    def from_payload(cls, payload):
+        """payload ของ stream -> Candles เรียงตามเวลา (ข้ามแท่งที่ยังไม่สมบูรณ์ คือไม่มี open)"""
+        keys = [ts for ts in sorted(payload) if payload[ts].get('open') is not None]
+        bars = [payload[ts] for ts in keys]
+        time = np.fromiter((c.get('from', ts) for ts, c in zip(keys, bars)), dtype=np.int64, count=len(keys))
+        # แถวของ array 2 มิติแบบ C-order ต่อเนื่องในหน่วยความจำ จึงใช้เป็นคอลัมน์ได้โดยไม่ copy
+        prices = np.array([[c.get(k) for c in bars] for k in _PAYLOAD_KEYS], dtype=np.float64).reshape(5, len(bars))
+        return cls(time, *prices)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """แถว (ts, open, high, low, close, volume) เรียงจากเก่าไปใหม่ (เช่น ผลจาก SQLite)"""
+        if not rows:
+            return cls.empty()
+        block = np.array(rows, dtype=np.float64)
+        return cls(block[:, 0].astype(np.int64), *np.ascontiguousarray(block[:, 1:].T))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        """slice -> view (ไม่ copy); boolean mask/array ของ index -> สำเนา"""
+        return Candles(*(getattr(self, field)[index] for field in FIELDS))
+
+    def tail(self, count):
+        return self[-count:] if count > 0 else self[:0]
+
+    def copy(self):
+        """สำเนาที่ไม่อ้างถึง array เดิม (เก็บ tail ไว้นานโดยไม่ค้างประวัติทั้งก้อนใน memory)"""
+        return Candles(*(getattr(self, field).copy() for field in FIELDS))
+
+    @property
+    def last_time(self):
+        return int(self.time[-1]) if len(self) else None
+
+    def rows(self):
+        """แถว (ts, open, high, low, close, volume) เป็นค่า Python (สำหรับ SQLite/การเรนเดอร์)"""
+        return zip(*(getattr(self, field).tolist() for field in FIELDS))
+
+    def to_records(self):
+        """[{"time", "open", "high", "low", "close", "volume"}, ...] ค่าที่ไม่มี (NaN) เป็น None"""
+        return [
+            {field: (None if isinstance(value, float) and math.isnan(value) else value)
+             for field, value in zip(FIELDS, row)}
+            for row in self.rows()
+        ]
+
+    def to_json(self, digits=10):
+        """JSON แบบ records (เหมือน DataFrame.to_json(orient='records') เดิม แต่มี time และ volume เป็นจำนวนเต็ม)"""
+        records = self.to_records()
+        for record in records:
+            for field in ("open", "high", "low", "close"):
+                if record[field] is not None:
+                    record[field] = round(record[field], digits)
+            if record["volume"] is not None and float(record["volume"]).is_integer():
+                record["volume"] = int(record["volume"])
+        return json.dumps(records, separators=(",", ":"))
+
+def resample(candles, timeframe, offset=0):
+    """
+    รวมแท่ง timeframe เล็กเป็น timeframe ใหญ่ (OHLCV = first / max / min / last / sum) ด้วย reduceat
+    แท่งเริ่มที่ epoch + offset วินาที แล้วแบ่งทุก `timeframe` วินาที ('time' = เวลาเปิดแท่ง UTC)
+    candles ต้องเรียงตามเวลา; ช่วงที่ไม่มีแท่งจะไม่ถูกสร้าง
+    """
+    if not len(candles):
+        return Candles.empty()
+    bucket = (candles.time + offset) // timeframe * timeframe - offset
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    return Candles(
+        bucket[starts],
+        candles.open[starts],
+        np.fmax.reduceat(candles.high, starts),
+        np.fmin.reduceat(candles.low, starts),
+        candles.close[ends],
+        np.add.reduceat(np.nan_to_num(candles.volume), starts),
+    )
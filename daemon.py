@@ -0,0 +1,248 @@
+# daemon.py
+"""
+โหมด daemon: process เดียวที่รันค้างไว้ แทน cron ที่เริ่มจากศูนย์ทุกครั้ง
+- IQDataFetcher เชื่อมต่อค้างไว้ (ConnectionSupervisor เช็คก่อนทุกรอบ หลุดแล้วเชื่อมต่อใหม่), HTTP session และ
+  Chromium (warm_browser) ใช้ซ้ำข้ามรอบ, import numpy/playwright ครั้งเดียว
+- ตารางเวลาภายใน: rundown รายวันตามเวลา ICT + intraday refresh ทุก N นาทีในช่วงเวลาที่กำหนด (ตัวเลือก)
+- GET /health คืนสถานะการเชื่อมต่อ (+ metrics ของ session IQ), รอบล่าสุด (เวลาที่ใช้, pairs/min, error) และเวลารอบถัดไป
+
+รัน: python daemon.py [--run-now] [--pairs-file pairs.txt]
+"""
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+import forex_daily_news as fdn
+from get_data import IQDataFetcher
+from pair_universe import load_pairs
+
+# เวลา rundown รายวัน (ICT) และวันที่รัน (0=จันทร์ ... 6=อาทิตย์ ตามเวลา ICT; cron เดิม 23:00 UTC อา.-พฤ.)
+DAEMON_DAILY_AT = os.getenv("DAEMON_DAILY_AT", "06:00")
+DAEMON_WEEKDAYS = os.getenv("DAEMON_WEEKDAYS", "0-4")
+# intraday refresh ทุกกี่นาที (0 = ปิด) และช่วงเวลา ICT ที่อนุญาต
+DAEMON_INTRADAY_MINUTES = int(os.getenv("DAEMON_INTRADAY_MINUTES", "0"))
+DAEMON_INTRADAY_WINDOW = os.getenv("DAEMON_INTRADAY_WINDOW", "08:00-22:00")
+# พอร์ตของ health endpoint (0 = ปิด)
+DAEMON_HEALTH_PORT = int(os.getenv("DAEMON_HEALTH_PORT", "8080"))
+DAEMON_HEALTH_HOST = os.getenv("DAEMON_HEALTH_HOST", "127.0.0.1")
+
+def now_ict():
+    return datetime.utcnow() + timedelta(hours=7)
+
+def parse_clock(text):
+    hour, minute = text.strip().split(":")
+    return int(hour), int(minute)
+
+def parse_weekdays(text):
+    """"0-4" / "0,2,4" -> {0, 1, 2, 3, 4}"""
+    days = set()
+    for part in text.split(","):
+        start, _, end = part.strip().partition("-")
+        days.update(range(int(start), int(end or start) + 1))
+    return days
+
+class Schedule:
+    """คำนวณเวลารอบถัดไป (datetime ICT แบบ naive เหมือนส่วนอื่นของ repo)"""
+    def __init__(self, daily_at=DAEMON_DAILY_AT, weekdays=DAEMON_WEEKDAYS,
+                 intraday_minutes=DAEMON_INTRADAY_MINUTES, intraday_window=DAEMON_INTRADAY_WINDOW):
+        self.daily_at = parse_clock(daily_at)
+        self.weekdays = parse_weekdays(weekdays)
+        self.intraday_minutes = intraday_minutes
+        start, _, end = intraday_window.partition("-")
+        self.window = (parse_clock(start), parse_clock(end))
+
+    def next_daily(self, after):
+        hour, minute = self.daily_at
+        candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        while candidate.weekday() not in self.weekdays:
+            candidate += timedelta(days=1)
+        return candidate
+
+    def next_intraday(self, after):
+        """ช่วงเวลาเต็มนาทีถัดไปที่หารด้วย intraday_minutes ลงตัว ภายใน window ของวันทำการ"""
+        if self.intraday_minutes <= 0:
+            return None
+        step = timedelta(minutes=self.intraday_minutes)
+        day_start = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        candidate = day_start + step * ((after - day_start) // step + 1)
+        for _ in range(8 * 24 * 60 // self.intraday_minutes + 1):
+            (sh, sm), (eh, em) = self.window
+            start = candidate.replace(hour=sh, minute=sm, second=0, microsecond=0)
+            end = candidate.replace(hour=eh, minute=em, second=0, microsecond=0)
+            if candidate.weekday() in self.weekdays and start <= candidate <= end:
+                return candidate
+            candidate += step
+        return None
+
+    def next_run(self, after):
+        """(datetime, "daily"|"intraday") ของรอบถัดไป; rundown รายวันชนะถ้าเวลาตรงกัน"""
+        daily = self.next_daily(after)
+        intraday = self.next_intraday(after)
+        if intraday is not None and intraday < daily:
+            return intraday, "intraday"
+        return daily, "daily"
+
+class DaemonState:
+    """สถานะที่ health endpoint อ่าน (อัปเดตจาก thread หลักภายใต้ lock)"""
+    def __init__(self):
+        self.started_at = now_ict()
+        self.connected = False
+        self.running = None
+        self.next_run = None
+        self.last_run = None
+        self.runs = 0
+        self.failures = 0
+        self.iq = None  # callable -> metrics ของ ConnectionSupervisor
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "status": "ok" if self.connected else "degraded",
+                "connected": self.connected,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "uptime_s": round((now_ict() - self.started_at).total_seconds()),
+                "running": self.running,
+                "next_run": self.next_run,
+                "last_run": self.last_run,
+                "runs": self.runs,
+                "failures": self.failures,
+                "iq": self.iq() if self.iq else None,
+            }
+
+def start_health_server(state, host=DAEMON_HEALTH_HOST, port=DAEMON_HEALTH_PORT):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("/health", ""):
+                self.send_error(404)
+                return
+            snapshot = state.snapshot()
+            body = json.dumps(snapshot).encode("utf-8")
+            self.send_response(200 if snapshot["connected"] else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="daemon-health", daemon=True).start()
+    print(f"🩺 Health endpoint on http://{host}:{server.server_address[1]}/health")
+    return server
+
+class ForexDaemon:
+    def __init__(self, pairs_file=fdn.PAIRS_FILE, schedule=None, state=None):
+        self.pairs_file = pairs_file
+        self.schedule = schedule or Schedule()
+        self.state = state or DaemonState()
+        self.data_fetcher = None
+        self.bot = fdn._new_bot()
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        print("🛑 Stopping daemon after the current run...")
+        self._stop.set()
+
+    def ensure_connected(self):
+        """เชื่อมต่อ IQ Option ครั้งแรก หรือเชื่อมต่อใหม่ถ้า websocket หลุด"""
+        if self.data_fetcher is None:
+            self.data_fetcher = IQDataFetcher()
+            self.state.update(iq=self.data_fetcher.connection_metrics)
+        connected = self.data_fetcher.ensure_connected()
+        self.state.update(connected=connected)
+        return connected
+
+    def run_once(self, kind="daily"):
+        """หนึ่งรอบ: เช็คการเชื่อมต่อ -> ปฏิทิน/macro -> rundown -> รอคิว Telegram"""
+        started_at = now_ict()
+        started = time.perf_counter()
+        self.state.update(running={"kind": kind, "started_at": started_at.isoformat(timespec="seconds")})
+        tracing.TRACER.reset()
+        timer = fdn.StageTimer()
+        record = {"kind": kind, "started_at": started_at.isoformat(timespec="seconds"), "ok": False}
+        try:
+            with timer.track("connect"):
+                connected = self.ensure_connected()
+            if not connected:
+                raise RuntimeError("could not connect to IQ Option")
+            # fetcher อยู่ตลอดอายุ daemon: เก็บสถิติการรอ stream เฉพาะรอบนี้ (ไม่ให้ list โตไม่สิ้นสุด)
+            self.data_fetcher.fetch_waits.clear()
+            pairs = load_pairs(self.pairs_file)
+            # intraday: อัปเดตค่า Actual ของข่าวที่ออกแล้วในแคชปฏิทิน
+            all_events, event_index = fdn.load_events(timer, refresh_actuals=(kind == "intraday"))
+            title = "Daily Analysis Rundown" if kind == "daily" else "Intraday Refresh"
+            rate = fdn.run_rundown(all_events, event_index, pairs, self.data_fetcher, self.bot, timer, title=title)
+            with timer.track("telegram"):
+                fdn.TELEGRAM_OUTBOX.flush()
+            record.update(ok=True, pairs=len(pairs), pairs_per_min=round(rate, 2))
+        except Exception as e:
+            print(f"❌ Daemon run failed: {e}")
+            record["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            seconds = time.perf_counter() - started
+            record["seconds"] = round(seconds, 2)
+            record["stages"] = {stage: round(sum(sec for _, sec in items), 2) for stage, items in timer.records.items()}
+            timer.report(seconds)
+            fdn.GPT_USAGE.report()
+            fdn.GPT_USAGE.calls.clear()
+            tracing.TRACER.write(fdn.TRACE_PATH)
+            self.state.update(running=None, last_run=record, runs=self.state.runs + 1,
+                              failures=self.state.failures + (0 if record["ok"] else 1))
+        return record
+
+    def serve(self, run_now=False):
+        print("😈 Forex daemon starting (warm IQ session, browser and HTTP sessions)...")
+        self.ensure_connected()
+        try:
+            fdn.warm_browser()
+        except Exception as e:
+            # requests tier ยังใช้ได้ และ scrape_forex_factory จะเปิด browser เองถ้าจำเป็น
+            print(f"⚠️ Could not start a warm browser: {e}")
+        if run_now:
+            self.run_once("daily")
+        while not self._stop.is_set():
+            when, kind = self.schedule.next_run(now_ict())
+            self.state.update(next_run={"kind": kind, "at": when.isoformat(timespec="seconds")})
+            print(f"⏰ Next {kind} run at {when:%Y-%m-%d %H:%M} ICT")
+            if self._stop.wait(max(0.0, (when - now_ict()).total_seconds())):
+                break
+            self.run_once(kind)
+        self.close()
+
+    def close(self):
+        fdn.close_browser()
+        fdn.TELEGRAM_OUTBOX.close()
+        if self.data_fetcher:
+            self.data_fetcher.close_connection()
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running Forex analysis daemon")
+    parser.add_argument("--pairs-file", default=fdn.PAIRS_FILE)
+    parser.add_argument("--run-now", action="store_true", help="run a daily rundown immediately on start")
+    args = parser.parse_args()
+
+    daemon = ForexDaemon(args.pairs_file)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    if DAEMON_HEALTH_PORT:
+        start_health_server(daemon.state)
+    daemon.serve(run_now=args.run_now)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# event_index.py
+"""
+Index ของข่าวเศรษฐกิจที่สร้างครั้งเดียวต่อรอบการรัน:
+แยก bucket ตามสกุลเงิน และเรียงตามเวลา ICT ในแต่ละ bucket
+query แบบ "EUR หรือ USD ภายใน ±90 นาทีจากเวลา T" ใช้ bisect (O(log n) ต่อสกุลเงิน)
+จึงไม่ต้องวนทั้ง list ทุกคู่เงิน
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+def parse_event_time(ev, today):
+    """
+    แปลง Date/Time ของ event (เวลา ICT จาก cookie fftimezone) เป็น datetime
+    คืนค่า None สำหรับ All Day / Tentative / รูปแบบที่อ่านไม่ได้
+    today: วันที่ ICT ปัจจุบัน ใช้เมื่อ event ไม่มี Date และใช้เดาปี
+    """
+    raw_time = (ev.get("Time") or "").strip().lower()
+    try:
+        clock = datetime.strptime(raw_time, "%I:%M%p").time()
+    except ValueError:
+        return None
+
+    day = today
+    raw_date = " ".join((ev.get("Date") or "").split()[-2:])  # "Mon Oct 13" -> "Oct 13"
+    if raw_date:
+        try:
+            parsed = datetime.strptime(f"{raw_date} {today.year}", "%b %d %Y").date()
+            # ข้ามปี (เช่น ดูปฏิทินต้นเดือน ม.ค. ตอนปลาย ธ.ค.)
+            if (parsed - today).days > 180:
+                parsed = parsed.replace(year=today.year - 1)
+            elif (today - parsed).days > 180:
+                parsed = parsed.replace(year=today.year + 1)
+            day = parsed
+        except ValueError:
+            pass
+    return datetime.combine(day, clock)
+
+class EventIndex:
+    """
+    events: list ของ event จาก calendar_parser.parse_calendar_html (คีย์ Time, Currency, Impact, Event, ...)
+    """
+    def __init__(self, events, today=None):
+        self.events = list(events or [])
+        self.today = today or (datetime.utcnow() + timedelta(hours=7)).date()
+        self._times = defaultdict(list)    # ccy -> [datetime] เรียงแล้ว (ใช้ bisect)
+        self._timed = defaultdict(list)    # ccy -> [event] เรียงตาม _times
+        self._untimed = defaultdict(list)  # ccy -> [event] (All Day / Tentative)
+
+        keyed = []
+        for order, ev in enumerate(self.events):
+            ccy = ev.get("Currency")
+            if not ccy or not ev.get("Event"):
+                continue
+            when = parse_event_time(ev, self.today)
+            if when is None:
+                self._untimed[ccy].append(ev)
+            else:
+                keyed.append((ccy, when, order, ev))
+        for ccy, when, _, ev in sorted(keyed, key=lambda item: (item[0], item[1], item[2])):
+            self._times[ccy].append(when)
+            self._timed[ccy].append(ev)
+
+    def __len__(self):
+        return len(self.events)
+
+    def counts(self):
+        """จำนวน event ต่อสกุลเงิน (ไม่ต้องวนทุก event)"""
+        return {ccy: len(self._timed[ccy]) + len(self._untimed[ccy]) for ccy in set(self._timed) | set(self._untimed)}
+
+    def for_currencies(self, currencies, include_untimed=True):
+        """events ของสกุลเงินที่ระบุ เรียงตามเวลา (All Day/Tentative ต่อท้าย)"""
+        streams = [zip(self._times.get(c, []), self._timed.get(c, [])) for c in set(currencies)]
+        merged = [ev for _, ev in heapq.merge(*streams, key=lambda item: item[0])]
+        if include_untimed:
+            for ccy in sorted(set(currencies)):
+                merged.extend(self._untimed.get(ccy, []))
+        return merged
+
+    def window(self, currencies, center, minutes=90, include_untimed=False):
+        """events ของสกุลเงินที่ระบุภายใน ±minutes นาทีจาก center (datetime ICT)"""
+        lo, hi = center - timedelta(minutes=minutes), center + timedelta(minutes=minutes)
+        streams = []
+        for ccy in set(currencies):
+            times = self._times.get(ccy, [])
+            start, end = bisect_left(times, lo), bisect_right(times, hi)
+            streams.append(zip(times[start:end], self._timed.get(ccy, [])[start:end]))
+        found = [ev for _, ev in heapq.merge(*streams, key=lambda item: item[0])]
+        if include_untimed:
+            for ccy in sorted(set(currencies)):
+                found.extend(self._untimed.get(ccy, []))
+        return found
@@ -1,7 +1,6 @@
 # forex_daily_news.py
 # ========== Import Libraries ==========
 from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
 import requests
 import time
 from datetime import datetime, timedelta
@@ -9,106 +8,274 @@ from dotenv import load_dotenv
 from openai import OpenAI
 import os
 import json
+import threading
+from collections import defaultdict
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
 
 from get_data import IQDataFetcher
+from calendar_cache import CalendarCache
+from calendar_parser import parse_calendar_html
+from event_index import EventIndex
+from llm_cache import ResponseCache, cache_key
+from llm_clients import AsyncLLMClient, UsageReport, usage_numbers
+from pair_universe import load_pairs, split_shards, parse_shard, save_shard_results, load_shard_results
+from prompt_compiler import compile_user_prompt, estimate_tokens
+import tracing
 from tele_signals import TyphoonForexAnalyzer, TelegramNotifier, ForexBot
+from telegram_outbox import TelegramOutbox
 
 load_dotenv()
 
 # ========== Forex Factory Scrapers ==========
+FF_URL = "https://www.forexfactory.com/"
+FF_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+# เวลารอ (ms) ให้ตารางปฏิทินปรากฏใน Playwright แทนการรอตายตัว 10 วินาที
+FF_SELECTOR_TIMEOUT_MS = int(os.getenv("FF_SELECTOR_TIMEOUT_MS", "20000"))
+# ไม่โหลด resource ที่ไม่จำเป็นต่อการอ่านตาราง
+FF_BLOCKED_RESOURCES = {"image", "font", "media"}
+FF_BLOCKED_HOSTS = ("doubleclick.net", "googlesyndication.com", "google-analytics.com",
+                    "googletagmanager.com", "adservice.google.com", "amazon-adsystem.com")
+# session แบบ keep-alive สำหรับ requests tier (ใช้ซ้ำข้ามรอบในโหมด daemon)
+FF_SESSION = requests.Session()
+
+# tier ที่ดึงปฏิทินสำเร็จล่าสุดและเวลาที่ใช้ (สำหรับ log/รายงาน) + validator จาก requests tier
+CALENDAR_SCRAPE_INFO = {"tier": "", "seconds": 0.0, "events": 0, "status": None, "etag": None, "last_modified": None}
+
+# แคชปฏิทินรายวัน (ICT) บนดิสก์: ข้ามการ scrape เมื่อรันซ้ำในวันเดียวกัน
+CALENDAR_CACHE_DIR = os.getenv("CALENDAR_CACHE_DIR", os.path.join(".cache", "calendar"))
+CALENDAR_CACHE_TTL = int(os.getenv("CALENDAR_CACHE_TTL", "21600"))  # วินาที (6 ชม.)
+# 1 = ดึงหน้าเว็บใหม่ (requests tier เท่านั้น) เพื่ออัปเดตเฉพาะคอลัมน์ Actual ของแคช
+CALENDAR_REFRESH_ACTUALS = os.getenv("CALENDAR_REFRESH_ACTUALS", "0") == "1"
+
+def _block_heavy_resources(route):
+    """Playwright route handler: ตัดรูป/ฟอนต์/มีเดีย/โฆษณา"""
+    request = route.request
+    if request.resource_type in FF_BLOCKED_RESOURCES or any(h in request.url for h in FF_BLOCKED_HOSTS):
+        return route.abort()
+    return route.continue_()
+
+def scrape_calendar():
+    """
+    Tiered scraper: ลอง requests (เร็ว ~1 วินาที) ก่อน ถ้าไม่ได้ค่อยใช้ Playwright
+    บันทึก tier ที่สำเร็จและเวลาที่ใช้ไว้ใน CALENDAR_SCRAPE_INFO
+    """
+    for tier, scraper in (("requests", scrape_forex_factory_requests), ("playwright", scrape_forex_factory)):
+        started = time.perf_counter()
+        events = scraper()
+        elapsed = time.perf_counter() - started
+        print(f"⏱️ Calendar tier '{tier}' took {elapsed:.2f}s ({len(events)} events)")
+        if events:
+            CALENDAR_SCRAPE_INFO.update({"tier": tier, "seconds": elapsed, "events": len(events)})
+            return events
+    CALENDAR_SCRAPE_INFO.update({"tier": "none", "seconds": 0.0, "events": 0})
+    return []
+
+# Playwright browser ที่เปิดค้างไว้ข้ามรอบ (โหมด daemon: warm_browser); ว่าง = เปิด/ปิดใหม่ทุกครั้ง
+_WARM_BROWSER = {"playwright": None, "browser": None}
+# งาน Playwright ทั้งหมดรันบน thread เฉพาะตัวเดียว: sync API ตั้ง event loop ของตัวเองเป็น running loop
+# ของ thread ที่เรียก ถ้าค้างไว้บน main thread (daemon) asyncio.run ของ LLM stage จะพัง
+_PLAYWRIGHT_EXECUTOR = None
+_PLAYWRIGHT_LOCK = threading.Lock()
+
+def _on_playwright_thread(fn, *args):
+    """เรียก fn บน thread ของ Playwright แล้วรอผล (คง context ของ tracing เพื่อให้ span ซ้อนถูกที่)"""
+    global _PLAYWRIGHT_EXECUTOR
+    with _PLAYWRIGHT_LOCK:
+        if _PLAYWRIGHT_EXECUTOR is None:
+            _PLAYWRIGHT_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playwright")
+        executor = _PLAYWRIGHT_EXECUTOR
+    return executor.submit(contextvars.copy_context().run, fn, *args).result()
+
+def _launch_browser(p):
+    return p.chromium.launch(
+        headless=True,
+        args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+    )
+
+def warm_browser():
+    """เปิด Chromium ค้างไว้ (บน thread ของ Playwright) ให้ scrape_forex_factory ใช้ซ้ำ"""
+    return _on_playwright_thread(_warm_browser)
+
+def _warm_browser():
+    if _WARM_BROWSER["browser"] is None or not _WARM_BROWSER["browser"].is_connected():
+        _close_browser()
+        playwright = sync_playwright().start()
+        try:
+            browser = _launch_browser(playwright)
+        except Exception:
+            playwright.stop()
+            raise
+        _WARM_BROWSER.update(playwright=playwright, browser=browser)
+    return _WARM_BROWSER["browser"]
+
+def close_browser():
+    global _PLAYWRIGHT_EXECUTOR
+    if _PLAYWRIGHT_EXECUTOR is None:
+        return
+    try:
+        _on_playwright_thread(_close_browser)
+    finally:
+        _PLAYWRIGHT_EXECUTOR.shutdown()
+        _PLAYWRIGHT_EXECUTOR = None
+
+def _close_browser():
+    browser, playwright = _WARM_BROWSER["browser"], _WARM_BROWSER["playwright"]
+    _WARM_BROWSER.update(playwright=None, browser=None)
+    try:
+        if browser is not None:
+            browser.close()
+    finally:
+        if playwright is not None:
+            playwright.stop()
+
 def scrape_forex_factory():
     """Scrape ForexFactory using Playwright - GitHub Actions optimized"""
-    
+    return _on_playwright_thread(_scrape_forex_factory)
+
+def _scrape_forex_factory():
+    browser = _WARM_BROWSER["browser"]
+    if browser is not None and browser.is_connected():
+        return _scrape_with_browser(browser)
+
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-        )
-        context = browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        page = context.new_page()
-
-        # ตั้งค่า Timezone ก่อนเข้าเว็บ
-        context.add_cookies([{'name': 'fftimezone', 'value': 'Asia%2FNovosibirsk', 'domain': '.forexfactory.com', 'path': '/'}])
+        browser = _launch_browser(p)
+        try:
+            return _scrape_with_browser(browser)
+        finally:
+            browser.close()
 
+def _scrape_with_browser(browser):
+    context = browser.new_context(user_agent=FF_USER_AGENT)
+    context.route("**/*", _block_heavy_resources)
+    page = context.new_page()
+
+    # ตั้งค่า Timezone ก่อนเข้าเว็บ
+    context.add_cookies([{'name': 'fftimezone', 'value': 'Asia%2FNovosibirsk', 'domain': '.forexfactory.com', 'path': '/'}])
+
+    with tracing.span("calendar.playwright") as sp:
         try:
             print("🔄 Loading ForexFactory with Playwright...")
-            page.goto("https://www.forexfactory.com/", wait_until="domcontentloaded", timeout=60000)
-            page.wait_for_timeout(10000) # รอให้หน้าเว็บโหลดสมบูรณ์
-
-            html_content = page.content()
-            soup = BeautifulSoup(html_content, 'lxml')
-            
-            table = soup.select_one("table.calendar__table")
-            if not table:
+            page.goto(FF_URL, wait_until="domcontentloaded", timeout=60000)
+            # รอจนตารางปฏิทินมีแถวข้อมูล (แทนการรอตายตัว)
+            page.wait_for_selector("table.calendar__table tr.calendar__row", timeout=FF_SELECTOR_TIMEOUT_MS)
+
+            html = page.content()
+            extracted = parse_calendar_html(html)
+            sp.set(bytes=len(html.encode("utf-8")), events=len(extracted))
+            if not extracted:
                 print("❌ Calendar table not found in Playwright HTML")
                 return []
 
-            rows = table.select("tr.calendar__row")
-            extracted = []
-            keys = ["Time", "Currency", "Impact", "Event", "Actual", "Forecast", "Previous"]
-
-            for row in rows:
-                cells = row.find_all('td')
-                if len(cells) < 6: continue
-                
-                # ดึงข้อมูลจากแต่ละ cell
-                row_data = [cell.get_text(strip=True) for cell in cells]
-                
-                # จัดการกับข้อมูลที่ไม่สมบูรณ์
-                full_row_data = row_data[:7] + [""] * (7 - len(row_data))
-
-                if not full_row_data[0] or full_row_data[0].lower() in ['all day', 'time', '']: continue
-                if not any(full_row_data[1:4]): continue
-                
-                extracted.append(dict(zip(keys, full_row_data)))
-
             print(f"✅ Playwright extracted {len(extracted)} events!")
             return extracted
 
         except Exception as e:
+            sp.set(error=f"{type(e).__name__}: {e}")
             print(f"❌ Error during Playwright scraping: {e}")
             return []
         finally:
-            browser.close()
+            context.close()
 
-def scrape_forex_factory_requests():
-    """Fallback scraper using requests + BeautifulSoup"""
-    print("🔄 Trying fallback scraper with requests...")
-    headers = {'User-Agent': 'Mozilla/50 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'}
+def scrape_forex_factory_requests(extra_headers=None):
+    """
+    Lightweight scraper using requests + lxml (first tier of scrape_calendar)
+    extra_headers: เช่น If-None-Match / If-Modified-Since สำหรับ revalidate แคช (304 -> คืน [])
+    """
+    print("🔄 Trying lightweight scraper with requests...")
+    headers = {'User-Agent': FF_USER_AGENT, 'Accept-Language': 'en-US,en;q=0.9'}
+    headers.update(extra_headers or {})
     cookies = {'fftimezone': 'Asia%2FNovosibirsk'}
-    try:
-        response = requests.get('https://www.forexfactory.com/', headers=headers, cookies=cookies, timeout=20)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        table = soup.select_one("table.calendar__table")
-        if not table:
-            print("❌ Calendar table not found in requests HTML")
+    with tracing.span("calendar.requests", conditional=bool(extra_headers)) as sp:
+        try:
+            response = FF_SESSION.get(FF_URL, headers=headers, cookies=cookies, timeout=20)
+            sp.set(status=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+            CALENDAR_SCRAPE_INFO.update({
+                "status": response.status_code,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            })
+            if response.status_code == 304:
+                print("✅ Calendar not modified (304).")
+                return []
+            extracted = parse_calendar_html(response.text)
+            sp.set(events=len(extracted))
+            if not extracted:
+                print("❌ Calendar table not found in requests HTML")
+                return []
+
+            print(f"✅ Requests method extracted {len(extracted)} events!")
+            return extracted
+        except Exception as e:
+            sp.set(error=f"{type(e).__name__}: {e}")
+            print(f"❌ Requests method failed: {e}")
             return []
-        
-        rows = table.select("tr.calendar__row")
-        extracted = []
-        keys = ["Time", "Currency", "Impact", "Event", "Actual", "Forecast", "Previous"]
-
-        for row in rows:
-            cells = row.find_all('td')
-            if len(cells) < 6: continue
-            
-            row_data = [cell.get_text(strip=True) for cell in cells]
-            full_row_data = row_data[:7] + [""] * (7 - len(row_data))
-            
-            if not full_row_data[0] or full_row_data[0].lower() in ['all day', 'time', '']: continue
-            if not any(full_row_data[1:4]): continue
-            
-            extracted.append(dict(zip(keys, full_row_data)))
-
-        print(f"✅ Requests method extracted {len(extracted)} events!")
-        return extracted
-    except Exception as e:
-        print(f"❌ Requests method failed: {e}")
-        return []
+
+def _merge_actuals(cached_events, fresh_events):
+    """อัปเดตเฉพาะคอลัมน์ Actual ของ events ในแคช โดยจับคู่ด้วย (Time, Currency, Event)"""
+    fresh = {(ev["Time"], ev["Currency"], ev["Event"]): ev.get("Actual", "") for ev in fresh_events}
+    updated = 0
+    for ev in cached_events:
+        actual = fresh.get((ev["Time"], ev["Currency"], ev["Event"]))
+        if actual and actual != ev.get("Actual"):
+            ev["Actual"] = actual
+            updated += 1
+    return updated
+
+def load_calendar(cache=None, refresh_actuals=CALENDAR_REFRESH_ACTUALS):
+    """
+    คืนค่า events ของวันนี้ (ICT) โดยใช้แคชรายวัน (parse_calendar_html ให้คอลัมน์ถูกต้องแล้ว จึงใช้ผลได้ตรง ๆ):
+    - แคชยังไม่หมดอายุ -> ใช้เลย (ถ้า refresh_actuals ให้อัปเดตเฉพาะ Actual ผ่าน requests tier)
+    - แคชหมดอายุแต่มี ETag/Last-Modified -> revalidate แบบมีเงื่อนไข (304 = ใช้ของเดิม)
+    - ไม่มีแคช/เปลี่ยนแปลง -> scrape_calendar() แล้วบันทึก
+    """
+    cache = cache or CalendarCache(CALENDAR_CACHE_DIR, CALENDAR_CACHE_TTL)
+    day = (datetime.utcnow() + timedelta(hours=7)).strftime("%Y-%m-%d")
+    entry = cache.load(day)
+
+    if cache.is_fresh(entry):
+        events = entry["events"]
+        if refresh_actuals:
+            fresh = scrape_forex_factory_requests()
+            updated = _merge_actuals(events, fresh)
+            cache.save(day, events, entry.get("etag"), entry.get("last_modified"))
+            print(f"🔁 Refreshed Actual values for {updated} cached events.")
+        CALENDAR_SCRAPE_INFO.update({"tier": "cache", "seconds": 0.0, "events": len(events)})
+        print(f"📦 Using cached calendar for {day} ({len(events)} events).")
+        return events
+
+    if entry and (entry.get("etag") or entry.get("last_modified")):
+        conditional = {}
+        if entry.get("etag"):
+            conditional["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            conditional["If-Modified-Since"] = entry["last_modified"]
+        started = time.perf_counter()
+        events = scrape_forex_factory_requests(conditional)
+        if CALENDAR_SCRAPE_INFO.get("status") == 304:
+            cache.touch(day, entry)
+            CALENDAR_SCRAPE_INFO.update({"tier": "revalidated", "seconds": time.perf_counter() - started,
+                                         "events": len(entry["events"])})
+            return entry["events"]
+        if events:
+            cache.save(day, events, CALENDAR_SCRAPE_INFO.get("etag"), CALENDAR_SCRAPE_INFO.get("last_modified"))
+            CALENDAR_SCRAPE_INFO.update({"tier": "requests", "seconds": time.perf_counter() - started,
+                                         "events": len(events)})
+            return events
+
+    CALENDAR_SCRAPE_INFO.update({"etag": None, "last_modified": None})
+    events = scrape_calendar()
+    if events:
+        # validator มีเฉพาะเมื่อ requests tier สำเร็จ
+        validators = (CALENDAR_SCRAPE_INFO.get("etag"), CALENDAR_SCRAPE_INFO.get("last_modified")) \
+            if CALENDAR_SCRAPE_INFO.get("tier") == "requests" else (None, None)
+        cache.save(day, events, *validators)
+    return events
 
 # ========== GPT AI and Telegram Functions ==========
 # Config
@@ -119,6 +286,13 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 SIGNAL_TOKEN = os.getenv("SIGNAL_BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 
+# แคชคำตอบ LLM (GPT + Typhoon) แบบ content-addressed: รันซ้ำด้วย input เดิมไม่ต้องเรียก API ใหม่
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))          # วินาที
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+LLM_CACHE = ResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, bypass=LLM_CACHE_BYPASS)
+
 # ตั้งค่า Gemini
 
 GLOBAL_MACRO = {
@@ -283,58 +457,6 @@ def _parse_kv_baseline(text: str) -> dict:
         "macro_notes":       out.get("NOTES", "")[:120],
     }
 
-# ---- Helpers to fix misaligned ForexFactory rows (no scraping changes) ----
-_CCY = {"USD","EUR","GBP","JPY","AUD","NZD","CAD","CHF","CNY","CNH","SEK","NOK"}
-
-def _is_time_token(s: str) -> bool:
-    if not s: return False
-    s = s.strip().lower()
-    if s in {"tentative","all day","all-day"}: return True
-    import re
-    return bool(re.match(r"^\d{1,2}:\d{2}(am|pm)$", s))
-
-def _pick_currency(ev: dict) -> str:
-    for k in ("Currency","Impact","Event"):
-        v = (ev.get(k) or "").strip().upper()
-        if v in _CCY: return v
-    return ""
-
-def _pick_time(ev: dict) -> str:
-    for k in ("Time","Currency","Event","Actual","Forecast"):
-        v = (ev.get(k) or "").strip()
-        if _is_time_token(v): return v
-    return "Tentative"
-
-def _pick_event_name(ev: dict) -> str:
-    for k in ("Event","Actual","Forecast"):
-        v = (ev.get(k) or "").strip()
-        if v and v.upper() not in _CCY and len(v) >= 3:
-            return v
-    return ""
-
-def _pick_impact_label(ev: dict) -> str:
-    v = (ev.get("Impact") or "").strip().title()
-    if v.upper() in _CCY: return ""
-    return v
-
-def _normalize_ff_events(events: list) -> list:
-    """Heuristically repair misaligned rows from ForexFactory without changing the scraper."""
-    fixed = []
-    for ev in (events or []):
-        cur  = _pick_currency(ev)
-        tim  = _pick_time(ev)
-        name = _pick_event_name(ev)
-        imp  = _pick_impact_label(ev)
-        act  = (ev.get("Actual") or "").strip()
-        fcs  = (ev.get("Forecast") or "").strip()
-        prv  = (ev.get("Previous") or "").strip()
-        if cur and name:
-            fixed.append({
-                "Time": tim, "Currency": cur, "Impact": imp, "Event": name,
-                "Actual": act, "Forecast": fcs, "Previous": prv
-            })
-    return fixed
-
 def _safe_clip(s: str, limit: int = 120) -> str:
     """
     Clip string to <= limit chars without cutting in the middle of a phrase.
@@ -390,7 +512,7 @@ def _summarize_events_for_notes(norm_events: list, max_len: int = 120) -> str:
     note = " | ".join(parts)
     return (note[:max_len]) if len(note) > max_len else note
 
-def _heuristic_macro_baseline(norm_events: list) -> dict:
+def _heuristic_macro_baseline(norm_events: list, counts: dict = None) -> dict:
     """
     Heuristic baseline with zero API dependency.
     - usd_stance: Mixed by default; bump to Strong/Weak if USD dominates by >=2 vs next-best
@@ -399,7 +521,7 @@ def _heuristic_macro_baseline(norm_events: list) -> dict:
     - notes: concise windows; clipped safely to 120 chars
     """
     from collections import Counter
-    counts = Counter(ev["Currency"] for ev in norm_events)
+    counts = Counter(counts) if counts is not None else Counter(ev["Currency"] for ev in norm_events)
     top = counts.most_common(2) + [("NA", 0)]
     usd_stance = "Mixed"
     if top and top[0][0] == "USD" and top[0][1] >= top[1][1] + 2:
@@ -425,18 +547,22 @@ def _heuristic_macro_baseline(norm_events: list) -> dict:
         "macro_notes": notes
     }
 
-def set_global_macro_from_events(all_events: list) -> None:
+def build_event_index(all_events: list) -> EventIndex:
+    """Index the parsed calendar once per run by currency / ICT time."""
+    return EventIndex(all_events)
+
+def set_global_macro_from_events(event_index: EventIndex) -> None:
     """
     Build a once-per-day Global Macro Baseline and store in GLOBAL_MACRO.
-    - Normalize events (fix misaligned columns)
+    - Reads the events from the per-run EventIndex
     - If USE_AI_BASELINE=True, try AI; else use heuristics (zero-cost, robust)
     """
-    norm_events = _normalize_ff_events(all_events)
+    norm_events = event_index.events
     cal_block = _compact_calendar_lines(norm_events)
-    print(f"📅 Compacted calendar lines (normalized):\n{cal_block}\n")
+    print(f"📅 Compacted calendar lines:\n{cal_block}\n")
 
     # Always ensure we have a baseline (AI path is optional)
-    baseline = _heuristic_macro_baseline(norm_events)
+    baseline = _heuristic_macro_baseline(norm_events, event_index.counts())
 
     if USE_AI_BASELINE:
         try:
@@ -492,7 +618,31 @@ NOTES=<<=120 chars; mention CB divergence or event windows; no commas at the end
     print("🧭 Global Macro Baseline set:", GLOBAL_MACRO)
 
 # ---------- 2) Prompt assembly (inject GLOBAL_MACRO as a visible header) ----------
+# 1 = ใช้ prompt_compiler (ย่อแต่ละ section ตามงบ token); 0 = prompt แบบเดิม (ค่าเริ่มต้น)
+PROMPT_COMPACT = os.getenv("PROMPT_COMPACT", "0") == "1"
+# มีผลเมื่อ PROMPT_COMPACT=1: legacy = macro -> template เดิม (ค่าเริ่มต้น)
+# cache = ส่วนคงที่ -> macro ที่ใช้ร่วมทั้งรอบ -> ข้อมูลรายคู่ (prefix ร่วมยาวสุดสำหรับ prompt caching)
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "legacy")
+# pair -> (tokens แบบเดิม, tokens หลังย่อ) สำหรับรายงานท้ายรอบ
+PROMPT_TOKEN_REPORT = {}
+
 def format_user_prompt(ctx: dict) -> str:
+    """
+    Build the GPT user prompt for one pair. With PROMPT_COMPACT the sections are
+    compacted to their token budgets; estimated input tokens before/after are
+    printed and kept in PROMPT_TOKEN_REPORT.
+    """
+    legacy = _format_user_prompt_legacy(ctx)
+    if not PROMPT_COMPACT:
+        return legacy
+    prompt, sections = compile_user_prompt(ctx, GLOBAL_MACRO, USER_PROMPT_TEMPLATE, layout=PROMPT_LAYOUT)
+    before, after = estimate_tokens(legacy), sections["total"]
+    PROMPT_TOKEN_REPORT[ctx["pair"]] = (before, after)
+    print(f"🧮 {ctx['pair']} prompt tokens (est.): {before} -> {after} "
+          f"({(after - before) / before:+.0%}) sections={sections}")
+    return prompt
+
+def _format_user_prompt_legacy(ctx: dict) -> str:
     """
     ctx must contain keys required by USER_PROMPT_TEMPLATE:
       pair, date, news_data,
@@ -503,6 +653,7 @@ def format_user_prompt(ctx: dict) -> str:
       daily_pivot_pp, daily_pivot_r1, daily_pivot_r2, daily_pivot_r3,
       daily_pivot_s1, daily_pivot_s2, daily_pivot_s3,
       current_time
+    The *_ohlc values are Candles; they are rendered to JSON records only here.
     We prepend a small GLOBAL MACRO BASELINE block to the template to guide cross-pair coherence.
     """
     macro_block = (
@@ -517,11 +668,11 @@ def format_user_prompt(ctx: dict) -> str:
     )
     core = USER_PROMPT_TEMPLATE.format(
         pair=ctx["pair"], date=ctx["date"], news_data=ctx["news_data"],
-        h1_ohlc=ctx["h1_ohlc"], h1_ema20=ctx["h1_ema20"], h1_ema50=ctx["h1_ema50"],
+        h1_ohlc=ctx["h1_ohlc"].to_json(), h1_ema20=ctx["h1_ema20"], h1_ema50=ctx["h1_ema50"],
         h1_rsi=ctx["h1_rsi"], h1_macd=ctx["h1_macd"], h1_macdh=ctx["h1_macdh"], h1_macds=ctx["h1_macds"],
-        m15_ohlc=ctx["m15_ohlc"], m15_ema20=ctx["m15_ema20"], m15_ema50=ctx["m15_ema50"],
+        m15_ohlc=ctx["m15_ohlc"].to_json(), m15_ema20=ctx["m15_ema20"], m15_ema50=ctx["m15_ema50"],
         m15_rsi=ctx["m15_rsi"], m15_macd=ctx["m15_macd"], m15_macdh=ctx["m15_macdh"], m15_macds=ctx["m15_macds"],
-        h4_ohlc=ctx["h4_ohlc"], h4_ema20=ctx["h4_ema20"], h4_ema50=ctx["h4_ema50"],
+        h4_ohlc=ctx["h4_ohlc"].to_json(), h4_ema20=ctx["h4_ema20"], h4_ema50=ctx["h4_ema50"],
         h4_rsi=ctx["h4_rsi"], h4_macd=ctx["h4_macd"], h4_macdh=ctx["h4_macdh"], h4_macds=ctx["h4_macds"],
         prev_day_high=ctx["prev_day_high"], prev_day_low=ctx["prev_day_low"], prev_day_close=ctx["prev_day_close"],
         daily_pivot_pp=ctx["daily_pivot_pp"], daily_pivot_r1=ctx["daily_pivot_r1"], daily_pivot_r2=ctx["daily_pivot_r2"], daily_pivot_r3=ctx["daily_pivot_r3"],
@@ -531,53 +682,111 @@ def format_user_prompt(ctx: dict) -> str:
     return macro_block + core
 
 # ---------- 3) GPT-5-mini caller (reasoning model) ----------
-def call_gpt_api(user_prompt: str) -> str:
+GPT_PARAMS = {
+    "model": "gpt-5-mini",
+    "text": {"verbosity": "medium"},
+    "reasoning": {"effort": "minimal"},
+    "max_output_tokens": 1200,
+}
+GPT_ERROR_TEXT = "Error: Could not get analysis from GPT-5-mini."
+# ช่วยให้ request ที่มี prefix เดียวกันถูกส่งไปเครื่องที่มีแคชอยู่ (ไม่รวมใน key ของ LLM_CACHE)
+GPT_PROMPT_CACHE_KEY = os.getenv("GPT_PROMPT_CACHE_KEY", "forex-daily-news")
+# usage ต่อ call (input/cached/output tokens + เวลา) สำหรับรายงานท้ายรอบ
+GPT_USAGE = UsageReport()
+
+def _gpt_cache_key(user_prompt):
+    # ตัดบรรทัด "Current Time" ออกจาก key เพื่อให้การรันซ้ำด้วยข้อมูลเดิมใช้แคชได้ (prompt จริงไม่เปลี่ยน)
+    key_input = "\n".join(l for l in user_prompt.splitlines() if not l.startswith("Current Time (ICT):"))
+    return cache_key(instructions=SYSTEM_PROMPT, input=key_input, **GPT_PARAMS)
+
+def call_gpt_api(user_prompt: str, label: str = "gpt") -> str:
     """
     Use GPT-5-mini for intraday analysis.
     - Responses API
     - No 'temperature' for reasoning models
     - Use text.verbosity and reasoning.effort
     """
-    try:
-        resp = client.responses.create(
-            model="gpt-5-mini",
-            instructions=SYSTEM_PROMPT,   # keep static for prompt caching
-            input=user_prompt,
-            text={"verbosity": "medium"},
-            reasoning={"effort": "minimal"},
-            max_output_tokens=1200
-        )
-        return resp.output_text
-    except Exception as e:
-        print(f"❌ OpenAI API call failed: {e}")
-        return "Error: Could not get analysis from GPT-5-mini."
+    with tracing.span("gpt", pair=label) as sp:
+        key = _gpt_cache_key(user_prompt)
+        cached = LLM_CACHE.get(key)
+        if cached is not None:
+            sp.set(cache="hit")
+            print("📦 GPT response served from cache.")
+            return cached
 
-def analyze_and_send(all_events, pair, data_fetcher, bot):
-    """Analyzes a specific pair using news and technical data, then sends it."""
-    print(f"\n===== Analyzing: {pair} =====")
+        try:
+            started = time.perf_counter()
+            resp = client.responses.create(
+                instructions=SYSTEM_PROMPT,   # keep static for prompt caching
+                input=user_prompt,
+                prompt_cache_key=GPT_PROMPT_CACHE_KEY,
+                **GPT_PARAMS
+            )
+            GPT_USAGE.record(label, resp, time.perf_counter() - started)
+            input_tokens, cached_tokens, output_tokens = usage_numbers(resp)
+            sp.set(input_tokens=input_tokens, cached_tokens=cached_tokens, output_tokens=output_tokens)
+            LLM_CACHE.set(key, resp.output_text)
+            return resp.output_text
+        except Exception as e:
+            sp.set(error=f"{type(e).__name__}: {e}")
+            print(f"❌ OpenAI API call failed: {e}")
+            return GPT_ERROR_TEXT
+
+async def call_gpt_api_async(user_prompt: str, llm, label: str = "gpt") -> str:
+    """call_gpt_api เวอร์ชัน async ผ่าน AsyncLLMClient (จำกัด in-flight + retry/backoff)"""
+    with tracing.span("gpt", pair=label) as sp:
+        key = _gpt_cache_key(user_prompt)
+        cached = LLM_CACHE.get(key)
+        if cached is not None:
+            sp.set(cache="hit")
+            print("📦 GPT response served from cache.")
+            return cached
 
-    # Normalize events before filtering by pair currencies
-    norm_events = _normalize_ff_events(all_events)
+        try:
+            started = time.perf_counter()
+            # tokens และ retries ถูกบันทึกลง span โดย AsyncLLMClient
+            resp = await llm.responses(instructions=SYSTEM_PROMPT, input=user_prompt,
+                                       prompt_cache_key=GPT_PROMPT_CACHE_KEY, **GPT_PARAMS)
+            GPT_USAGE.record(label, resp, time.perf_counter() - started)
+            LLM_CACHE.set(key, resp.output_text)
+            return resp.output_text
+        except Exception as e:
+            sp.set(error=f"{type(e).__name__}: {e}")
+            print(f"❌ OpenAI API call failed: {e}")
+            return GPT_ERROR_TEXT
+
+# ข่าวภายใน ±N นาทีจากเวลาปัจจุบันถูกเก็บไว้ก่อนเมื่อ prompt แบบย่อต้องตัดข่าวให้อยู่ในงบ
+NEWS_WINDOW_MINUTES = int(os.getenv("NEWS_WINDOW_MINUTES", "90"))
+
+def build_pair_context(event_index, pair, data_fetcher, tech=None):
+    """
+    Collect news + technicals for one pair and map them into the prompt ctx.
+    `tech` may be pre-fetched (e.g. from get_technical_data_batch).
+    Returns None when technical data could not be fetched.
+    """
+    # Events are indexed once per run; the index returns this pair's currencies in ICT time order
     currencies = pair.split('/')
-    relevant_news = [ev for ev in norm_events if ev.get('Currency') in currencies and ev.get('Event')]
+    relevant_news = event_index.for_currencies(currencies)
     news_data_str = json.dumps(relevant_news, indent=2) if relevant_news else \
                     "No relevant news scheduled for this pair today."
+    now_ict = datetime.utcnow() + timedelta(hours=7)
+    near_news = event_index.window(currencies, now_ict, NEWS_WINDOW_MINUTES)
 
-    print(f"📰 Relevant news (normalized) for {pair}: {len(relevant_news)} items")
+    print(f"📰 Relevant news for {pair}: {len(relevant_news)} items "
+          f"({len(near_news)} within ±{NEWS_WINDOW_MINUTES} min)")
 
-    # Technicals unchanged...
-    print(f"⚙️ Fetching REAL technical data for {pair}...")
-    tech = data_fetcher.get_technical_data(pair)
+    if tech is None:
+        print(f"⚙️ Fetching REAL technical data for {pair}...")
+        tech = data_fetcher.get_technical_data(pair)
     if not tech:
-        send_telegram_message(f"⚠️ Could not fetch comprehensive technical data for *{pair}*. Skipping analysis.")
-        return
+        return None
 
-    now_ict = datetime.utcnow() + timedelta(hours=7)
-    ctx = {
+    return {
         "pair": pair,
         "date": now_ict.strftime("%Y-%m-%d"),
         "news_data": news_data_str,
-        # ... (keep your existing ctx mapping exactly as before) ...
+        "news_events": relevant_news,
+        "near_events": near_news,
         "h1_ohlc":  tech["h1_ohlc"],  "h1_ema20": tech["h1_ema20"], "h1_ema50": tech["h1_ema50"],
         "h1_rsi":   tech["h1_rsi"],
         "h1_macd":  tech["h1_macd"],  "h1_macdh": tech["h1_macdh"],  "h1_macds": tech["h1_macds"],
@@ -593,62 +802,392 @@ def analyze_and_send(all_events, pair, data_fetcher, bot):
         "current_time": now_ict.strftime("%Y-%m-%d %H:%M:%S ICT"),
     }
 
-    user_prompt = format_user_prompt(ctx)
-    ai_response = call_gpt_api(user_prompt)
-    time.sleep(2)
-    full_message = f"{pair}\n{'-'*20}\n{ai_response}"
-    send_telegram_message(full_message)
-    time.sleep(4)
-    bot.send(ai_response)
-    time.sleep(5)
+def _analyze_pair(event_index, pair, data_fetcher, bot, summarize=True):
+    """Sync worker (PIPELINE_CONCURRENCY=1): context -> GPT -> Typhoon for one pair. Does NOT send anything."""
+    result = {"pair": pair, "ai_response": None, "summary": None, "error": None}
+    print(f"\n===== Analyzing: {pair} =====")
 
-def send_telegram_message(text):
-    """Sends a message to a Telegram chat."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    data = {'chat_id': CHAT_ID, 'text': text, 'parse_mode': 'Markdown'}
-    try:
-        response = requests.post(url, data=data)
-        response.raise_for_status()
-        print(f"📨 Telegram message sent successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Telegram send failed: {e}")
+    ctx = build_pair_context(event_index, pair, data_fetcher)
+    if not ctx:
+        return result
 
-if __name__ == '__main__':
-    print("🚀 Starting Forex Analysis Bot...")
+    result["ai_response"] = call_gpt_api(format_user_prompt(ctx), pair)
+    if summarize and _has_analysis(result):
+        result["summary"] = bot.summarize(result["ai_response"])
+    return result
+
+def analyze_and_send(event_index, pair, data_fetcher, bot):
+    """Analyzes a specific pair using news and technical data, then sends it."""
+    _deliver_pair(_analyze_pair(event_index, pair, data_fetcher, bot), bot)
+
+def analyze_and_send_batched(event_index, pairs, data_fetcher, bot):
+    """
+    โหมดทีละคู่ + TYPHOON_BATCH: GPT ทีละคู่ แล้วสรุป Typhoon ของทุกคู่ด้วย summarize_many
+    (pack หลายคู่ต่อ request) ก่อนส่ง Telegram ตามลำดับของ pairs
+    """
+    results = [_analyze_pair(event_index, pair, data_fetcher, bot, summarize=False) for pair in pairs]
+    analyses = {r["pair"]: r["ai_response"] for r in results if _has_analysis(r)}
+    summaries = bot.summarize_many(analyses) if analyses else {}
+    for result in results:
+        result["summary"] = summaries.get(result["pair"])
+        _deliver_pair(result, bot)
+
+# ========== Concurrent Pipeline ==========
+# จำนวนคู่เงินที่ประมวลผลพร้อมกัน (1 = โหมดเดิมแบบทีละคู่)
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "3"))
+# เว้นระยะระหว่างข้อความ Telegram ในแชทเดียวกัน (Telegram จำกัด ~1 ข้อความ/วินาที ต่อแชท)
+TELEGRAM_SEND_INTERVAL = float(os.getenv("TELEGRAM_SEND_INTERVAL", "1.0"))
+# คิวส่ง Telegram ร่วมกันทั้งสอง bot: FIFO เดียวจึงรักษาลำดับ "บทวิเคราะห์เต็ม -> สรุป"
+TELEGRAM_OUTBOX = TelegramOutbox(chat_interval=TELEGRAM_SEND_INTERVAL)
+# จำนวน request ที่ค้างพร้อมกันต่อ provider + timeout/retry ต่อ call
+GPT_MAX_IN_FLIGHT = int(os.getenv("GPT_MAX_IN_FLIGHT", "4"))
+TYPHOON_MAX_IN_FLIGHT = int(os.getenv("TYPHOON_MAX_IN_FLIGHT", "2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "90"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# 1 = สรุป Typhoon ทุกคู่ในรอบเดียว (analyze_many) หลัง GPT เสร็จครบ; 0 = สรุปทีละคู่ทันทีที่ GPT เสร็จ
+TYPHOON_BATCH = os.getenv("TYPHOON_BATCH", "0") == "1"
+
+# ไฟล์ trace ของแต่ละรอบ (Chrome trace-event JSON; เปิดด้วย chrome://tracing หรือ ui.perfetto.dev)
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(".cache", "trace.json"))
+
+class StageTimer:
+    """Thread-safe wall-clock recorder for pipeline stages (per pair and per run)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = defaultdict(list)  # stage -> [(pair, seconds)]
+
+    @contextmanager
+    def track(self, stage, pair="-"):
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"stage.{stage}", pair=pair):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.records[stage].append((pair, elapsed))
+
+    def report(self, total_seconds):
+        print("\n⏱️ Stage timings (wall clock):")
+        for stage, items in self.records.items():
+            busy = sum(sec for _, sec in items)
+            detail = ", ".join(f"{pair}={sec:.2f}s" for pair, sec in items)
+            print(f"  - {stage:<10} total={busy:.2f}s  [{detail}]")
+        print(f"⏱️ Whole run: {total_seconds:.2f}s")
+
+async def _analyze_pair_async(event_index, pair, data_fetcher, bot, timer, gpt, typhoon, limiter, tech=None,
+                              summarize=True):
+    """
+    Worker: context -> GPT -> Typhoon for one pair. Does NOT send anything,
+    so the caller can deliver results in a fixed order.
+    """
+    result = {"pair": pair, "ai_response": None, "summary": None, "error": None}
+    async with limiter:
+        print(f"\n===== Analyzing: {pair} =====")
+        with timer.track("context", pair):
+            ctx = build_pair_context(event_index, pair, data_fetcher, tech)
+        if not ctx:
+            return result
+
+        with timer.track("gpt", pair):
+            result["ai_response"] = await call_gpt_api_async(format_user_prompt(ctx), gpt, pair)
+        if not summarize or not _has_analysis(result):
+            return result
+        with timer.track("typhoon", pair):
+            result["summary"] = await bot.summarize_async(result["ai_response"], typhoon)
+    return result
+
+def _has_analysis(result):
+    """มีผล GPT จริงให้สรุปด้วย Typhoon (ไม่ใช่ None หรือข้อความ GPT_ERROR_TEXT)"""
+    return bool(result["ai_response"]) and result["ai_response"] != GPT_ERROR_TEXT
+
+def _deliver_pair(result, bot):
+    """Queue one pair's messages (full GPT analysis, then Typhoon summary)."""
+    pair = result["pair"]
+    if result.get("error"):
+        # เหตุผลอยู่ใน code span: ข้อความ exception มักมี _ หรือ * ที่ทำให้ Markdown ของ Telegram พัง
+        reason = str(result["error"]).replace("`", "'")
+        send_telegram_message(f"⚠️ Analysis failed for *{pair}*: `{reason}`. Skipping.")
+        return
+    if result["ai_response"] is None:
+        send_telegram_message(f"⚠️ Could not fetch comprehensive technical data for *{pair}*. Skipping analysis.")
+        return
+    send_telegram_message(f"{pair}\n{'-'*20}\n{result['ai_response']}")
+    if result["summary"]:
+        bot.deliver(result["summary"])
 
-    # สร้าง Instance ของ Data Fetcher
-    print("Initializing data connection...")
-    data_fetcher = IQDataFetcher()
-    analyzer = TyphoonForexAnalyzer(TYPHOON_API_KEY)
-    notifier = TelegramNotifier(SIGNAL_TOKEN, CHAT_ID)
-    bot_tele = ForexBot(analyzer, notifier)
-    # เช็คว่าเชื่อมต่อสำเร็จไหม
+async def _settle(pair, task):
+    try:
+        return await task
+    except Exception as e:
+        print(f"❌ Pipeline failed for {pair}: {e}")
+        return {"pair": pair, "ai_response": None, "summary": None, "error": f"{type(e).__name__}: {e}"}
+
+async def _run_llm_stage(event_index, pairs, data_fetcher, bot, techs, concurrency, timer, deliver=True):
+    """GPT/Typhoon ของทุกคู่; deliver=False = ไม่ส่ง Telegram (คืนผลตามลำดับของ pairs ให้ผู้เรียกส่งเอง)"""
+    gpt = AsyncLLMClient("openai", max_in_flight=GPT_MAX_IN_FLIGHT,
+                         timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+    typhoon = AsyncLLMClient("typhoon", api_key=bot.analyzer.api_key, base_url=bot.analyzer.base_url,
+                             max_in_flight=TYPHOON_MAX_IN_FLIGHT, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+    limiter = asyncio.Semaphore(concurrency)
+    results = []
+    try:
+        tasks = [asyncio.ensure_future(_analyze_pair_async(event_index, pair, data_fetcher, bot, timer,
+                                                           gpt, typhoon, limiter, techs.get(pair) or {},
+                                                           summarize=not TYPHOON_BATCH))
+                 for pair in pairs]
+        if TYPHOON_BATCH:
+            results = [await _settle(pair, task) for pair, task in zip(pairs, tasks)]
+            analyses = {r["pair"]: r["ai_response"] for r in results if _has_analysis(r)}
+            with timer.track("typhoon"):
+                summaries = await bot.summarize_many_async(analyses, typhoon) if analyses else {}
+            for result in results:
+                result["summary"] = summaries.get(result["pair"])
+                if deliver:
+                    _deliver_pair(result, bot)
+        else:
+            for pair, task in zip(pairs, tasks):
+                results.append(await _settle(pair, task))
+                if deliver:
+                    # เข้าคิว Telegram แบบไม่บล็อก คู่อื่นเรียก LLM ต่อได้ระหว่างส่ง
+                    _deliver_pair(results[-1], bot)
+    finally:
+        await gpt.aclose()
+        await typhoon.aclose()
+    print(f"🔁 LLM retries: openai={gpt.retries}, typhoon={typhoon.retries}")
+    return results
+
+def run_pipeline(event_index, pairs, data_fetcher, bot, concurrency=PIPELINE_CONCURRENCY, timer=None):
+    """
+    Analyze several pairs at once: technicals in one batched fetch, then
+    GPT/Typhoon calls on async clients (bounded in-flight, retry with backoff).
+    Telegram messages still go out in the order of `pairs`: each result is
+    delivered as soon as it and every pair before it are ready.
+    """
+    timer = timer or StageTimer()
+    workers = max(1, min(concurrency, len(pairs)))
+    print(f"🧵 Running pipeline for {len(pairs)} pairs with concurrency={workers}")
+
+    # ดึง technicals ของทุกคู่ในรอบเดียว (ทุก stream เปิดพร้อมกัน)
+    with timer.track("technicals"):
+        techs = data_fetcher.get_technical_data_batch(pairs)
+
+    asyncio.run(_run_llm_stage(event_index, pairs, data_fetcher, bot, techs, workers, timer))
+    return timer
+
+def analyze_pairs(event_index, pairs, data_fetcher, bot, concurrency=PIPELINE_CONCURRENCY, timer=None):
+    """run_pipeline ที่ไม่ส่ง Telegram: คืน list ของ {"pair", "ai_response", "summary", "error"} ตามลำดับของ pairs"""
+    timer = timer or StageTimer()
+    with timer.track("technicals"):
+        techs = data_fetcher.get_technical_data_batch(pairs)
+    workers = max(1, min(concurrency, len(pairs)))
+    return asyncio.run(_run_llm_stage(event_index, pairs, data_fetcher, bot, techs, workers, timer, deliver=False))
+
+# ========== Sharded execution (process pool / GitHub Actions matrix) ==========
+# ไฟล์รายชื่อคู่เงิน (หนึ่งคู่ต่อบรรทัด) และจำนวน process ที่แบ่ง shard (1 = process เดียวแบบเดิม)
+PAIRS_FILE = os.getenv("PAIRS_FILE", "pairs.txt")
+PIPELINE_PROCESSES = int(os.getenv("PIPELINE_PROCESSES", "1"))
+# โฟลเดอร์ผลของแต่ละ shard เมื่อรันด้วย --shard (รวมและส่งด้วย --merge)
+SHARD_RESULTS_DIR = os.getenv("SHARD_RESULTS_DIR", os.path.join(".cache", "shards"))
+
+def _new_bot():
+    analyzer = TyphoonForexAnalyzer(TYPHOON_API_KEY, cache=LLM_CACHE)
+    return ForexBot(analyzer, TelegramNotifier(SIGNAL_TOKEN, CHAT_ID, outbox=TELEGRAM_OUTBOX))
+
+def _shard_trace_path(index):
+    root, ext = os.path.splitext(TRACE_PATH)
+    return f"{root}.shard{index}{ext or '.json'}"
+
+def run_shard(index, pairs, all_events, macro, concurrency=PIPELINE_CONCURRENCY):
+    """
+    วิเคราะห์ shard หนึ่งใน process ลูก: IQ session ของตัวเอง, ไม่ส่ง Telegram
+    คืน {"index", "results", "seconds", "records", "usage"} ให้ process แม่รวมผล
+    """
+    started = time.perf_counter()
+    GLOBAL_MACRO.update(macro)
+    event_index = build_event_index(all_events)
+    timer = StageTimer()
+    with timer.track("connect"):
+        data_fetcher = IQDataFetcher()
     if data_fetcher.api is None:
-        send_telegram_message("❌ Bot could not connect to IQ Option. Shutting down.")
-        exit(1)
-    
-    # 1. ดึงข้อมูลข่าวจาก Forex Factory
-    all_events = scrape_forex_factory()
+        results = [{"pair": pair, "ai_response": None, "summary": None, "error": "IQ Option connection failed"}
+                   for pair in pairs]
+    else:
+        results = analyze_pairs(event_index, pairs, data_fetcher, _new_bot(), concurrency, timer)
+        data_fetcher.close_connection()
+    tracing.TRACER.write(_shard_trace_path(index))
+    return {"index": index, "results": results, "seconds": time.perf_counter() - started,
+            "records": dict(timer.records), "usage": list(GPT_USAGE.calls)}
+
+def run_sharded(all_events, pairs, bot, processes, concurrency=PIPELINE_CONCURRENCY, timer=None):
+    """
+    แบ่ง pairs เป็นช่วงต่อเนื่องให้ process pool (spawn: ไม่ fork thread/socket ของ process แม่)
+    ส่ง Telegram ตามลำดับเดิม: shard ถัดไปถูกส่งเมื่อ shard ก่อนหน้าส่งครบแล้ว
+    หมายเหตุ: GPT_MAX_IN_FLIGHT / TYPHOON_MAX_IN_FLIGHT เป็นค่าต่อ process
+    """
+    timer = timer or StageTimer()
+    shards = split_shards(pairs, processes)
+    print(f"🧩 Running {len(pairs)} pairs in {len(shards)} shards (process pool)")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_shard, i, shard, all_events, dict(GLOBAL_MACRO), concurrency)
+                   for i, shard in enumerate(shards)]
+        for shard, future in zip(shards, futures):
+            try:
+                done = future.result()
+            except Exception as e:
+                print(f"❌ Shard failed ({shard[0]}..{shard[-1]}): {e}")
+                done = {"results": [{"pair": pair, "ai_response": None, "summary": None, "error": f"shard failed: {e}"}
+                                    for pair in shard],
+                        "records": {}, "usage": []}
+            for stage, items in done["records"].items():
+                timer.records[stage].extend(items)
+            GPT_USAGE.calls.extend(done["usage"])
+            for result in done["results"]:
+                _deliver_pair(result, bot)
+    return timer
+
+def report_throughput(count, seconds):
+    rate = count / seconds * 60 if seconds > 0 else 0.0
+    print(f"🚀 Throughput: {count} pairs in {seconds:.1f}s = {rate:.1f} pairs/min")
+    return rate
+
+def load_events(timer, refresh_actuals=CALENDAR_REFRESH_ACTUALS):
+    """ปฏิทินข่าว + Global Macro ของวันนี้ คืน (all_events, event_index)"""
+    with timer.track("calendar"):
+        all_events = load_calendar(refresh_actuals=refresh_actuals)
     if not all_events:
         print("📰 No news events found for today, or scraping failed. Proceeding with technical analysis only.")
         all_events = [] # ทำให้แน่ใจว่าเป็น list ว่าง
     else:
         print(f"📰 Scraped {len(all_events)} total events.")
-    
-    set_global_macro_from_events(all_events)
-    # print("🧭 Global Macro Baseline:", GLOBAL_MACRO)
 
-    # 2. ตั้งค่าคู่เงินที่ต้องการวิเคราะห์
-    target_pairs = ["EUR/USD", "GBP/USD", "USD/JPY", "EUR/GBP", "EUR/CHF"]
-    
-    # 3. วนลูปเพื่อวิเคราะห์และส่งข้อมูลทีละคู่เงิน
+    with timer.track("macro"):
+        event_index = build_event_index(all_events)
+        set_global_macro_from_events(event_index)
+    return all_events, event_index
+
+def run_rundown(all_events, event_index, pairs, data_fetcher, bot, timer, processes=1,
+                title="Daily Analysis Rundown"):
+    """ส่งหัวข้อ rundown แล้ววิเคราะห์และเข้าคิว Telegram ทุกคู่ตามลำดับ คืน pairs/min"""
     now_ict = datetime.utcnow() + timedelta(hours=7)
-    initial_message = f"📈 *Daily Analysis Rundown* at {now_ict.strftime('%Y-%m-%d %H:%M')} ICT"
-    send_telegram_message(initial_message)
-    time.sleep(2)
+    send_telegram_message(f"📈 *{title}* at {now_ict.strftime('%Y-%m-%d %H:%M')} ICT")
+
+    started = time.perf_counter()
+    if processes > 1:
+        run_sharded(all_events, pairs, bot, processes, PIPELINE_CONCURRENCY, timer)
+    elif PIPELINE_CONCURRENCY <= 1 and TYPHOON_BATCH:
+        analyze_and_send_batched(event_index, pairs, data_fetcher, bot)
+    elif PIPELINE_CONCURRENCY <= 1:
+        for pair in pairs:
+            analyze_and_send(event_index, pair, data_fetcher, bot)
+    else:
+        run_pipeline(event_index, pairs, data_fetcher, bot, PIPELINE_CONCURRENCY, timer)
+    return report_throughput(len(pairs), time.perf_counter() - started)
 
-    for pair in target_pairs:
-        analyze_and_send(all_events, pair, data_fetcher,bot_tele)
+def send_telegram_message(text):
+    """Queues a message for the Telegram chat (returns a Future; does not block)."""
+    return TELEGRAM_OUTBOX.enqueue(TELEGRAM_TOKEN, CHAT_ID, text)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Daily Forex news + technical analysis bot")
+    parser.add_argument("--profile", action="store_true",
+                        help="print a per-span summary table (durations, bytes, tokens, retries, errors)")
+    parser.add_argument("--trace", default=TRACE_PATH,
+                        help=f"where to write the trace-event JSON (default: {TRACE_PATH})")
+    parser.add_argument("--pairs-file", default=PAIRS_FILE,
+                        help=f"pair universe, one BASE/QUOTE per line (default: {PAIRS_FILE})")
+    parser.add_argument("--processes", type=int, default=PIPELINE_PROCESSES,
+                        help="split the pairs into this many shards on a process pool (default: 1)")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="analyze only shard I of N and save the results instead of sending (CI matrix)")
+    parser.add_argument("--results-dir", default=SHARD_RESULTS_DIR,
+                        help=f"where --shard writes its results (default: {SHARD_RESULTS_DIR})")
+    parser.add_argument("--merge", metavar="DIR",
+                        help="send one ordered rundown from the shard results found under DIR")
+    return parser.parse_args(argv)
+
+def finish_trace(args):
+    path = tracing.TRACER.write(args.trace)
+    print(f"🧵 Trace written to {path}")
+    if args.profile:
+        tracing.TRACER.print_summary()
 
-    data_fetcher.close_connection()  
-    print("\n✅ All pairs analyzed. Script finished.")
\ No newline at end of file
+if __name__ == '__main__':
+    args = parse_args()
+    print("🚀 Starting Forex Analysis Bot...")
+    run_started = time.perf_counter()
+    timer = StageTimer()
+    bot_tele = _new_bot()
+
+    # 2. คู่เงินที่ต้องการวิเคราะห์ (จากไฟล์; --shard I/N = เฉพาะช่วงที่ I ของ N สำหรับงาน matrix)
+    universe = load_pairs(args.pairs_file)
+
+    if args.merge:
+        # รวมผลของทุก shard แล้วส่งเป็น rundown เดียวตามลำดับของไฟล์คู่เงิน
+        results, slowest = load_shard_results(args.merge, universe)
+        now_ict = datetime.utcnow() + timedelta(hours=7)
+        send_telegram_message(f"📈 *Daily Analysis Rundown* at {now_ict.strftime('%Y-%m-%d %H:%M')} ICT")
+        for result in results:
+            _deliver_pair(result, bot_tele)
+        report_throughput(len(universe), slowest)
+        with timer.track("telegram"):
+            TELEGRAM_OUTBOX.close()
+        timer.report(time.perf_counter() - run_started)
+        print(f"📨 Telegram: {TELEGRAM_OUTBOX.stats()}")
+        finish_trace(args)
+        exit(0)
+
+    shard = parse_shard(args.shard) if args.shard else None
+    if shard:
+        shards = split_shards(universe, shard[1])
+        target_pairs = shards[shard[0]] if shard[0] < len(shards) else []
+    else:
+        target_pairs = universe
+    processes = 1 if shard else args.processes
+    print(f"🗂️ {len(target_pairs)} pairs to analyze (universe: {len(universe)}, processes: {processes})")
+
+    # สร้าง Instance ของ Data Fetcher (โหมดหลาย process: แต่ละ shard เชื่อมต่อเอง)
+    data_fetcher = None
+    if processes <= 1:
+        print("Initializing data connection...")
+        with timer.track("connect"):
+            data_fetcher = IQDataFetcher()
+        # เช็คว่าเชื่อมต่อสำเร็จไหม
+        if data_fetcher.api is None:
+            send_telegram_message("❌ Bot could not connect to IQ Option. Shutting down.")
+            TELEGRAM_OUTBOX.close()
+            finish_trace(args)
+            exit(1)
+    
+    # 1. ดึงข้อมูลข่าวจาก Forex Factory
+    all_events, event_index = load_events(timer)
+
+    # 3. วิเคราะห์และส่งข้อมูล (concurrent pipeline; PIPELINE_CONCURRENCY=1 = ทีละคู่แบบเดิม)
+    if shard:
+        # งาน matrix: ไม่ส่ง Telegram เอง บันทึกผลให้ขั้น --merge ส่งรวม
+        analysis_started = time.perf_counter()
+        results = analyze_pairs(event_index, target_pairs, data_fetcher, bot_tele, PIPELINE_CONCURRENCY, timer) \
+            if target_pairs else []
+        seconds = time.perf_counter() - analysis_started
+        path = save_shard_results(args.results_dir, shard[0], target_pairs, results, seconds)
+        print(f"💾 Shard {args.shard} results saved to {path}")
+        report_throughput(len(target_pairs), seconds)
+    else:
+        run_rundown(all_events, event_index, target_pairs, data_fetcher, bot_tele, timer, processes)
+
+    if data_fetcher:
+        data_fetcher.close_connection()
+    # รอให้คิว Telegram ส่งครบก่อนจบโปรแกรม
+    with timer.track("telegram"):
+        TELEGRAM_OUTBOX.close()
+    timer.report(time.perf_counter() - run_started)
+    print(f"📨 Telegram: {TELEGRAM_OUTBOX.stats()}")
+    print(f"📦 LLM cache: {LLM_CACHE.stats()}")
+    GPT_USAGE.report()
+    if PROMPT_TOKEN_REPORT:
+        before = sum(b for b, _ in PROMPT_TOKEN_REPORT.values())
+        after = sum(a for _, a in PROMPT_TOKEN_REPORT.values())
+        print(f"🧮 Prompt tokens (est.) all pairs: {before} -> {after}")
+    finish_trace(args)
+    print("\n✅ All pairs analyzed. Script finished.")
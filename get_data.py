@@ -1,50 +1,159 @@
 # get_data.py
 import os
 import time
-import pandas as pd
-import pandas_ta as ta
-from iqoptionapi.stable_api import IQ_Option
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
 
+import tracing
+from candle_store import CandleStore
+from candles import Candles, resample
+from iq_backends import make_backend
+from iq_supervisor import ConnectionSupervisor
+from indicators import stack_closes, latest_values, IndicatorState
+from snapshots import TechnicalSnapshot, SnapshotCache, DAILY_TIMEFRAME
+
 # โหลดค่าจาก .env
 load_dotenv()
 
+# ระยะเวลารอข้อมูลแท่งเทียนสูงสุดต่อ 1 stream (วินาที) และความถี่ในการเช็ค
+CANDLE_FETCH_DEADLINE = float(os.getenv("CANDLE_FETCH_DEADLINE", "6"))
+CANDLE_POLL_INTERVAL = float(os.getenv("CANDLE_POLL_INTERVAL", "0.1"))
+# ถ้าจำนวนแท่งไม่เปลี่ยนติดต่อกันกี่รอบ ให้ถือว่าข้อมูลนิ่งแล้ว (กรณีได้ไม่ครบ count)
+CANDLE_STABLE_POLLS = int(os.getenv("CANDLE_STABLE_POLLS", "5"))
+
+# จำนวน session IQ Option ที่ login พร้อมกัน (เฉพาะ replay; live ใช้ได้ 1 session ต่อ process) และนโยบาย reconnect
+IQ_POOL_SIZE = int(os.getenv("IQ_POOL_SIZE", "1"))
+IQ_RECONNECT_ATTEMPTS = int(os.getenv("IQ_RECONNECT_ATTEMPTS", "5"))
+IQ_RECONNECT_BACKOFF = float(os.getenv("IQ_RECONNECT_BACKOFF", "1.0"))
+IQ_RECONNECT_BACKOFF_CAP = float(os.getenv("IQ_RECONNECT_BACKOFF_CAP", "30"))
+# ตรวจ session ที่ว่างทุกกี่วินาที (0 = ตรวจเฉพาะก่อนใช้งาน) และจำนวนครั้งที่ขอ stream ซ้ำหลัง reconnect
+IQ_HEALTH_INTERVAL = float(os.getenv("IQ_HEALTH_INTERVAL", "0"))
+IQ_FETCH_RETRIES = int(os.getenv("IQ_FETCH_RETRIES", "1"))
+
+# ที่เก็บแท่งเทียนบนดิสก์สำหรับ incremental sync (ตั้งเป็นค่าว่างเพื่อปิด)
+CANDLE_STORE_PATH = os.getenv("CANDLE_STORE_PATH", os.path.join(".cache", "candles.sqlite"))
+
+# Streaming indicators: เก็บ state ของ EMA/RSI/MACD ใน CandleStore แล้วอัปเดตเฉพาะแท่งใหม่ (ต้องเปิด store)
+INDICATOR_STREAMING = os.getenv("INDICATOR_STREAMING", "0") == "1"
+# จำนวนแท่งย้อนหลังสูงสุดที่ใช้ warm-up state ครั้งแรก (ยิ่งมากค่า EMA50/MACD ยิ่งลู่เข้า)
+STREAMING_WARMUP_BARS = int(os.getenv("STREAMING_WARMUP_BARS", "1000"))
+
+# Timeframe (วินาที) -> จำนวนแท่งที่ต้องใช้ใน get_technical_data
+TECHNICAL_TIMEFRAMES = {14400: 100, 3600: 100, 900: 100, 86400: 2}
+# Timeframe ที่คำนวณ EMA/RSI/MACD (D1 ใช้แค่หา Previous Day/Pivot) และ prefix ของ key ในผลลัพธ์
+INDICATOR_TIMEFRAMES = (14400, 3600, 900)
+TIMEFRAME_PREFIX = {14400: "h4", 3600: "h1", 900: "m15"}
+
+# TechnicalSnapshot ต่อ (pair, timeframe) memoize ด้วยแท่งที่ปิดล่าสุด (เก็บใน CandleStore ถ้าเปิด store)
+TECHNICAL_SNAPSHOTS = os.getenv("TECHNICAL_SNAPSHOTS", "1") == "1"
+
+# โหมด resample: ดึงเฉพาะ M15 แล้วสร้าง H1/H4/D1 เองในเครื่อง
+RESAMPLE_MODE = os.getenv("RESAMPLE_MODE", "0") == "1"
+# M15 1000 แท่ง ≈ 10 วันทำการ -> H4 ~60 แท่ง (พอสำหรับ EMA50/MACD), H1 ~250 แท่ง
+RESAMPLE_BASE_COUNT = int(os.getenv("RESAMPLE_BASE_COUNT", "1000"))
+RESAMPLE_BASE_TIMEFRAME = 900
+# ขอบเขตวัน/แท่ง H4 นับจากเที่ยงคืนตามเวลา local (ICT = +7); ตั้งเป็น 0 เพื่อให้ตรงกับแท่ง UTC ของ IQ Option
+# ค่าเริ่มต้น ICT ตั้งใจให้ D1/H4 เป็นวันซื้อขายตามเวลาไทย จึงต่างจากแท่ง H4/D1 ที่ดึงจาก IQ Option (H1 ตรงกันเสมอ)
+RESAMPLE_TZ_OFFSET_HOURS = int(os.getenv("RESAMPLE_TZ_OFFSET_HOURS", "7"))
+
+def resample_candles(candles, timeframe, tz_offset_hours=RESAMPLE_TZ_OFFSET_HOURS):
+    """
+    รวมแท่งเทียน timeframe เล็ก (เช่น M15) เป็น timeframe ใหญ่ขึ้น (H1/H4/D1) บน array ของ Candles
+    - แท่งเริ่มที่เที่ยงคืนตามเวลา local (UTC + tz_offset_hours) แล้วแบ่งทุก `timeframe` วินาที
+    - OHLCV = first / max / min / last / sum, 'time' เป็นเวลาเปิดแท่ง (UTC epoch)
+    - แท่งแรกที่มีข้อมูลไม่ครบ (เริ่มกลางแท่ง) จะถูกตัดทิ้ง
+    """
+    if not candles:
+        return Candles.empty()
+    bars = resample(candles, timeframe, tz_offset_hours * 3600)
+    if len(bars) and candles.time[0] > bars.time[0]:
+        bars = bars[1:]
+    return bars
+
+def _has_indicators(snapshot):
+    """snapshot ของ H4/H1/M15 ที่มีแท่งพอคำนวณ Indicators (MACD ต้องการอย่างน้อย 26 แท่ง)"""
+    return snapshot is not None and snapshot.macd is not None
+
+# status ของ stream ที่ถือว่าดึงไม่สำเร็จ (ต่างจาก "ready"/"stable" ที่ stream ตอบครบแต่ประวัติอาจสั้น)
+FAILED_STREAM_STATUSES = ("disconnected", "deadline")
+
+def _complete_count(candles):
+    """นับแท่งที่มีข้อมูลครบ (มี open)"""
+    return sum(1 for c in candles.values() if c.get('open') is not None)
+
 class IQDataFetcher:
     """
     คลาสสำหรับเชื่อมต่อ IQ Option, ดึงข้อมูลราคา และคำนวณ Indicators
     """
-    def __init__(self):
+    def __init__(self, fetch_deadline=CANDLE_FETCH_DEADLINE, poll_interval=CANDLE_POLL_INTERVAL,
+                 store_path=CANDLE_STORE_PATH, api=None, backend=None, pool_size=IQ_POOL_SIZE, backend_factory=None,
+                 snapshots=TECHNICAL_SNAPSHOTS):
         """
         Constructor: โหลดข้อมูล login และเตรียมเชื่อมต่อ API
+        api: client ที่เชื่อมต่อแล้ว (เช่น stub ใน benchmarks/) -> ไม่ต้อง login
+        backend: backend ที่ยังไม่เชื่อมต่อ (iq_backends) ค่าเริ่มต้นตาม IQ_BACKEND
+        pool_size / backend_factory: จำนวน session ที่ login พร้อมกัน และตัวสร้าง backend ของแต่ละ session
+        snapshots: memoize TechnicalSnapshot ด้วยแท่งที่ปิดล่าสุด (False = คำนวณใหม่ทุกครั้ง)
         """
         print("🤖 Initializing IQ Option Data Fetcher...")
         self.user = os.getenv("IQ_USER")
         self.password = os.getenv("IQ_PASS")
         self.api = None
-        self.connect()
+        self.fetch_deadline = fetch_deadline
+        self.poll_interval = poll_interval
+        # (pair, timeframe, waited_seconds, candles_found, status) ของทุกการดึง
+        self.fetch_waits = []
+        self.store = CandleStore(store_path) if store_path else None
+        self.snapshots = SnapshotCache(self.store) if snapshots else None
+        self.supervisor = ConnectionSupervisor(
+            backend_factory or (lambda: make_backend(self.user, self.password)),
+            size=1 if (api is not None or backend is not None) else pool_size,
+            on_connect=self._on_connect, max_attempts=IQ_RECONNECT_ATTEMPTS,
+            backoff_base=IQ_RECONNECT_BACKOFF, backoff_cap=IQ_RECONNECT_BACKOFF_CAP,
+        )
+        if api is not None:
+            self.supervisor.add(api, connected=True)
+            self.api = api
+        else:
+            if backend is not None:
+                self.supervisor.add(backend)
+            self.connect()
 
     def connect(self):
         """
-        เชื่อมต่อกับ IQ Option API และเลือกบัญชี Practice
+        เชื่อมต่อกับ IQ Option API (ทุก session ใน pool) และเลือกบัญชี Practice
         """
-        if not self.user or not self.password:
-            print("❌ IQ_USER or IQ_PASS not found in .env file. Cannot connect.")
-            return
+        first = self.supervisor.sessions[0].backend if self.supervisor.sessions else None
+        name = first.name if first is not None else "pool"
+        print(f"🔗 Connecting to IQ Option ({name}, {self.supervisor.size} session(s)) as {self.user}...")
+        connected = self.supervisor.start()
 
-        print(f"🔗 Connecting to IQ Option as {self.user}...")
-        self.api = IQ_Option(self.user, self.password)
-        check, reason = self.api.connect()
-
-        if check:
-            print("✅ Connection successful!")
-            # เปลี่ยนเป็นบัญชีเงินฝึกหัด (Practice Account)
-            # หากต้องการใช้เงินจริงให้เปลี่ยนเป็น "REAL"
-            self.api.change_balance("PRACTICE") 
-            print("💰 Switched to PRACTICE account.")
+        if connected:
+            self.api = next(s.backend for s in self.supervisor.sessions if s.connected)
+            print(f"✅ Connection successful! ({connected}/{len(self.supervisor.sessions)} sessions)")
+            self.supervisor.start_monitor(IQ_HEALTH_INTERVAL)
         else:
-            print(f"❌ Connection failed. Reason: {reason}")
+            print(f"❌ Connection failed. Reason: {self.supervisor.last_error}")
             self.api = None
 
+    def _on_connect(self, backend):
+        # เปลี่ยนเป็นบัญชีเงินฝึกหัด (Practice Account)
+        # หากต้องการใช้เงินจริงให้เปลี่ยนเป็น "REAL"
+        backend.change_balance("PRACTICE") 
+        print("💰 Switched to PRACTICE account.")
+
+    def ensure_connected(self):
+        """health check ทุก session และ reconnect ตัวที่หลุด คืน True ถ้ามีอย่างน้อยหนึ่ง session ใช้งานได้"""
+        if not self.supervisor.sessions:
+            self.connect()
+        alive = [s for s in self.supervisor.sessions if self.supervisor.ensure(s)]
+        self.api = alive[0].backend if alive else None
+        return bool(alive)
+
+    def connection_metrics(self):
+        return self.supervisor.metrics()
+
     def _fetch_candles(self, pair, timeframe, count):
         """
         ฟังก์ชันภายในสำหรับดึงข้อมูลแท่งเทียน (Candles)
@@ -53,80 +162,220 @@ class IQDataFetcher:
             return None
             
         print(f"🕯️  Fetching {count} candles for {pair} on {timeframe}s timeframe...")
-        self.api.start_candles_stream(pair, timeframe, count)
-        time.sleep(3) # รอให้ API ดึงข้อมูลเสร็จ
-        candles = self.api.get_realtime_candles(pair, timeframe)
-        self.api.stop_candles_stream(pair, timeframe)
-        
-        # แปลงข้อมูลเป็น List of Dictionaries ที่ใช้งานง่าย
-        candle_list = []
-        for timestamp in candles:
-            candle_data = candles[timestamp]
-            # ไม่เอาข้อมูลที่ไม่สมบูรณ์และทำการแปลงชื่อ Key
-            if 'open' in candle_data and candle_data.get('open') is not None:
-                standardized_candle = {
-                    'open': candle_data.get('open'),
-                    'high': candle_data.get('max'),
-                    'low': candle_data.get('min'),
-                    'close': candle_data.get('close'),
-                    'volume': candle_data.get('volume')
-                }
-                candle_list.append(standardized_candle)
-        
-        print(f"📊 Found {len(candle_list)} candles.")
-        return candle_list
-    def _calculate_indicators(self, candles):
-        """
-        ฟังก์ชันภายในสำหรับคำนวณ Indicators ด้วย Pandas
+        return self._fetch_streams({(pair, timeframe): count})[(pair, timeframe)]
+
+    def _fetch_streams(self, streams, failed=None):
+        """
+        เปิด stream ทุกตัวใน `streams` ({(pair, timeframe): count}) พร้อมกัน
+        รอจนทุกตัวพร้อม แล้วปิดทั้งหมดในคราวเดียว คืนค่า {(pair, timeframe): Candles}
+        ถ้ามี CandleStore จะขอเฉพาะแท่งที่ใหม่กว่าแท่งล่าสุดที่เก็บไว้ แล้ว merge กับของเดิม
+        ถ้า pool มีหลาย session จะแบ่ง stream ให้แต่ละ session รอพร้อมกัน
+        failed: set ที่จะถูกเติม key ของ stream ที่หลุด/หมดเวลา (FAILED_STREAM_STATUSES)
+        """
+        requested = {key: self._missing_count(key, count) for key, count in streams.items()}
+        items = list(requested.items())
+        parts = [dict(items[i::len(self.supervisor.sessions)]) for i in range(len(self.supervisor.sessions))]
+        parts = [part for part in parts if part]
+        with tracing.span("iq.fetch", streams=len(requested), sessions=len(parts)) as sp:
+            if len(parts) <= 1:
+                fetched = [self._fetch_on_session(part) for part in parts]
+            else:
+                with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix="iq-session") as pool:
+                    fetched = list(pool.map(self._fetch_on_session, parts))
+
+            raw = {}
+            for part_raw, started in fetched:
+                raw.update(part_raw)
+                # หนึ่ง span ต่อ (pair, timeframe) จากเวลาที่ stream นั้นพร้อม (ทุก stream รอพร้อมกัน)
+                for (pair, timeframe), (candles, waited, status) in part_raw.items():
+                    tracing.record("iq.candles", waited, started, pair=pair, timeframe=timeframe,
+                                   requested=requested[(pair, timeframe)], candles=len(candles or {}), status=status)
+            sp.set(reconnects=self.supervisor.reconnects)
+
+        results = {}
+        for (pair, timeframe), (candles, waited, status) in raw.items():
+            self.fetch_waits.append((pair, timeframe, waited, _complete_count(candles), status))
+            print(f"⏳ {pair} {timeframe}s waited {waited:.2f}s ({status}).")
+            if failed is not None and status in FAILED_STREAM_STATUSES:
+                failed.add((pair, timeframe))
+            bars = Candles.from_payload(candles)
+            if self.store:
+                self.store.upsert(pair, timeframe, bars)
+                bars = self.store.load(pair, timeframe, streams[(pair, timeframe)])
+            results[(pair, timeframe)] = bars
+            print(f"📊 Found {len(bars)} candles "
+                  f"(requested {requested[(pair, timeframe)]}/{streams[(pair, timeframe)]} from API).")
+        return results
+
+    def _fetch_on_session(self, streams):
+        """
+        ดึง `streams` ด้วย session หนึ่งจาก pool; ถ้า websocket หลุดระหว่างรอ จะ reconnect
+        แล้วขอเฉพาะ stream ที่ค้างซ้ำ (สูงสุด IQ_FETCH_RETRIES ครั้ง) คืน (raw, started)
+        """
+        with self.supervisor.lease() as session:
+            started = time.perf_counter()
+            raw = self._stream_once(session, streams)
+            for _ in range(IQ_FETCH_RETRIES):
+                lost = {key: streams[key] for key, (_, _, status) in raw.items() if status == "disconnected"}
+                if not lost or not self.supervisor.reconnect(session):
+                    break
+                raw.update(self._stream_once(session, lost))
+        return raw, started
+
+    def _stream_once(self, session, streams):
+        if not self.supervisor.healthy(session):
+            return {key: ({}, 0.0, "disconnected") for key in streams}
+        api = session.backend
+        with session.lock:
+            for (pair, timeframe), count in streams.items():
+                api.start_candles_stream(pair, timeframe, count)
+        try:
+            return self._wait_for_streams(streams, session)
+        finally:
+            with session.lock:
+                for pair, timeframe in streams:
+                    api.stop_candles_stream(pair, timeframe)
+
+    def _missing_count(self, key, count):
+        """
+        จำนวนแท่งที่ต้องขอจาก API: นับจากแท่งล่าสุดที่เก็บไว้ถึงตอนนี้ (+1 เพื่อทับแท่งที่ยังไม่ปิด)
+        ใช้เวลาจริงเป็นตัวนับ จึงไม่มีทางขอน้อยกว่าจำนวนแท่งที่ขาดไป (ไม่เกิดช่องว่างในข้อมูล)
+        """
+        if not self.store:
+            return count
+        last_ts = self.store.last_timestamp(*key)
+        if last_ts is None:
+            return count
+        timeframe = key[1]
+        missing = int((time.time() - last_ts) // timeframe) + 2
+        return max(2, min(count, missing))
+
+    def _wait_for_streams(self, streams, session=None):
+        """
+        รอจนแต่ละ stream ได้แท่งเทียนครบ count แท่ง หรือจำนวนแท่งนิ่ง หรือหมดเวลา fetch_deadline
+        แทนการ sleep ตายตัว คืนค่า {(pair, timeframe): (candles, waited_seconds, status)}
+        ถ้า session หลุดระหว่างรอ stream ที่ค้างจะได้ status "disconnected" ทันที (ไม่รอจนหมดเวลา)
+        """
+        session = session or self.supervisor.sessions[0]
+        started = time.perf_counter()
+        deadline = started + self.fetch_deadline
+        pending = dict(streams)
+        last_count = {key: -1 for key in streams}
+        stable_polls = {key: 0 for key in streams}
+        done = {}
+        while pending:
+            if not self.supervisor.healthy(session):
+                waited = time.perf_counter() - started
+                for key in pending:
+                    done[key] = ({}, waited, "disconnected")
+                break
+            for key, count in list(pending.items()):
+                with session.lock:
+                    candles = dict(session.backend.get_realtime_candles(*key) or {})
+                found = _complete_count(candles)
+                waited = time.perf_counter() - started
+
+                stable_polls[key] = stable_polls[key] + 1 if found == last_count[key] and found > 0 else 0
+                last_count[key] = found
+                if found >= count:
+                    done[key] = (candles, waited, "ready")
+                elif stable_polls[key] >= CANDLE_STABLE_POLLS:
+                    done[key] = (candles, waited, "stable")
+                elif time.perf_counter() >= deadline:
+                    done[key] = (candles, waited, "deadline")
+                else:
+                    continue
+                del pending[key]
+            if pending:
+                time.sleep(self.poll_interval)
+        return done
+
+    def _calculate_indicators_batch(self, candle_lists):
+        """
+        คำนวณ Indicators ของแท่งเทียนหลายชุด (หลาย pair/timeframe) ในรอบเดียว
+        ด้วย vectorized engine (indicators.py) แทน pandas-ta ทีละ DataFrame
+        คืน list ของค่าล่าสุด ({'EMA_20': ..., ...} หรือ {} ถ้าข้อมูลไม่พอ) ตามลำดับ candle_lists
         """
         # ต้องการข้อมูลอย่างน้อย 50 แท่งสำหรับ EMA50, 14 แท่งสำหรับ RSI, และอย่างน้อย 26 แท่งสำหรับ MACD (ค่าเริ่มต้น)
-        if not candles or len(candles) < 26: # ใช้ 26 เป็นขั้นต่ำสุดสำหรับ MACD
+        ready = [i for i, candles in enumerate(candle_lists) if candles and len(candles) >= 26] # ใช้ 26 เป็นขั้นต่ำสุดสำหรับ MACD
+        with tracing.span("indicators", series=len(candle_lists), bars=sum(len(c or []) for c in candle_lists)):
+            closes = stack_closes([candle_lists[i].close for i in ready])
+            latest = dict(zip(ready, latest_values(closes))) if ready else {}
+
+        if len(latest) < len(candle_lists):
             print("⚠️ Not enough data to calculate indicators. Minimum 26 candles required for MACD.")
-            return {
-                "ohlc": pd.DataFrame(candles)[['open', 'high', 'low', 'close', 'volume']].tail(5).to_json(orient='records') if candles else "[]",
-                "ema20": "N/A",
-                "ema50": "N/A",
-                "rsi": "N/A",
-                "macd": "N/A",
-                "macdh": "N/A",
-                "macds": "N/A",
-            }
-
-        # แปลงเป็น DataFrame ของ Pandas
-        df = pd.DataFrame(candles)
-        
-        # ใช้ pandas-ta ในการคำนวณ (ง่ายและเร็วมาก)
-        df.ta.ema(length=20, append=True)
-        df.ta.ema(length=50, append=True)
-        df.ta.rsi(length=14, append=True)
-        df.ta.macd(append=True) # คำนวณ MACD ด้วยค่าเริ่มต้น (12, 26, 9)
-
-        # ดึงค่าล่าสุดออกมา
-        latest = df.iloc[-1]
-        
-        return {
-            "ohlc": df[['open', 'high', 'low', 'close', 'volume']].tail(5).to_json(orient='records'), # เพิ่ม volume
-            "ema20": f"{latest['EMA_20']:.5f}" if 'EMA_20' in latest and pd.notna(latest['EMA_20']) else "N/A",
-            "ema50": f"{latest['EMA_50']:.5f}" if 'EMA_50' in latest and pd.notna(latest['EMA_50']) else "N/A",
-            "rsi": f"{latest['RSI_14']:.2f}" if 'RSI_14' in latest and pd.notna(latest['RSI_14']) else "N/A",
-            "macd": f"{latest['MACD_12_26_9']:.5f}" if 'MACD_12_26_9' in latest and pd.notna(latest['MACD_12_26_9']) else "N/A", # เพิ่ม MACD
-            "macdh": f"{latest['MACDH_12_26_9']:.5f}" if 'MACDH_12_26_9' in latest and pd.notna(latest['MACDH_12_26_9']) else "N/A", # เพิ่ม MACD Histogram
-            "macds": f"{latest['MACDS_12_26_9']:.5f}" if 'MACDS_12_26_9' in latest and pd.notna(latest['MACDS_12_26_9']) else "N/A", # เพิ่ม MACD Signal
-        }
+        return [latest.get(i, {}) for i in range(len(candle_lists))]
 
-    def _calculate_pivot_points(self, high, low, close):
-        """Calculates Standard Daily Pivot Points."""
-        pp = (high + low + close) / 3
-        r1 = (2 * pp) - low
-        s1 = (2 * pp) - high
-        r2 = pp + (high - low)
-        s2 = pp - (high - low)
-        r3 = high + 2 * (pp - low)
-        s3 = low - 2 * (high - pp)
-        return {
-            "pp": f"{pp:.5f}", "r1": f"{r1:.5f}", "s1": f"{s1:.5f}",
-            "r2": f"{r2:.5f}", "s2": f"{s2:.5f}", "r3": f"{r3:.5f}", "s3": f"{s3:.5f}"
-        }
+    def _calculate_indicators_streaming(self, state_key, timeframe, candles):
+        """
+        คำนวณ Indicators จาก state ที่บันทึกไว้ใน CandleStore: ป้อนเฉพาะแท่งที่ปิดแล้วและยังไม่เคยป้อน
+        (O(1) ต่อแท่ง) แท่งสุดท้ายถือว่ายังไม่ปิด จึงใช้ preview โดยไม่บันทึกลง state
+        """
+        if not candles:
+            return {}
+        saved = self.store.load_state(state_key, timeframe)
+        state = IndicatorState.from_dict(saved) if saved else IndicatorState()
+        after = state.last_time if state.last_time is not None else -1
+        live_time, live_close = candles.time[-1], float(candles.close[-1])
+
+        closed = candles[:-1]
+        pending = closed[closed.time > after]
+        if state.last_time is None or candles.time[0] > after:
+            # state ว่างหรือขาดช่วง: ใช้ประวัติจาก store ซึ่งยาวกว่าหน้าต่างที่ขอมา
+            history = self.store.load_since(state_key, timeframe, after, STREAMING_WARMUP_BARS)
+            history = history[history.time < live_time]
+            if len(history) > len(pending):
+                pending = history
+
+        with tracing.span("indicators.streaming", pair=state_key, timeframe=timeframe, bars=len(pending)):
+            for close, timestamp in zip(pending.close.tolist(), pending.time.tolist()):
+                state.update(close, timestamp)
+            if pending:
+                self.store.save_state(state_key, timeframe, state.to_dict())
+        return state.preview(live_close)
+
+    def _fresh_snapshots(self, keys, offset=0):
+        """snapshot ของ key ({(state_key, timeframe)}) ที่ยังไม่มีแท่งใหม่ปิด จึงไม่ต้องดึงแท่งเทียนเลย"""
+        if not self.snapshots:
+            return {}
+        now = time.time()
+        fresh = {}
+        for key in keys:
+            snapshot = self.snapshots.fresh(*key, now=now, offset=offset)
+            if snapshot is not None:
+                fresh[key] = snapshot
+        if fresh:
+            print(f"♻️  Reusing {len(fresh)}/{len(keys)} technical snapshots (no new closed bar).")
+        return fresh
+
+    def _build_snapshots(self, candles_by_key):
+        """
+        TechnicalSnapshot ของทุก key ใน candles_by_key ({(state_key, timeframe): Candles})
+        ใช้ snapshot เดิมถ้าแท่งที่ปิดล่าสุดยังเป็นแท่งเดิม และคำนวณ Indicators ในรอบเดียวเฉพาะ key ที่มีแท่งใหม่
+        state_key = pair แบบไม่มี "/" (+ suffix แยกตามแหล่งแท่งเทียน เช่น โหมด resample)
+        """
+        snapshots, stale = {}, []
+        for key, candles in candles_by_key.items():
+            cached = self.snapshots.reuse(*key, candles) if self.snapshots else None
+            if cached is not None:
+                snapshots[key] = cached
+            else:
+                stale.append(key)
+
+        keys = [key for key in stale if key[1] in INDICATOR_TIMEFRAMES]
+        if INDICATOR_STREAMING and self.store:
+            computed = [self._calculate_indicators_streaming(*key, candles_by_key[key]) for key in keys]
+        else:
+            computed = self._calculate_indicators_batch([candles_by_key[key] for key in keys])
+        values = dict(zip(keys, computed))
+        with tracing.span("snapshots", reused=len(snapshots), computed=len(stale)):
+            for key in stale:
+                snapshot = TechnicalSnapshot.build(*key, candles_by_key[key], values.get(key, {}))
+                # ไม่ memoize ผลที่ข้อมูลไม่พอ (เช่น stream หมดเวลา) เพื่อให้รอบถัดไปดึงใหม่
+                if self.snapshots and (key[1] not in INDICATOR_TIMEFRAMES or _has_indicators(snapshot)):
+                    self.snapshots.put(snapshot)
+                snapshots[key] = snapshot
+        return snapshots
 
     def get_technical_data(self, pair):
         """
@@ -135,88 +384,139 @@ class IQDataFetcher:
         if not self.api:
             return None # หากเชื่อมต่อไม่สำเร็จ ให้คืนค่า None
 
-        api_pair_name = pair.replace("/", "")
-        
-        # 1. ดึงข้อมูล H4 และคำนวณ
-        h4_candles = self._fetch_candles(api_pair_name, 14400, 100) # ดึง 100 แท่ง
-        h4_data = self._calculate_indicators(h4_candles)
-        
-        # 2. ดึงข้อมูล H1 และคำนวณ
-        h1_candles = self._fetch_candles(api_pair_name, 3600, 100) # ดึง 100 แท่ง
-        h1_data = self._calculate_indicators(h1_candles)
-
-        # 3. ดึงข้อมูล M15 และคำนวณ
-        m15_candles = self._fetch_candles(api_pair_name, 900, 100) # ดึง 100 แท่ง
-        m15_data = self._calculate_indicators(m15_candles)
-        
-        # 4. ดึงข้อมูลแท่งเทียนรายวัน (D1) เพื่อหา Previous Day's High/Low/Close
-        #    ต้องการอย่างน้อย 2 แท่ง เพื่อให้แน่ใจว่าได้แท่งที่สมบูรณ์ของวันก่อนหน้า
-        d1_candles = self._fetch_candles(api_pair_name, 86400, 2) 
-        prev_day_high = "N/A"
-        prev_day_low = "N/A"
-        prev_day_close = "N/A"
-        daily_pivots = {
-            "pp": "N/A", "r1": "N/A", "s1": "N/A",
-            "r2": "N/A", "s2": "N/A", "r3": "N/A", "s3": "N/A"
+        return self.get_technical_data_batch([pair])[pair]
+
+    def get_technical_data_batch(self, pairs, timeframes=None, resample=None):
+        """
+        ดึงข้อมูลของหลายคู่เงิน/หลาย timeframe พร้อมกัน: เปิดทุก stream (pair, timeframe)
+        ในคราวเดียว เก็บผลเมื่อแต่ละตัวพร้อม แล้วปิดทั้งหมดพร้อมกัน
+        timeframes: dict {timeframe: count} หรือ list ของ timeframe (ค่าเริ่มต้น TECHNICAL_TIMEFRAMES)
+        resample: True = ดึงแค่ M15 แล้ว resample เป็น timeframe อื่น (ค่าเริ่มต้น RESAMPLE_MODE)
+        คืนค่า {pair: dict แบบเดียวกับ get_technical_data หรือ None}
+        """
+        if not self.api:
+            return {pair: None for pair in pairs}
+
+        if timeframes is None:
+            timeframes = TECHNICAL_TIMEFRAMES
+        elif not isinstance(timeframes, dict):
+            timeframes = {tf: TECHNICAL_TIMEFRAMES.get(tf, 100) for tf in timeframes}
+        if resample is None:
+            resample = RESAMPLE_MODE
+        if resample:
+            return self._get_technical_data_resampled(pairs, timeframes)
+
+        keys = [(pair.replace("/", ""), tf) for pair in pairs for tf in timeframes]
+        snapshots = self._fresh_snapshots(keys)
+        # เปิด stream เฉพาะ (pair, timeframe) ที่มีแท่งใหม่ปิดตั้งแต่ snapshot ล่าสุด
+        streams = {key: timeframes[key[1]] for key in keys if key not in snapshots}
+        failed = set()
+        if streams:
+            print(f"🕯️  Fetching {len(streams)} candle streams for {len(pairs)} pairs at once...")
+            snapshots.update(self._build_snapshots(self._fetch_streams(streams, failed)))
+
+        return {
+            pair: self._build_technical_data(pair, {tf: snapshots[(pair.replace("/", ""), tf)] for tf in timeframes},
+                                             failed={tf for tf in timeframes if (pair.replace("/", ""), tf) in failed})
+            for pair in pairs
         }
 
-        if d1_candles and len(d1_candles) >= 2:
-            # แท่งที่สองจากท้ายคือแท่งของวันก่อนหน้า
-            prev_day_candle = d1_candles[-2] 
-            prev_day_high = f"{prev_day_candle['high']:.5f}"
-            prev_day_low = f"{prev_day_candle['low']:.5f}"
-            prev_day_close = f"{prev_day_candle['close']:.5f}"
-            
-            # คำนวณ Pivot Points จากข้อมูลวันก่อนหน้า
-            daily_pivots = self._calculate_pivot_points(
-                prev_day_candle['high'], 
-                prev_day_candle['low'], 
-                prev_day_candle['close']
-            )
-
-        if not h1_data or not m15_data or not h4_data: # ตรวจสอบ m5_data ด้วย
-            print(f"❌ Could not retrieve full technical data for {pair}.")
-            return None
-        
-        # 5. ประกอบร่างข้อมูลทั้งหมดเพื่อส่งคืน
+    def _get_technical_data_resampled(self, pairs, timeframes):
+        """ดึงเฉพาะ M15 (1 stream ต่อคู่) แล้วสร้าง timeframe อื่นด้วย resample_candles"""
+        suffix = f"@r{RESAMPLE_TZ_OFFSET_HOURS}"
+        keys = {pair: [(pair.replace("/", "") + suffix, tf) for tf in timeframes] for pair in pairs}
+        snapshots = self._fresh_snapshots([key for pair in pairs for key in keys[pair]],
+                                          offset=RESAMPLE_TZ_OFFSET_HOURS * 3600)
+        stale = [pair for pair in pairs if any(key not in snapshots for key in keys[pair])]
+        failed = set()
+        if stale:
+            streams = {(pair.replace("/", ""), RESAMPLE_BASE_TIMEFRAME): RESAMPLE_BASE_COUNT for pair in stale}
+            print(f"🕯️  Fetching {len(streams)} base M15 streams (resample mode)...")
+            fetched = self._fetch_streams(streams, failed)
+
+            candles_by_key = {}
+            for pair in stale:
+                base = fetched[(pair.replace("/", ""), RESAMPLE_BASE_TIMEFRAME)]
+                for key in keys[pair]:
+                    if key in snapshots:
+                        continue
+                    tf = key[1]
+                    bars = base if tf == RESAMPLE_BASE_TIMEFRAME else resample_candles(base, tf)
+                    candles_by_key[key] = bars[-timeframes[tf]:]
+            snapshots.update(self._build_snapshots(candles_by_key))
+
+        # base M15 หลุด/หมดเวลา -> ทุก timeframe ที่ resample จากมันถือว่าดึงไม่สำเร็จ
+        failed_pairs = {pair for pair in pairs if (pair.replace("/", ""), RESAMPLE_BASE_TIMEFRAME) in failed}
         return {
-            "h4_ohlc": h4_data['ohlc'],
-            "h4_ema20": h4_data['ema20'],
-            "h4_ema50": h4_data['ema50'],
-            "h4_rsi": h4_data['rsi'],
-            "h4_macd": h4_data['macd'], # เพิ่มใหม่
-            "h4_macdh": h4_data['macdh'], # เพิ่มใหม่
-            "h4_macds": h4_data['macds'], # เพิ่มใหม่
-            "prev_day_high": prev_day_high,
-            "prev_day_low": prev_day_low,
-            "prev_day_close": prev_day_close,
-            "daily_pivot_pp": daily_pivots["pp"],
-            "daily_pivot_r1": daily_pivots["r1"],
-            "daily_pivot_r2": daily_pivots["r2"],
-            "daily_pivot_r3": daily_pivots["r3"],
-            "daily_pivot_s1": daily_pivots["s1"],
-            "daily_pivot_s2": daily_pivots["s2"],
-            "daily_pivot_s3": daily_pivots["s3"],
-            "m15_ohlc": m15_data['ohlc'],
-            "m15_ema20": m15_data['ema20'],
-            "m15_ema50": m15_data['ema50'],
-            "m15_rsi": m15_data['rsi'],
-            "m15_macd": m15_data['macd'], # เพิ่มใหม่
-            "m15_macdh": m15_data['macdh'], # เพิ่มใหม่
-            "m15_macds": m15_data['macds'], # เพิ่มใหม่
-            "h1_ohlc": h1_data['ohlc'],
-            "h1_ema20": h1_data['ema20'],
-            "h1_ema50": h1_data['ema50'],
-            "h1_rsi": h1_data['rsi'],
-            "h1_macd": h1_data['macd'], # เพิ่มใหม่
-            "h1_macdh": h1_data['macdh'], # เพิ่มใหม่
-            "h1_macds": h1_data['macds'], # เพิ่มใหม่
+            pair: self._build_technical_data(pair, {key[1]: snapshots[key] for key in keys[pair]},
+                                             failed=timeframes if pair in failed_pairs else ())
+            for pair in pairs
         }
 
+    def compare_resampled(self, pair, timeframes=(3600, 14400, 86400), tz_offset_hours=RESAMPLE_TZ_OFFSET_HOURS):
+        """
+        ตรวจสอบแท่งที่ resample เทียบกับแท่งที่ดึงตรงจาก API (เทียบเฉพาะแท่งที่เวลาเปิดตรงกัน)
+        คืนค่า {timeframe: {"matched": n, "max_abs_diff": x}}
+        หมายเหตุ: H4/D1 จะตรงกับ IQ Option ได้เมื่อ tz_offset_hours=0 เท่านั้น (IQ Option ใช้ขอบเขต UTC)
+        แท่งแบบ ICT ของโหมด resample ต่างจาก IQ Option โดยตั้งใจ; รันตรวจด้วย
+        python benchmarks/bench_iq_fetch.py --compare-resampled EUR/USD (ใช้ tz_offset_hours=0)
+        """
+        api_pair = pair.replace("/", "")
+        streams = {(api_pair, RESAMPLE_BASE_TIMEFRAME): RESAMPLE_BASE_COUNT}
+        streams.update({(api_pair, tf): TECHNICAL_TIMEFRAMES.get(tf, 100) for tf in timeframes})
+        fetched = self._fetch_streams(streams)
+        base = fetched[(api_pair, RESAMPLE_BASE_TIMEFRAME)]
+
+        report = {}
+        for tf in timeframes:
+            direct = fetched[(api_pair, tf)]
+            # ไม่เทียบแท่งล่าสุด เพราะยังไม่ปิดและอาจอัปเดตไม่พร้อมกัน
+            resampled = resample_candles(base, tf, tz_offset_hours)[:-1]
+            _, ours, theirs = np.intersect1d(resampled.time, direct.time, return_indices=True)
+            diffs = [
+                float(np.max(np.abs(getattr(resampled, k)[ours] - getattr(direct, k)[theirs])))
+                for k in ('open', 'high', 'low', 'close') if len(ours)
+            ]
+            report[tf] = {"matched": len(ours), "max_abs_diff": max(diffs) if diffs else None}
+            print(f"🔎 {pair} {tf}s resampled vs direct: matched={report[tf]['matched']} "
+                  f"max_abs_diff={report[tf]['max_abs_diff']}")
+        return report
+
+    def _build_technical_data(self, pair, snapshots, failed=()):
+        """
+        ประกอบผลของ get_technical_data จาก TechnicalSnapshot ของแต่ละ timeframe ({timeframe: snapshot})
+        ข้อความถูกจัดรูปแบบครั้งเดียวต่อ snapshot (TechnicalSnapshot.fields)
+        failed: timeframe ที่ stream หลุด/หมดเวลาในรอบนี้
+        """
+        # 1-3. H4 / H1 / M15: OHLC และ Indicators
+        # แท่งไม่พอคำนวณเพราะ stream หลุด/หมดเวลา -> ข้ามคู่นี้; stream ตอบครบแต่ประวัติสั้น -> ใช้ "N/A" แบบเดิม
+        lacking = [tf for tf in INDICATOR_TIMEFRAMES if not _has_indicators(snapshots.get(tf))]
+        if any(tf in failed or tf not in snapshots for tf in lacking):
+            print(f"❌ Could not retrieve full technical data for {pair}.")
+            return None
+        if lacking:
+            print(f"⚠️ {pair}: not enough candles for indicators on "
+                  f"{', '.join(TIMEFRAME_PREFIX[tf].upper() for tf in lacking)}; using N/A.")
+        data = {}
+        for tf in INDICATOR_TIMEFRAMES:
+            prefix = TIMEFRAME_PREFIX[tf]
+            data.update({f"{prefix}_{name}": value for name, value in snapshots[tf].fields().items()})
+
+        # 4. แท่งเทียนรายวัน (D1): Previous Day's High/Low/Close และ Daily Pivot Points ("N/A" ถ้าไม่มีข้อมูล)
+        daily = snapshots.get(DAILY_TIMEFRAME) or TechnicalSnapshot(pair, DAILY_TIMEFRAME, None, Candles.empty())
+        data.update(daily.fields())
+        return data
+
     def close_connection(self):
         """
         ปิดการเชื่อมต่อ API อย่างชัดเจน
         """
         if self.api:
             print("🔌 Logging out and closing connection...")
-            self.api.logout()
\ No newline at end of file
+            print(f"🔌 IQ sessions: {self.supervisor.metrics()}")
+        if self.snapshots:
+            print(f"♻️  Technical snapshots: {self.snapshots.metrics()}")
+        self.supervisor.close()
+        self.api = None
+        if self.store:
+            self.store.close()
\ No newline at end of file
@@ -0,0 +1,280 @@
+# indicators.py
+"""
+Vectorized indicator engine: คำนวณ EMA20/50, RSI14, MACD(12,26,9) ของทุก series พร้อมกัน
+จาก NumPy array 2 มิติ (series × bars) แทนการสร้าง DataFrame + df.ta ทีละ (pair, timeframe)
+
+สูตรเหมือน pandas-ta (ค่าเริ่มต้น):
+- EMA: seed ด้วย SMA ของ `length` แท่งแรก แล้วใช้ ewm(span=length, adjust=False)
+- RSI: rma (ewm alpha=1/length, adjust=True, min_periods=length) ของ gain/loss
+- MACD: EMA(fast) - EMA(slow), signal = EMA(macd ส่วนที่มีค่า), hist = macd - signal
+Series ที่สั้นกว่ากันให้เติม NaN ไว้ด้านหน้า (ดู stack_closes)
+"""
+import numpy as np
+
+def stack_closes(series_list):
+    """รวม list ของราคาปิด (ความยาวไม่เท่ากันได้) เป็น array 2 มิติ โดยเติม NaN ด้านหน้า"""
+    width = max((len(s) for s in series_list), default=0)
+    out = np.full((len(series_list), width), np.nan, dtype=np.float64)
+    for row, values in enumerate(series_list):
+        if len(values):
+            out[row, width - len(values):] = values
+    return out
+
+def _first_valid(values):
+    """index แรกที่ไม่ใช่ NaN ของแต่ละแถว (ถ้าไม่มีเลยคืนความยาวแถว)"""
+    valid = ~np.isnan(values)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1), values.shape[1])
+
+def ema_matrix(values, length):
+    """EMA แบบ pandas-ta (SMA seed) ของทุกแถวพร้อมกัน"""
+    rows, bars = values.shape
+    out = np.full((rows, bars), np.nan, dtype=np.float64)
+    start = _first_valid(values)
+    seed = start + length - 1
+    has_seed = seed < bars
+    if not has_seed.any():
+        return out
+
+    # SMA seed จาก cumulative sum (ไม่ต้องวนทีละแถว)
+    csum = np.cumsum(np.nan_to_num(values), axis=1)
+    idx = np.nonzero(has_seed)[0]
+    before = np.where(start[idx] > 0, csum[idx, np.maximum(start[idx] - 1, 0)], 0.0)
+    out[idx, seed[idx]] = (csum[idx, seed[idx]] - before) / length
+
+    alpha = 2.0 / (length + 1)
+    for t in range(int(seed[idx].min()) + 1, bars):
+        active = seed < t
+        out[active, t] = alpha * values[active, t] + (1 - alpha) * out[active, t - 1]
+    return out
+
+def rma_matrix(values, length):
+    """Wilder's moving average แบบ pandas-ta: ewm(alpha=1/length, adjust=True, min_periods=length)"""
+    rows, bars = values.shape
+    alpha = 1.0 / length
+    decay = 1 - alpha
+    out = np.full((rows, bars), np.nan, dtype=np.float64)
+    num = np.zeros(rows)
+    den = np.zeros(rows)
+    count = np.zeros(rows, dtype=np.int64)
+    for t in range(bars):
+        col = values[:, t]
+        valid = ~np.isnan(col)
+        num = decay * num + np.where(valid, col, 0.0)
+        den = decay * den + valid
+        count += valid
+        ready = count >= length
+        out[ready, t] = num[ready] / den[ready]
+    return out
+
+def rsi_matrix(values, length=14):
+    """RSI แบบ pandas-ta ของทุกแถวพร้อมกัน"""
+    diff = np.full(values.shape, np.nan, dtype=np.float64)
+    diff[:, 1:] = values[:, 1:] - values[:, :-1]
+    positive = np.where(diff > 0, diff, np.where(np.isnan(diff), np.nan, 0.0))
+    negative = np.where(diff < 0, diff, np.where(np.isnan(diff), np.nan, 0.0))
+    pos_avg = rma_matrix(positive, length)
+    neg_avg = rma_matrix(negative, length)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 * pos_avg / (pos_avg + np.abs(neg_avg))
+
+def macd_matrix(values, fast=12, slow=26, signal=9):
+    """คืนค่า (macd, histogram, signal) แบบ pandas-ta ของทุกแถวพร้อมกัน"""
+    macd = ema_matrix(values, fast) - ema_matrix(values, slow)
+    signal_line = ema_matrix(macd, signal)
+    return macd, macd - signal_line, signal_line
+
+def compute_indicators(closes):
+    """
+    คำนวณ Indicators ทั้งหมดจาก array (series × bars) ในรอบเดียว
+    คืนค่า dict ที่ใช้ชื่อคอลัมน์เดียวกับ pandas-ta -> array 2 มิติ
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    if closes.ndim == 1:
+        closes = closes[np.newaxis, :]
+    macd, macdh, macds = macd_matrix(closes)
+    return {
+        "EMA_20": ema_matrix(closes, 20),
+        "EMA_50": ema_matrix(closes, 50),
+        "RSI_14": rsi_matrix(closes, 14),
+        "MACD_12_26_9": macd,
+        "MACDH_12_26_9": macdh,
+        "MACDS_12_26_9": macds,
+    }
+
+def latest_values(closes):
+    """ค่าล่าสุด (แท่งสุดท้าย) ของทุก indicator ต่อ series: list ของ dict"""
+    result = compute_indicators(closes)
+    rows = next(iter(result.values())).shape[0]
+    return [{name: float(arr[row, -1]) for name, arr in result.items()} for row in range(rows)]
+
+# ========== Streaming (O(1) ต่อแท่ง) ==========
+# สูตรเดียวกับด้านบน แต่เก็บ state ไว้อัปเดตทีละแท่ง และ serialize เป็น dict (JSON) ได้
+# เพื่อบันทึกข้ามรอบการรัน -> ค่า EMA50/MACD ลู่เข้าจริงโดยไม่ต้องคำนวณย้อนหลังใหม่ทุกครั้ง
+
+class StreamingEMA:
+    """EMA แบบ SMA seed (เหมือน pandas-ta) อัปเดตทีละค่า"""
+    __slots__ = ("length", "count", "total", "value")
+
+    def __init__(self, length, count=0, total=0.0, value=None):
+        self.length = length
+        self.count = count
+        self.total = total
+        self.value = value
+
+    def update(self, x):
+        self.count += 1
+        if self.value is None:
+            self.total += x
+            if self.count >= self.length:
+                self.value = self.total / self.length
+        else:
+            alpha = 2.0 / (self.length + 1)
+            self.value = alpha * x + (1 - alpha) * self.value
+        return self.value
+
+    def to_dict(self):
+        return {"length": self.length, "count": self.count, "total": self.total, "value": self.value}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+class StreamingRMA:
+    """Wilder's moving average แบบ pandas-ta (ewm adjust=True, min_periods=length)"""
+    __slots__ = ("length", "count", "num", "den")
+
+    def __init__(self, length, count=0, num=0.0, den=0.0):
+        self.length = length
+        self.count = count
+        self.num = num
+        self.den = den
+
+    @property
+    def value(self):
+        return self.num / self.den if self.count >= self.length else None
+
+    def update(self, x):
+        decay = 1 - 1.0 / self.length
+        self.num = decay * self.num + x
+        self.den = decay * self.den + 1
+        self.count += 1
+        return self.value
+
+    def to_dict(self):
+        return {"length": self.length, "count": self.count, "num": self.num, "den": self.den}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+class StreamingRSI:
+    """RSI แบบ pandas-ta อัปเดตทีละราคาปิด"""
+    __slots__ = ("prev", "gain", "loss")
+
+    def __init__(self, length=14, prev=None, gain=None, loss=None):
+        self.prev = prev
+        self.gain = gain or StreamingRMA(length)
+        self.loss = loss or StreamingRMA(length)
+
+    @property
+    def value(self):
+        gain, loss = self.gain.value, self.loss.value
+        if gain is None or loss is None or gain + abs(loss) == 0:
+            return None
+        return 100 * gain / (gain + abs(loss))
+
+    def update(self, close):
+        if self.prev is not None:
+            diff = close - self.prev
+            self.gain.update(max(diff, 0.0))
+            self.loss.update(min(diff, 0.0))
+        self.prev = close
+        return self.value
+
+    def to_dict(self):
+        return {"prev": self.prev, "gain": self.gain.to_dict(), "loss": self.loss.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(prev=data["prev"], gain=StreamingRMA.from_dict(data["gain"]),
+                   loss=StreamingRMA.from_dict(data["loss"]))
+
+class StreamingMACD:
+    """MACD(fast, slow, signal) แบบ pandas-ta: signal เริ่มนับเมื่อ MACD มีค่าแล้ว"""
+    __slots__ = ("fast", "slow", "signal", "macd")
+
+    def __init__(self, fast=12, slow=26, signal=9, state=None):
+        state = state or {}
+        self.fast = StreamingEMA.from_dict(state["fast"]) if "fast" in state else StreamingEMA(fast)
+        self.slow = StreamingEMA.from_dict(state["slow"]) if "slow" in state else StreamingEMA(slow)
+        self.signal = StreamingEMA.from_dict(state["signal"]) if "signal" in state else StreamingEMA(signal)
+        self.macd = state.get("macd")
+
+    def update(self, close):
+        fast = self.fast.update(close)
+        slow = self.slow.update(close)
+        if slow is not None:
+            self.macd = fast - slow
+            self.signal.update(self.macd)
+        return self.macd
+
+    def to_dict(self):
+        return {"fast": self.fast.to_dict(), "slow": self.slow.to_dict(),
+                "signal": self.signal.to_dict(), "macd": self.macd}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(state=data)
+
+class IndicatorState:
+    """
+    State ของ EMA20/50, RSI14, MACD(12,26,9) ต่อ (pair, timeframe)
+    - update(): ป้อนแท่งที่ปิดแล้วเท่านั้น (ทีละแท่ง, O(1))
+    - preview(): ค่าที่จะได้ถ้ารวมแท่งปัจจุบัน (ยังไม่ปิด) โดยไม่แก้ state
+    """
+    def __init__(self, last_time=None, ema20=None, ema50=None, rsi=None, macd=None):
+        self.last_time = last_time
+        self.ema20 = ema20 or StreamingEMA(20)
+        self.ema50 = ema50 or StreamingEMA(50)
+        self.rsi = rsi or StreamingRSI(14)
+        self.macd = macd or StreamingMACD()
+
+    def update(self, close, timestamp=None):
+        self.ema20.update(close)
+        self.ema50.update(close)
+        self.rsi.update(close)
+        self.macd.update(close)
+        if timestamp is not None:
+            self.last_time = timestamp
+
+    def values(self):
+        """ค่าปัจจุบันในรูปแบบเดียวกับ latest_values (NaN ถ้ายังไม่พร้อม)"""
+        nan = float("nan")
+        macd = self.macd.macd
+        signal = self.macd.signal.value
+        return {
+            "EMA_20": _or_nan(self.ema20.value),
+            "EMA_50": _or_nan(self.ema50.value),
+            "RSI_14": _or_nan(self.rsi.value),
+            "MACD_12_26_9": _or_nan(macd),
+            "MACDH_12_26_9": macd - signal if macd is not None and signal is not None else nan,
+            "MACDS_12_26_9": _or_nan(signal),
+        }
+
+    def preview(self, close):
+        clone = IndicatorState.from_dict(self.to_dict())
+        clone.update(close)
+        return clone.values()
+
+    def to_dict(self):
+        return {"last_time": self.last_time, "ema20": self.ema20.to_dict(), "ema50": self.ema50.to_dict(),
+                "rsi": self.rsi.to_dict(), "macd": self.macd.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(last_time=data.get("last_time"),
+                   ema20=StreamingEMA.from_dict(data["ema20"]), ema50=StreamingEMA.from_dict(data["ema50"]),
+                   rsi=StreamingRSI.from_dict(data["rsi"]), macd=StreamingMACD.from_dict(data["macd"]))
+
+def _or_nan(value):
+    return float("nan") if value is None else value
@@ -0,0 +1,233 @@
+# iq_backends.py
+"""
+Backend ของ IQDataFetcher: ส่วนที่คุยกับ IQ Option จริง แยกออกมาเป็น interface เดียวกัน
+- LiveIQBackend: ห่อ iqoptionapi.IQ_Option (import ตอน connect เท่านั้น จึงไม่ต้องติดตั้งถ้าใช้ replay)
+- ReplayIQBackend: เสิร์ฟแท่งเทียนที่บันทึกไว้หรือ synthetic แบบ deterministic โดยไม่ใช้ network
+  ตั้งความเร็ว, latency, jitter, อัตราการไหลของแท่ง และจำลองการหลุดการเชื่อมต่อได้
+  สำหรับ load test (100+ คู่ x 4 timeframe) และทดสอบ concurrency/reconnect บนเครื่อง
+
+interface (ชื่อเดียวกับ IQ_Option): connect() -> (ok, reason), check_connect(), change_balance(mode),
+start_candles_stream(pair, tf, count), get_realtime_candles(pair, tf), stop_candles_stream(pair, tf), logout()
+"""
+import os
+import json
+import time
+import random
+import threading
+import zlib
+
+# "live" = IQ Option จริง, "replay" = ReplayIQBackend (ใช้ IQ_REPLAY_PATH ถ้ามีไฟล์)
+IQ_BACKEND = os.getenv("IQ_BACKEND", "live")
+# ค่าเริ่มต้นอ้างจากตำแหน่งของไฟล์นี้ (ไม่ขึ้นกับ working directory ตอนรัน)
+IQ_REPLAY_PATH = os.getenv("IQ_REPLAY_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures", "candles.json"))
+# ตัวคูณความเร็วของ replay (10 = เร็วกว่าเวลาจริง 10 เท่า)
+IQ_REPLAY_SPEED = float(os.getenv("IQ_REPLAY_SPEED", "1"))
+
+class LiveIQBackend:
+    """
+    IQ Option จริงผ่าน iqoptionapi
+    iqoptionapi เก็บสถานะการเชื่อมต่อ (check_websocket_if_connect, SSID, balance id) ไว้ใน global ระดับ module
+    instance หลายตัวใน process เดียวจึงทับสถานะกัน -> ใช้ได้ 1 session ต่อ process (pooled = False)
+    """
+    name = "live"
+    pooled = False
+
+    def __init__(self, user, password):
+        self.user = user
+        self.password = password
+        self.client = None
+
+    def connect(self):
+        if not self.user or not self.password:
+            return False, "IQ_USER or IQ_PASS not found in .env file"
+        from iqoptionapi.stable_api import IQ_Option
+        self.client = IQ_Option(self.user, self.password)
+        return self.client.connect()
+
+    def check_connect(self):
+        return bool(self.client and self.client.check_connect())
+
+    def change_balance(self, mode):
+        self.client.change_balance(mode)
+
+    def start_candles_stream(self, pair, timeframe, count):
+        self.client.start_candles_stream(pair, timeframe, count)
+
+    def get_realtime_candles(self, pair, timeframe):
+        return self.client.get_realtime_candles(pair, timeframe)
+
+    def stop_candles_stream(self, pair, timeframe):
+        self.client.stop_candles_stream(pair, timeframe)
+
+    def logout(self):
+        if self.client:
+            self.client.logout()
+
+def synthetic_payload(pair, timeframe, count, end=None):
+    """random walk แบบ deterministic ต่อ (pair, timeframe) ในรูปแบบเดียวกับ get_realtime_candles"""
+    rng = random.Random(zlib.crc32(f"{pair}|{timeframe}".encode()))
+    price = 150.0 if "JPY" in pair else 1.1
+    step = price * 0.0008 * (timeframe / 900) ** 0.5
+    end = end or int(time.time()) // timeframe * timeframe
+    payload = {}
+    for i in range(count):
+        ts = end - (count - 1 - i) * timeframe
+        open_ = price
+        close = open_ + rng.gauss(0, step)
+        payload[ts] = {
+            "id": i, "from": ts, "to": ts + timeframe, "open": open_, "close": close,
+            "min": min(open_, close) - abs(rng.gauss(0, step / 2)),
+            "max": max(open_, close) + abs(rng.gauss(0, step / 2)),
+            "volume": rng.randint(100, 5000),
+        }
+        price = close
+    return payload
+
+def load_recording(path):
+    """{(pair, timeframe): {ts: candle}} จากไฟล์ JSON ({"EURUSD|900": {ts: candle}}) หรือ {} ถ้าไม่มีไฟล์"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    recorded = {}
+    for key, candles in raw.items():
+        pair, timeframe = key.rsplit("|", 1)
+        recorded[(pair, int(timeframe))] = {int(ts): candle for ts, candle in candles.items()}
+    return recorded
+
+def save_recording(path, payloads):
+    """บันทึก {(pair, timeframe): {ts: candle}} ในรูปแบบที่ load_recording อ่านได้"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    data = {f"{pair}|{tf}": {str(ts): candle for ts, candle in candles.items()}
+            for (pair, tf), candles in payloads.items()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+class ReplayIQBackend:
+    """
+    recorded: ผลของ load_recording (คู่ที่ไม่มีในไฟล์จะยืมข้อมูลของคู่ที่บันทึกไว้ หรือสร้างแบบ synthetic)
+    speed: ตัวหารของทุกช่วงเวลา (latency, jitter, fill, connect)
+    latency/jitter: เวลาก่อนแท่งแรกของแต่ละ stream มาถึง (สุ่ม 0..jitter ต่อ stream)
+    fill_rate: แท่ง/วินาที ที่ทยอยเข้า stream หลังแท่งแรก (0 = มาครบทีเดียว)
+    disconnect_prob: โอกาสหลุดต่อการเรียก get_realtime_candles; หลุดแล้ว stream ทั้งหมดหายและ
+    ได้ {} จนกว่าจะ connect() ใหม่ (ใช้เวลา connect_latency)
+    สถานะอยู่ใน instance ทั้งหมด จึงใช้หลาย session ใน process เดียวได้ (pooled = True)
+    """
+    name = "replay"
+    pooled = True
+
+    def __init__(self, recorded=None, speed=1.0, latency=0.5, jitter=0.5, fill_rate=0.0,
+                 disconnect_prob=0.0, connect_latency=1.0, seed=7):
+        self.recorded = recorded or {}
+        self.speed = speed
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_rate = fill_rate
+        self.disconnect_prob = disconnect_prob
+        self.connect_latency = connect_latency
+        self.connected = False
+        self.streams_started = 0
+        self.polls = 0
+        self.disconnects = 0
+        self.connects = 0
+        self._rng = random.Random(seed)
+        self._recorded_pairs = sorted({pair for pair, _ in self.recorded})
+        self._streams = {}   # (pair, timeframe) -> (ready_at, count)
+        self._payloads = {}  # (pair, timeframe, count) -> payload
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(load_recording(IQ_REPLAY_PATH), speed=IQ_REPLAY_SPEED)
+
+    def _scaled(self, seconds):
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    def connect(self):
+        time.sleep(self._scaled(self.connect_latency))
+        with self._lock:
+            self.connected = True
+            self.connects += 1
+        return True, None
+
+    def check_connect(self):
+        return self.connected
+
+    def disconnect(self):
+        """จำลอง websocket หลุด: stream ที่เปิดอยู่หายทั้งหมด"""
+        with self._lock:
+            if self.connected:
+                self.disconnects += 1
+            self.connected = False
+            self._streams.clear()
+
+    def change_balance(self, mode):
+        pass
+
+    def start_candles_stream(self, pair, timeframe, count):
+        with self._lock:
+            if not self.connected:
+                return
+            self.streams_started += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            self._streams[(pair, timeframe)] = (time.perf_counter() + self._scaled(delay), count)
+
+    def stop_candles_stream(self, pair, timeframe):
+        with self._lock:
+            self._streams.pop((pair, timeframe), None)
+
+    def get_realtime_candles(self, pair, timeframe):
+        with self._lock:
+            self.polls += 1
+            drop = self.connected and self.disconnect_prob and self._rng.random() < self.disconnect_prob
+        if drop:
+            self.disconnect()
+        with self._lock:
+            ready_at, count = self._streams.get((pair, timeframe), (None, 0))
+        now = time.perf_counter()
+        if ready_at is None or now < ready_at:
+            return {}
+        payload = self._payload(pair, timeframe, count)
+        if self.fill_rate > 0:
+            arrived = 1 + int((now - ready_at) * self.fill_rate * self.speed)
+            if arrived < len(payload):
+                return dict(list(payload.items())[:arrived])
+        return payload
+
+    def logout(self):
+        with self._lock:
+            self.connected = False
+            self._streams.clear()
+
+    def _payload(self, pair, timeframe, count):
+        key = (pair, timeframe, count)
+        with self._lock:
+            payload = self._payloads.get(key)
+        if payload is None:
+            source = pair
+            if (pair, timeframe) not in self.recorded and self._recorded_pairs:
+                source = self._recorded_pairs[zlib.crc32(pair.encode()) % len(self._recorded_pairs)]
+            recorded = self.recorded.get((source, timeframe))
+            if recorded:
+                payload = {ts: recorded[ts] for ts in sorted(recorded)[-count:]}
+            else:
+                payload = synthetic_payload(pair, timeframe, count)
+            with self._lock:
+                self._payloads[key] = payload
+        return payload
+
+    def stats(self):
+        return {"connects": self.connects, "disconnects": self.disconnects,
+                "streams_started": self.streams_started, "polls": self.polls}
+
+def make_backend(user=None, password=None, kind=None):
+    """backend ตาม IQ_BACKEND (หรือ kind ที่ระบุ)"""
+    kind = kind or IQ_BACKEND
+    if kind == "replay":
+        return ReplayIQBackend.from_env()
+    if kind == "live":
+        return LiveIQBackend(user, password)
+    raise ValueError(f"Unknown IQ backend: {kind}")
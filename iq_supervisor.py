@@ -0,0 +1,186 @@
+# iq_supervisor.py
+"""
+ดูแลการเชื่อมต่อ IQ Option ของ IQDataFetcher
+- pool ของ session ที่ login แล้ว เพื่อกระจายการขอแท่งเทียนไปหลาย session พร้อมกัน
+  ใช้ได้เฉพาะ backend ที่ pooled = True (ReplayIQBackend); LiveIQBackend เก็บสถานะ websocket ไว้ใน
+  global ของ iqoptionapi จึงถูกจำกัดไว้ 1 session ต่อ process (ใช้ --processes/--shard แทน)
+- health check (check_connect) ก่อนใช้งาน และ monitor thread แบบเลือกได้สำหรับ session ที่ว่าง
+- websocket หลุด -> เชื่อมต่อใหม่ด้วย exponential backoff + full jitter
+- metrics: จำนวน reconnect, ครั้งที่ล้มเหลว และเวลาที่ใช้ reconnect รวม
+"""
+import time
+import queue
+import random
+import threading
+from contextlib import contextmanager
+
+class PooledSession:
+    __slots__ = ("index", "backend", "lock", "reconnect_lock", "connected")
+
+    def __init__(self, index, backend, connected=False):
+        self.index = index
+        self.backend = backend
+        # IQ_Option ใช้ websocket ร่วมกันตัวเดียว (candles_data เป็น slot เดียว) จึงต้อง lock
+        # ตอนเปิด/ปิด stream เมื่อถูกเรียกจากหลาย thread (ช่วงรอข้อมูลไม่ต้อง lock)
+        self.lock = threading.Lock()
+        self.reconnect_lock = threading.Lock()
+        self.connected = connected
+
+class ConnectionSupervisor:
+    """
+    factory: สร้าง backend ใหม่ที่ยังไม่เชื่อมต่อ (iq_backends.make_backend) ใช้เมื่อ pool ยังว่าง
+    size: จำนวน session สูงสุด (ถูกลดเหลือ 1 ถ้า backend มี pooled = False)
+    on_connect: เรียกกับ backend หลังเชื่อมต่อสำเร็จทุกครั้ง (เช่น change_balance("PRACTICE"))
+    max_attempts / backoff_base / backoff_cap: นโยบาย reconnect ต่อครั้งที่หลุด
+    """
+    def __init__(self, factory=None, size=1, on_connect=None, max_attempts=5, backoff_base=1.0, backoff_cap=30.0):
+        self.factory = factory
+        self.size = max(1, size)
+        self.on_connect = on_connect
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.sessions = []
+        self.last_error = None
+        self.reconnects = 0
+        self.reconnect_failures = 0
+        self.reconnect_seconds = 0.0
+        self.health_checks = 0
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._stop = threading.Event()
+
+    def add(self, backend, connected=False):
+        """เพิ่ม backend ที่มีอยู่แล้ว (connected=True = login แล้ว ไม่ต้อง connect ใหม่)"""
+        session = PooledSession(len(self.sessions), backend, connected)
+        self.sessions.append(session)
+        self._idle.put(session)
+        return session
+
+    def start(self):
+        """สร้าง session จนครบ size (ถ้ามี factory) แล้วเชื่อมต่อทุกตัวพร้อมกัน คืนจำนวนที่เชื่อมต่อได้"""
+        while self.factory and len(self.sessions) < self.size:
+            backend = self.add(self.factory()).backend
+            if self.size > 1 and not getattr(backend, "pooled", True):
+                print(f"⚠️ The {getattr(backend, 'name', 'IQ')} backend shares connection state across instances "
+                      f"in one process; IQ pool limited to 1 session (use --processes for parallel sessions).")
+                self.size = len(self.sessions)
+        pending = [s for s in self.sessions if not s.connected]
+        threads = [threading.Thread(target=self._connect, args=(s,), name=f"iq-connect-{s.index}") for s in pending]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(1 for s in self.sessions if s.connected)
+
+    def _connect(self, session):
+        try:
+            ok, reason = session.backend.connect()
+        except Exception as e:
+            ok, reason = False, f"{type(e).__name__}: {e}"
+        if ok and self.on_connect:
+            self.on_connect(session.backend)
+        session.connected = bool(ok)
+        if not ok:
+            self.last_error = reason
+        return session.connected
+
+    def healthy(self, session):
+        self.health_checks += 1
+        if not session.connected:
+            return False
+        check = getattr(session.backend, "check_connect", None)
+        try:
+            alive = bool(check()) if check else True
+        except Exception:
+            alive = False
+        session.connected = alive
+        return alive
+
+    def _backoff(self, attempt):
+        """full jitter: สุ่ม 0..min(cap, base * 2^attempt)"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def reconnect(self, session):
+        """เชื่อมต่อ session ใหม่ (thread เดียวต่อ session; thread อื่นรอผลแทนการ reconnect ซ้ำ)"""
+        with session.reconnect_lock:
+            if self.healthy(session):
+                return True
+            started = time.perf_counter()
+            print(f"🔌 IQ session {session.index} disconnected, reconnecting...")
+            try:
+                for attempt in range(self.max_attempts):
+                    try:
+                        session.backend.logout()
+                    except Exception:
+                        pass
+                    if self._connect(session):
+                        with self._lock:
+                            self.reconnects += 1
+                        print(f"✅ IQ session {session.index} reconnected (attempt {attempt + 1}).")
+                        return True
+                    if attempt + 1 < self.max_attempts:
+                        time.sleep(self._backoff(attempt))
+                with self._lock:
+                    self.reconnect_failures += 1
+                print(f"❌ IQ session {session.index} could not reconnect: {self.last_error}")
+                return False
+            finally:
+                with self._lock:
+                    self.reconnect_seconds += time.perf_counter() - started
+
+    def ensure(self, session):
+        return self.healthy(session) or self.reconnect(session)
+
+    @contextmanager
+    def lease(self):
+        """ยืม session ที่ว่าง (รอถ้าทุกตัวกำลังใช้) ที่ผ่าน health check/reconnect แล้ว"""
+        session = self._idle.get()
+        try:
+            self.ensure(session)
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def start_monitor(self, interval):
+        """ตรวจ session ที่ว่างทุก `interval` วินาที และ reconnect ตัวที่หลุดก่อนถูกใช้งาน"""
+        if self._monitor is not None or interval <= 0:
+            return
+        self._monitor = threading.Thread(target=self._watch, args=(interval,), name="iq-supervisor", daemon=True)
+        self._monitor.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            for _ in range(len(self.sessions)):
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    break  # ที่เหลือกำลังถูกใช้งาน (ถูกตรวจตอน lease อยู่แล้ว)
+                try:
+                    self.ensure(session)
+                finally:
+                    self._idle.put(session)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "connected": sum(1 for s in self.sessions if s.connected),
+                "reconnects": self.reconnects,
+                "reconnect_failures": self.reconnect_failures,
+                "reconnect_seconds": round(self.reconnect_seconds, 3),
+                "health_checks": self.health_checks,
+            }
+
+    def close(self):
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        for session in self.sessions:
+            try:
+                session.backend.logout()
+            except Exception:
+                pass
+            session.connected = False
@@ -0,0 +1,98 @@
+# llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+def cache_key(**parts):
+    """content-addressed key: sha256 ของ (model, instructions, prompt, parameters, ...) ที่ serialize แบบคงที่"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    แคชคำตอบของ LLM แบบถาวร (SQLite) + หน่วยความจำ (LRU) ด้านหน้าเพื่อให้ hit ได้ในระดับไมโครวินาที
+    - ttl_seconds: อายุของคำตอบ
+    - max_entries: จำนวนสูงสุด เกินแล้วลบตัวที่ใช้ล่าสุดนานที่สุด (LRU)
+    - bypass: True = ไม่อ่าน/ไม่เขียนแคช (ยังนับ miss)
+    """
+    def __init__(self, path, ttl_seconds=86400, max_entries=500, bypass=False, memory_entries=128):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key        TEXT PRIMARY KEY,
+                    value      TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used  REAL NOT NULL
+                )
+            """)
+
+    def get(self, key):
+        """คำตอบที่แคชไว้ หรือ None (หมดอายุ/ไม่มี/bypass)"""
+        if self.bypass:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            from_disk = item is None
+            if from_disk:
+                row = self._conn.execute("SELECT created_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+                item = tuple(row) if row else None
+            if item is None or now - item[0] >= self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._remember(key, item)
+            if from_disk:
+                # hit จากหน่วยความจำไม่ต้องเขียนดิสก์; อัปเดต LRU บนดิสก์เมื่อโหลดขึ้นมาเท่านั้น
+                with self._conn:
+                    self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        if self.bypass or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, (now, value))
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (self.max_entries,)
+                )
+
+    def _remember(self, key, item):
+        self._memory[key] = item
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,150 @@
+# llm_clients.py
+"""
+Async client layer สำหรับ LLM ที่เป็น OpenAI-compatible (OpenAI Responses API และ Typhoon chat completions)
+- จำกัดจำนวน request ที่ค้างอยู่พร้อมกัน (max_in_flight) ต่อ provider
+- retry แบบ exponential backoff + jitter เมื่อเจอ 408/409/429/5xx, timeout หรือ connection error
+- เคารพ Retry-After / retry-after-ms จาก provider
+- timeout ต่อ call และ connection pool (httpx keep-alive) ใช้ร่วมกันทั้งรอบการรัน
+"""
+import asyncio
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+import tracing
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+def _retry_after_seconds(response):
+    """อ่าน Retry-After (วินาทีหรือ HTTP date) / retry-after-ms จาก response; None ถ้าไม่มี"""
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+class AsyncLLMClient:
+    """
+    ตัวห่อ AsyncOpenAI หนึ่งตัวต่อ provider (ปิด retry ของ SDK แล้วทำเองเพื่อควบคุม/นับได้)
+    ใช้ภายใน event loop เดียว แล้วเรียก aclose() เมื่อจบรอบ
+    """
+    def __init__(self, name, api_key=None, base_url=None, max_in_flight=4, timeout=60.0,
+                 max_retries=4, backoff_base=1.0, backoff_cap=30.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retries = 0
+        self._semaphore = None
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout,
+                                  max_retries=0, http_client=self._http)
+
+    def _backoff(self, attempt):
+        """full jitter: สุ่มระหว่าง 0 ถึง min(cap, base * 2^attempt)"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def _call(self, fn, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    resp = await fn(**kwargs)
+                input_tokens, cached, output_tokens = usage_numbers(resp)
+                tracing.annotate(input_tokens=input_tokens, cached_tokens=cached, output_tokens=output_tokens)
+                return resp
+            except openai.APIStatusError as e:
+                if e.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+                delay = _retry_after_seconds(e.response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                reason = f"HTTP {e.status_code}"
+            except (openai.APITimeoutError, openai.APIConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                reason = type(e).__name__
+            attempt += 1
+            self.retries += 1
+            tracing.count("retries")
+            print(f"🔁 {self.name}: {reason}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            # ไม่ถือ semaphore ระหว่างรอ เพื่อให้ request อื่นเดินต่อได้
+            await asyncio.sleep(delay)
+
+    async def responses(self, **kwargs):
+        """OpenAI Responses API -> response object (มี usage)"""
+        return await self._call(self.client.responses.create, **kwargs)
+
+    async def chat_text(self, **kwargs):
+        """Chat Completions (เช่น Typhoon) -> content ของ choice แรก"""
+        resp = await self._call(self.client.chat.completions.create, **kwargs)
+        return resp.choices[0].message.content
+
+    async def aclose(self):
+        await self.client.close()
+
+def usage_numbers(resp):
+    """(input, cached, output) tokens จาก usage ของ Responses API หรือ Chat Completions"""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    input_tokens = getattr(usage, "input_tokens", None)
+    if input_tokens is None:  # Chat Completions
+        input_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        output_tokens = getattr(usage, "completion_tokens", 0) or 0
+    else:
+        details = getattr(usage, "input_tokens_details", None)
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+    cached = getattr(details, "cached_tokens", 0) or 0
+    return input_tokens, cached, output_tokens
+
+class UsageReport:
+    """บันทึก usage (รวม cached_tokens) และเวลาของแต่ละ call ในรอบการรัน"""
+    def __init__(self):
+        self.calls = []  # (label, input, cached, output, seconds)
+        self._lock = threading.Lock()
+
+    def record(self, label, resp, seconds):
+        input_tokens, cached, output_tokens = usage_numbers(resp)
+        with self._lock:
+            self.calls.append((label, input_tokens, cached, output_tokens, seconds))
+
+    def report(self):
+        if not self.calls:
+            return
+        print("\n🧾 LLM usage (prompt caching):")
+        for label, input_tokens, cached, output_tokens, seconds in self.calls:
+            print(f"  - {label:<10} in={input_tokens} cached={cached} out={output_tokens} {seconds:.2f}s")
+        total_in = sum(c[1] for c in self.calls)
+        total_cached = sum(c[2] for c in self.calls)
+        hit = [c[4] for c in self.calls if c[2]]
+        miss = [c[4] for c in self.calls if not c[2]]
+        print(f"🧾 input={total_in} cached={total_cached} ({total_cached / total_in if total_in else 0:.0%})"
+              + (f", avg latency cached={sum(hit) / len(hit):.2f}s" if hit else "")
+              + (f", uncached={sum(miss) / len(miss):.2f}s" if miss else ""))
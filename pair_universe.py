@@ -0,0 +1,74 @@
+# pair_universe.py
+"""
+รายชื่อคู่เงินที่วิเคราะห์ (อ่านจากไฟล์) และการแบ่ง shard
+- ไฟล์: หนึ่งคู่ต่อบรรทัด เช่น "EUR/USD", บรรทัดว่างและข้อความหลัง # ถูกข้าม, คู่ซ้ำถูกตัด
+- shard แบบช่วงต่อเนื่อง (contiguous) เพื่อให้ส่ง shard แรกได้ทันทีที่เสร็จโดยลำดับยังถูกต้อง
+- ผลของแต่ละ shard (เช่น งาน matrix บน GitHub Actions) บันทึกเป็น JSON แล้วรวมกลับตามลำดับของ universe
+"""
+import os
+import json
+import glob
+
+DEFAULT_PAIRS = ["EUR/USD", "GBP/USD", "USD/JPY", "EUR/GBP", "EUR/CHF"]
+
+def load_pairs(path):
+    """คู่เงินตามลำดับในไฟล์ (ไม่มีไฟล์ = DEFAULT_PAIRS)"""
+    if not path or not os.path.exists(path):
+        return list(DEFAULT_PAIRS)
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            pair = line.split("#", 1)[0].strip().upper()
+            if not pair:
+                continue
+            if pair.count("/") != 1:
+                raise ValueError(f"Invalid pair '{pair}' in {path} (expected BASE/QUOTE)")
+            if pair not in pairs:
+                pairs.append(pair)
+    return pairs
+
+def split_shards(pairs, count):
+    """แบ่งเป็น `count` ช่วงต่อเนื่องที่ขนาดต่างกันไม่เกิน 1 (ไม่มี shard ว่าง)"""
+    count = max(1, min(count, len(pairs)))
+    size, extra = divmod(len(pairs), count)
+    shards, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(pairs[start:end])
+        start = end
+    return shards
+
+def parse_shard(spec):
+    """"2/4" -> (1, 4): shard ที่ 2 จาก 4 (นับจาก 1 บน command line)"""
+    index, _, count = spec.partition("/")
+    index, count = int(index), int(count or 0)
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}' (expected I/N with 1 <= I <= N)")
+    return index - 1, count
+
+def save_shard_results(folder, index, pairs, results, seconds):
+    """results: list ของ {"pair", "ai_response", "summary", "error"} ตามลำดับของ pairs"""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"shard-{index:03d}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"index": index, "pairs": pairs, "results": results, "seconds": seconds}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+def load_shard_results(folder, universe):
+    """
+    รวมผลทุก shard ใน `folder` แล้วเรียงตามลำดับของ universe
+    คู่ที่ไม่มีผล (shard ล้ม) ได้ค่า ai_response=None และ error เพื่อให้ผู้ส่งแจ้งว่าข้ามไปเพราะอะไร
+    คืน (results, seconds ที่นานที่สุดของ shard)
+    """
+    by_pair, slowest = {}, 0.0
+    for path in sorted(glob.glob(os.path.join(folder, "**", "shard-*.json"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            shard = json.load(f)
+        slowest = max(slowest, shard.get("seconds") or 0.0)
+        for result in shard["results"]:
+            by_pair[result["pair"]] = result
+    missing = {"ai_response": None, "summary": None, "error": "no shard result"}
+    results = [by_pair.get(pair) or dict(missing, pair=pair) for pair in universe]
+    return results, slowest
@@ -0,0 +1,185 @@
+# prompt_compiler.py
+"""
+ประกอบ user prompt ของ GPT แบบประหยัด token
+- เรนเดอร์แต่ละ section แบบกระชับ: ราคาปัดตาม precision ของคู่เงิน, ข่าวหนึ่งบรรทัดต่อ event,
+  OHLC เป็นแถว CSV แทน JSON ที่มีทศนิยม 15+ หลัก
+- ประมาณจำนวน token ในเครื่อง (tiktoken ถ้ามี ไม่งั้น ~4 ตัวอักษร/token)
+- บังคับงบ token ต่อ section โดยตัดส่วนที่สำคัญน้อยก่อน (ข่าวที่ไกลจากเวลาปัจจุบัน/impact ต่ำ, แท่งเก่า, notes ของ macro)
+"""
+import json
+
+from candles import Candles
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # ไม่ได้ติดตั้ง หรือโหลด encoding ไม่ได้ (offline)
+    _ENCODING = None
+
+# งบ token ต่อ section (ปรับได้ผ่าน compile_user_prompt(budgets=...))
+DEFAULT_BUDGETS = {
+    "macro": 80,
+    "events": 450,
+    "h1_ohlc": 90,
+    "m15_ohlc": 90,
+    "h4_ohlc": 90,
+}
+
+# "legacy" = macro -> template เดิม; "cache" = ส่วนคงที่ -> ส่วนที่ใช้ร่วมทั้งรอบ -> ข้อมูลรายคู่
+# (prefix ที่เหมือนกันยาวที่สุดระหว่างคู่เงิน เพื่อให้ prompt caching ของ provider ครอบคลุมมากที่สุด)
+LAYOUTS = ("legacy", "cache")
+FORMAT_MARKER = "### REQUIRED OUTPUT FORMAT (STRICT)"
+
+EVENTS_LEGEND = "(time ccy impact[H/M/L/Hol] event A:actual F:forecast P:previous)"
+NO_EVENTS_TEXT = "No relevant news scheduled for this pair today."
+
+_IMPACT_RANK = {"High": 0, "Medium": 1, "Low": 2, "Holiday": 3}
+_IMPACT_CODE = {"High": "H", "Medium": "M", "Low": "L", "Holiday": "Hol"}
+_MACRO_FIELDS = (
+    ("USD", "macro_usd_stance"),
+    ("Risk", "macro_risk_regime"),
+    ("DXY", "macro_dxy"),
+    ("US10Y", "macro_us10y"),
+    ("Oil", "macro_oil"),
+    ("Gold", "macro_xau"),
+)
+# ค่าราคาใน ctx ที่ต้องปัดตาม precision ของคู่เงิน
+_PRICE_KEYS = (
+    "h1_ema20", "h1_ema50", "m15_ema20", "m15_ema50", "h4_ema20", "h4_ema50",
+    "prev_day_high", "prev_day_low", "prev_day_close",
+    "daily_pivot_pp", "daily_pivot_r1", "daily_pivot_r2", "daily_pivot_r3",
+    "daily_pivot_s1", "daily_pivot_s2", "daily_pivot_s3",
+)
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+def price_digits(pair):
+    """non-JPY 5 ตำแหน่ง, JPY 3 ตำแหน่ง (ตรงกับกติกาใน SYSTEM_PROMPT)"""
+    return 3 if "JPY" in pair.upper() else 5
+
+def round_price(value, digits):
+    try:
+        return f"{float(value):.{digits}f}"
+    except (TypeError, ValueError):
+        return value  # เช่น "N/A"
+
+def compact_ohlc(ohlc, digits, max_bars=5):
+    """
+    Candles (หรือ JSON '[{"open":1.0852012345,...}]' แบบเดิม)
+    -> '(o,h,l,c,vol) 1.08520,1.08600,1.08410,1.08555,1234 | ...' (เก่า -> ใหม่)
+    """
+    if isinstance(ohlc, Candles):
+        bars = ohlc.tail(max_bars).to_records()
+    else:
+        try:
+            bars = json.loads(ohlc or "[]")
+        except ValueError:
+            return ohlc or "NA"
+    rows = []
+    for bar in bars[-max_bars:] if max_bars > 0 else []:
+        prices = [round_price(bar.get(k), digits) for k in ("open", "high", "low", "close")]
+        volume = bar.get("volume")
+        prices.append(str(int(volume)) if isinstance(volume, (int, float)) else "0")
+        rows.append(",".join(prices))
+    return "(o,h,l,c,vol) " + " | ".join(rows) if rows else "NA"
+
+def fit_ohlc(ohlc, digits, budget, max_bars=5, min_bars=2):
+    """ลดจำนวนแท่ง (ตัดแท่งเก่าก่อน) จนอยู่ในงบ แต่ไม่ต่ำกว่า min_bars"""
+    text = compact_ohlc(ohlc, digits, max_bars)
+    bars = max_bars
+    while bars > min_bars and estimate_tokens(text) > budget:
+        bars -= 1
+        text = compact_ohlc(ohlc, digits, bars)
+    return text
+
+def event_line(ev):
+    """e.g. '8:30pm USD H Non-Farm Payrolls A:210K F:185K P:175K' (ไม่ใส่ช่องที่ว่าง)"""
+    impact = ev.get("Impact") or ""
+    parts = [ev.get("Time", ""), ev.get("Currency", ""), _IMPACT_CODE.get(impact, impact or "-"), ev.get("Event", "")]
+    for label, key in (("A", "Actual"), ("F", "Forecast"), ("P", "Previous")):
+        if ev.get(key):
+            parts.append(f"{label}:{ev[key]}")
+    return " ".join(part for part in parts if part)
+
+def compact_events(events, budget, near=None):
+    """
+    ข่าวหนึ่งบรรทัดต่อ event เรียงตามเวลาเดิม ถ้าเกินงบจะเก็บข่าวใน `near` (ใกล้เวลาปัจจุบัน) ก่อน
+    แล้วตาม impact (High ก่อน) และบอกจำนวนที่ตัดทิ้ง
+    """
+    if not events:
+        return NO_EVENTS_TEXT
+    near_ids = {id(ev) for ev in near or ()}
+    lines = [event_line(ev) for ev in events]
+    priority = sorted(range(len(events)), key=lambda i: (id(events[i]) not in near_ids,
+                                                         _IMPACT_RANK.get(events[i].get("Impact"), 4), i))
+    used = estimate_tokens(EVENTS_LEGEND)
+    kept = set()
+    for i in priority:
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > budget:
+            break
+        kept.add(i)
+        used += cost
+    text = "\n".join([EVENTS_LEGEND] + [lines[i] for i in sorted(kept)])
+    dropped = len(lines) - len(kept)
+    if dropped:
+        text += f"\n(+{dropped} lower-priority events omitted)"
+    return text
+
+def compact_macro(macro, budget):
+    """บรรทัดเดียวของค่าที่รู้จริง (ตัด NA/ว่าง) + Notes ถ้ายังอยู่ในงบ"""
+    items = [f"{label}={macro.get(key)}" for label, key in _MACRO_FIELDS
+             if macro.get(key) and macro.get(key) != "NA"]
+    text = "### GLOBAL MACRO BASELINE (shared)\n" + ("; ".join(items) or "No baseline")
+    notes = macro.get("macro_notes")
+    if notes and estimate_tokens(f"{text}\nNotes: {notes}") <= budget:
+        text += f"\nNotes: {notes}"
+    return text + "\n\n"
+
+def compact_context(ctx, budgets=None):
+    """ctx แบบกระชับสำหรับ USER_PROMPT_TEMPLATE (ไม่แก้ ctx เดิม)"""
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    digits = price_digits(ctx["pair"])
+    compact = dict(ctx)
+    compact["news_data"] = compact_events(ctx.get("news_events"), budgets["events"], ctx.get("near_events"))
+    for tf in ("h1", "m15", "h4"):
+        compact[f"{tf}_ohlc"] = fit_ohlc(ctx[f"{tf}_ohlc"], digits, budgets[f"{tf}_ohlc"])
+    for key in _PRICE_KEYS:
+        compact[key] = round_price(ctx[key], digits)
+    return compact
+
+def split_template(template):
+    """(ส่วนข้อมูลรายคู่, ส่วนรูปแบบผลลัพธ์ที่คงที่) แยกที่ FORMAT_MARKER"""
+    head, marker, tail = template.partition(FORMAT_MARKER)
+    return head, marker + tail
+
+def compile_user_prompt(ctx, macro, template, budgets=None, layout="legacy"):
+    """
+    คืน (prompt, tokens ต่อ section) โดยข้อมูลแต่ละ section ถูกย่อและอยู่ในงบ
+    layout="legacy": โครงเดียวกับ template เดิม (macro ขึ้นก่อน)
+    layout="cache":  รูปแบบผลลัพธ์ (คงที่) -> macro (ร่วมทั้งรอบ) -> ข้อมูลคู่เงิน
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {layout}")
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    compact = compact_context(ctx, budgets)
+    macro_block = compact_macro(macro, budgets["macro"])
+    if layout == "cache":
+        pair_part, format_part = split_template(template)
+        prompt = format_part.strip() + "\n\n" + macro_block + pair_part.format(**compact).strip() + "\n"
+    else:
+        prompt = macro_block + template.format(**compact)
+    sections = {
+        "macro": estimate_tokens(macro_block),
+        "events": estimate_tokens(compact["news_data"]),
+        "h1_ohlc": estimate_tokens(compact["h1_ohlc"]),
+        "m15_ohlc": estimate_tokens(compact["m15_ohlc"]),
+        "h4_ohlc": estimate_tokens(compact["h4_ohlc"]),
+        "total": estimate_tokens(prompt),
+    }
+    return prompt, sections
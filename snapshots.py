@@ -0,0 +1,173 @@
+# snapshots.py
+"""
+TechnicalSnapshot: ผลวิเคราะห์ทางเทคนิคของ (pair, timeframe) ที่ memoize ด้วย timestamp ของแท่งที่ปิดล่าสุด
+- ระหว่างแท่งเดียวกัน (rerun, intraday refresh) ใช้ snapshot เดิมทันที ไม่ต้องเปิด stream/คำนวณ/จัดรูปแบบซ้ำ
+- มีแท่งใหม่ปิดเฉพาะบาง timeframe -> คำนวณใหม่เฉพาะ timeframe นั้น
+- SnapshotCache เก็บใน memory และบนดิสก์ (ตาราง technical_snapshot ของ CandleStore) ข้ามรอบการรัน
+- ข้อความที่ใช้ใน prompt จัดรูปแบบครั้งเดียวต่อ snapshot (fields)
+"""
+import math
+import time
+import threading
+from typing import Optional
+
+from candles import Candles
+
+DAILY_TIMEFRAME = 86400
+OHLC_BARS = 5
+# ชื่อค่าใน indicators.latest_values / IndicatorState.preview ตามลำดับ slot ของ TechnicalSnapshot
+_VALUE_KEYS = ("EMA_20", "EMA_50", "RSI_14", "MACD_12_26_9", "MACDH_12_26_9", "MACDS_12_26_9")
+
+def fmt(value, digits):
+    """จัดรูปแบบตัวเลข หรือ "N/A" ถ้าไม่มีค่า/เป็น NaN"""
+    if value is None or math.isnan(value):
+        return "N/A"
+    return f"{value:.{digits}f}"
+
+def pivot_points(high, low, close):
+    """Calculates Standard Daily Pivot Points."""
+    pp = (high + low + close) / 3
+    r1 = (2 * pp) - low
+    s1 = (2 * pp) - high
+    r2 = pp + (high - low)
+    s2 = pp - (high - low)
+    r3 = high + 2 * (pp - low)
+    s3 = low - 2 * (high - pp)
+    return {
+        "pp": f"{pp:.5f}", "r1": f"{r1:.5f}", "s1": f"{s1:.5f}",
+        "r2": f"{r2:.5f}", "s2": f"{s2:.5f}", "r3": f"{r3:.5f}", "s3": f"{s3:.5f}"
+    }
+
+def last_closed_time(timeframe, now=None, offset=0):
+    """เวลาเปิดของแท่งที่ปิดล่าสุด ณ เวลา now (แท่งแบ่งทุก `timeframe` วินาทีนับจาก epoch + offset)"""
+    now = int(time.time() if now is None else now)
+    return (now + offset) // timeframe * timeframe - offset - timeframe
+
+def closed_bar_time(candles):
+    """timestamp ของแท่งที่ปิดล่าสุด (แท่งสุดท้ายของ stream ยังไม่ปิด) หรือ None ถ้ามีไม่ถึง 2 แท่ง"""
+    return int(candles.time[-2]) if candles is not None and len(candles) >= 2 else None
+
+def _or_none(value):
+    return None if value is None or math.isnan(value) else float(value)
+
+class TechnicalSnapshot:
+    """
+    ค่าของ (pair, timeframe) ณ แท่งที่ปิดล่าสุด bar_time: OHLC 5 แท่งล่าสุด (รวมแท่งที่ยังไม่ปิด ณ ตอนคำนวณ)
+    และ EMA20/50, RSI14, MACD ล่าสุด; D1 ใช้ ohlc หาค่าวันก่อนหน้าและ Pivot
+    """
+    __slots__ = ("pair", "timeframe", "bar_time", "ohlc", "ema20", "ema50", "rsi", "macd", "macdh", "macds", "_fields")
+
+    def __init__(self, pair: str, timeframe: int, bar_time: Optional[int], ohlc: Candles,
+                 ema20: Optional[float] = None, ema50: Optional[float] = None, rsi: Optional[float] = None,
+                 macd: Optional[float] = None, macdh: Optional[float] = None, macds: Optional[float] = None):
+        self.pair = pair
+        self.timeframe = timeframe
+        self.bar_time = bar_time
+        self.ohlc = ohlc
+        self.ema20 = ema20
+        self.ema50 = ema50
+        self.rsi = rsi
+        self.macd = macd
+        self.macdh = macdh
+        self.macds = macds
+        self._fields = None
+
+    @classmethod
+    def build(cls, pair, timeframe, candles, values):
+        """snapshot จากแท่งเทียนที่ดึงมา และค่า indicator ล่าสุด (dict แบบ indicators.latest_values)"""
+        candles = candles if candles is not None else Candles.empty()
+        return cls(pair, timeframe, closed_bar_time(candles), candles.tail(OHLC_BARS).copy(),
+                   *(_or_none(values.get(key)) for key in _VALUE_KEYS))
+
+    def fields(self):
+        """ค่าที่จัดรูปแบบแล้วสำหรับ get_technical_data (สร้างครั้งแรกที่เรียก แล้วใช้ซ้ำ)"""
+        if self._fields is None:
+            self._fields = self._daily_fields() if self.timeframe == DAILY_TIMEFRAME else {
+                "ohlc": self.ohlc,
+                "ema20": fmt(self.ema20, 5),
+                "ema50": fmt(self.ema50, 5),
+                "rsi": fmt(self.rsi, 2),
+                "macd": fmt(self.macd, 5),
+                "macdh": fmt(self.macdh, 5),
+                "macds": fmt(self.macds, 5),
+            }
+        return self._fields
+
+    def _daily_fields(self):
+        # ต้องการอย่างน้อย 2 แท่ง: แท่งที่สองจากท้ายคือแท่งของวันก่อนหน้า (แท่งสุดท้ายยังไม่ปิด)
+        if len(self.ohlc) < 2:
+            pivots = dict.fromkeys(("pp", "r1", "s1", "r2", "s2", "r3", "s3"), "N/A")
+            prev = ("N/A", "N/A", "N/A")
+        else:
+            high, low, close = (float(getattr(self.ohlc, k)[-2]) for k in ("high", "low", "close"))
+            pivots = pivot_points(high, low, close)
+            prev = (f"{high:.5f}", f"{low:.5f}", f"{close:.5f}")
+        fields = dict(zip(("prev_day_high", "prev_day_low", "prev_day_close"), prev))
+        fields.update({f"daily_pivot_{name}": value for name, value in pivots.items()})
+        return fields
+
+    def to_dict(self):
+        return {
+            "pair": self.pair, "timeframe": self.timeframe, "bar_time": self.bar_time,
+            "ohlc": [list(row) for row in self.ohlc.rows()],
+            "values": [self.ema20, self.ema50, self.rsi, self.macd, self.macdh, self.macds],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["pair"], data["timeframe"], data["bar_time"], Candles.from_rows(data["ohlc"]), *data["values"])
+
+class SnapshotCache:
+    """snapshot ล่าสุดต่อ (pair, timeframe) ใน memory และใน CandleStore (store=None = memory อย่างเดียว)"""
+    def __init__(self, store=None):
+        self.store = store
+        self.hits = 0
+        self.computed = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def get(self, pair, timeframe):
+        key = (pair, timeframe)
+        with self._lock:
+            snapshot = self._memory.get(key)
+        if snapshot is None and self.store:
+            data = self.store.load_snapshot(pair, timeframe)
+            if data:
+                snapshot = TechnicalSnapshot.from_dict(data)
+                with self._lock:
+                    self._memory.setdefault(key, snapshot)
+        return snapshot
+
+    def _hit(self, snapshot):
+        if snapshot is not None:
+            with self._lock:
+                self.hits += 1
+        return snapshot
+
+    def fresh(self, pair, timeframe, now=None, offset=0):
+        """snapshot ที่ยังไม่มีแท่งใหม่ปิดตามเวลาปัจจุบัน (ใช้ได้โดยไม่ต้องดึงแท่งเทียน) หรือ None"""
+        snapshot = self.get(pair, timeframe)
+        if snapshot is None or snapshot.bar_time is None:
+            return None
+        if snapshot.bar_time < last_closed_time(timeframe, now, offset):
+            return None
+        return self._hit(snapshot)
+
+    def reuse(self, pair, timeframe, candles):
+        """snapshot เดิมถ้าแท่งปิดล่าสุดของ candles ที่เพิ่งดึงมายังเป็นแท่งเดิม (เช่น ตลาดปิด) หรือ None"""
+        bar_time = closed_bar_time(candles)
+        snapshot = self.get(pair, timeframe) if bar_time is not None else None
+        if snapshot is None or snapshot.bar_time != bar_time:
+            return None
+        return self._hit(snapshot)
+
+    def put(self, snapshot):
+        with self._lock:
+            self._memory[(snapshot.pair, snapshot.timeframe)] = snapshot
+            self.computed += 1
+        if self.store and snapshot.bar_time is not None:
+            self.store.save_snapshot(snapshot.pair, snapshot.timeframe, snapshot.to_dict())
+
+    def metrics(self):
+        with self._lock:
+            return {"hits": self.hits, "computed": self.computed, "cached": len(self._memory)}
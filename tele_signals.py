@@ -1,21 +1,14 @@
-import requests
-
-class TyphoonForexAnalyzer:
-    def __init__(self, api_key, model="typhoon-v2.1-12b-instruct", base_url="https://api.opentyphoon.ai/v1"):
-        self.api_key = api_key
-        self.model = model
-        self.base_url = base_url
-        self.endpoint = f"{self.base_url}/chat/completions"
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
-    def build_prompt(self, analysis_text):
-        return f"""
-        Extract the essential intraday trading plan from the following GPT-5 analysis.
-        Output must follow the structure EXACTLY and be terse.
+import requests
 
-        ANALYSIS:
-        {analysis_text}
+import tracing
+from llm_cache import cache_key
+from telegram_outbox import TelegramOutbox
 
-        OUTPUT FORMAT (STRICT):
+_FORMAT_SPEC = """        OUTPUT FORMAT (STRICT):
         **PAIR:** [Currency Pair]
         **DATE:** [Trading Date]
         **BIAS:** [Bullish/Bearish/Neutral/Range-bound] - [≤12 words]
@@ -34,6 +27,47 @@ class TyphoonForexAnalyzer:
         - Preserve numeric price levels and time windows
         - If missing, write "Insufficient data"
         """
+
+# แต่ละคู่ใน batch ถูกห่อด้วย marker เพื่อแยกผลกลับเป็นรายคู่
+_BLOCK_RE = re.compile(r"<<<BEGIN (.+?)>>>\s*(.*?)\s*<<<END \1>>>", re.S)
+_REQUIRED_FIELDS = ("**PAIR:**", "**BIAS:**", "**SUPPORTS:**", "**RESISTANCES:**")
+
+def _estimate_tokens(text):
+    """ประมาณจำนวน token แบบหยาบ (~4 ตัวอักษร/token สำหรับข้อความอังกฤษ)"""
+    return len(text or "") // 4 + 1
+
+def _is_valid_summary(pair, summary):
+    """มีหัวข้อหลักครบ และบรรทัด PAIR ตรงกับคู่ที่ขอ (กันผลสลับคู่)"""
+    if not summary or any(field not in summary for field in _REQUIRED_FIELDS):
+        return False
+    pair_line = summary.split("**PAIR:**", 1)[1].split("\n", 1)[0]
+    return pair.replace("/", "").upper() in pair_line.replace("/", "").upper()
+
+class TyphoonForexAnalyzer:
+    def __init__(self, api_key, model="typhoon-v2.1-12b-instruct", base_url="https://api.opentyphoon.ai/v1", cache=None,
+                 timeout=60, pack_token_budget=6000, pack_max_pairs=5, summary_tokens=600, fanout_workers=4):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.endpoint = f"{self.base_url}/chat/completions"
+        self.cache = cache  # llm_cache.ResponseCache (optional)
+        self.timeout = timeout
+        # analyze_many: งบ token ขาเข้าต่อ request ที่ pack หลายคู่ / token ขาออกต่อคู่ / จำนวน thread ตอนยิงแยก
+        self.pack_token_budget = pack_token_budget
+        self.pack_max_pairs = pack_max_pairs
+        self.summary_tokens = summary_tokens
+        self.fanout_workers = fanout_workers
+        self.session = requests.Session()  # keep-alive ข้ามหลาย call
+
+    def build_prompt(self, analysis_text):
+        return f"""
+        Extract the essential intraday trading plan from the following GPT-5 analysis.
+        Output must follow the structure EXACTLY and be terse.
+
+        ANALYSIS:
+        {analysis_text}
+
+{_FORMAT_SPEC}"""
     
     def system_prompter(self):
         return """
@@ -47,9 +81,9 @@ class TyphoonForexAnalyzer:
         - Eliminate redundancy and filler language
         """
 
-    def analyze(self, analysis_text, max_tokens=2048, temperature=0.3):
+    def build_payload(self, analysis_text, max_tokens=2048, temperature=0.3):
         prompt = self.build_prompt(analysis_text)
-        payload = {
+        return {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": self.system_prompter()}, 
@@ -58,45 +92,251 @@ class TyphoonForexAnalyzer:
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
-        response = requests.post(
-            self.endpoint,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            json=payload
-        )
-        response.raise_for_status()
-        resp_json = response.json()
-        return resp_json["choices"][0]["message"]["content"]
+
+    def _cached(self, key):
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print("📦 Typhoon summary served from cache.")
+                return cached
+        return None
+
+    def analyze(self, analysis_text, max_tokens=2048, temperature=0.3):
+        payload = self.build_payload(analysis_text, max_tokens, temperature)
+        # payload มี GPT analysis อยู่ใน prompt -> key ผูกกับ hash ของ analysis + model + parameters
+        key = cache_key(**payload)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        content = self._post(payload)
+        if self.cache:
+            self.cache.set(key, content)
+        return content
+
+    def _post(self, payload, span_name="typhoon"):
+        with tracing.span(span_name) as sp:
+            response = self.session.post(
+                self.endpoint,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                json=payload,
+                timeout=self.timeout
+            )
+            sp.set(status=response.status_code, bytes=len(response.content))
+            response.raise_for_status()
+            resp_json = response.json()
+            usage = resp_json.get("usage") or {}
+            sp.set(input_tokens=usage.get("prompt_tokens", 0), output_tokens=usage.get("completion_tokens", 0),
+                   cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0))
+            return resp_json["choices"][0]["message"]["content"]
+
+    async def analyze_async(self, analysis_text, client, max_tokens=2048, temperature=0.3):
+        """เหมือน analyze แต่ผ่าน llm_clients.AsyncLLMClient (จำกัด concurrency + retry/backoff)"""
+        payload = self.build_payload(analysis_text, max_tokens, temperature)
+        key = cache_key(**payload)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        with tracing.span("typhoon"):
+            content = await client.chat_text(**payload)
+        if self.cache:
+            self.cache.set(key, content)
+        return content
+
+    def build_batch_prompt(self, items):
+        pairs = ", ".join(pair for pair, _ in items)
+        analyses = "\n\n".join(f"<<<ANALYSIS {pair}>>>\n{text}" for pair, text in items)
+        return f"""
+        Extract the essential intraday trading plan from EACH of the following GPT-5 analyses.
+        Output must follow the structure EXACTLY and be terse.
+        Write one block per analysis, in the same order, wrapped exactly as:
+        <<<BEGIN [Currency Pair]>>>
+        [summary]
+        <<<END [Currency Pair]>>>
+        Use these currency pairs verbatim in the markers: {pairs}
+
+        ANALYSES:
+        {analyses}
+
+{_FORMAT_SPEC}"""
+
+    def build_batch_payload(self, items, temperature=0.3):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompter()},
+                {"role": "user", "content": self.build_batch_prompt(items)}
+            ],
+            "max_tokens": self.summary_tokens * len(items),
+            "temperature": temperature,
+        }
+
+    def plan_batches(self, analyses):
+        """แบ่งคู่เงินเป็นกลุ่ม: คู่ที่อยู่ในงบ token เดียวกันจะถูก pack ลง request เดียว"""
+        overhead = _estimate_tokens(self.system_prompter() + _FORMAT_SPEC)
+        batches, current, used = [], [], overhead
+        for pair, text in analyses.items():
+            cost = _estimate_tokens(text)
+            if current and (used + cost > self.pack_token_budget or len(current) >= self.pack_max_pairs):
+                batches.append(current)
+                current, used = [], overhead
+            current.append(pair)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def split_batch(self, content, pairs):
+        """แยกผลของ batch กลับเป็น {pair: summary} เฉพาะ block ที่ตรวจผ่าน"""
+        found = {}
+        for label, body in _BLOCK_RE.findall(content or ""):
+            pair = label.strip()
+            if pair in pairs and pair not in found and _is_valid_summary(pair, body):
+                found[pair] = body
+        return found
+
+    def _split_cached(self, analyses, max_tokens, temperature):
+        """(ผลที่อยู่ในแคชแล้ว, คู่ที่ยังต้องเรียก API) ใช้ key เดียวกับ analyze()"""
+        results, pending = {}, {}
+        for pair, text in analyses.items():
+            cached = self._cached(cache_key(**self.build_payload(text, max_tokens, temperature)))
+            if cached is not None:
+                results[pair] = cached
+            else:
+                pending[pair] = text
+        return results, pending
+
+    def _accept_batch(self, items, content, max_tokens, temperature):
+        found = self.split_batch(content, [pair for pair, _ in items])
+        texts = dict(items)
+        for pair, summary in found.items():
+            if self.cache:
+                self.cache.set(cache_key(**self.build_payload(texts[pair], max_tokens, temperature)), summary)
+        missing = [pair for pair, _ in items if pair not in found]
+        if missing:
+            print(f"⚠️ Typhoon batch missing/invalid for {', '.join(missing)}; retrying individually.")
+        return found
+
+    def analyze_many(self, analyses, max_tokens=2048, temperature=0.3):
+        """
+        Typhoon summary ของหลายคู่ ({pair: GPT analysis} -> {pair: summary หรือ None})
+        - คู่ที่อยู่ในงบ token เดียวกัน pack ลง request เดียว (system prompt/format ส่งครั้งเดียว)
+        - คู่ที่เกินงบ หรือ block ที่ตรวจไม่ผ่าน ยิงแยกพร้อมกันผ่าน keep-alive session
+        """
+        results, pending = self._split_cached(analyses, max_tokens, temperature)
+        singles = []
+        for batch in self.plan_batches(pending):
+            if len(batch) == 1:
+                singles.extend(batch)
+                continue
+            items = [(pair, pending[pair]) for pair in batch]
+            try:
+                content = self._post(self.build_batch_payload(items, temperature), span_name="typhoon.batch")
+            except Exception as e:
+                print(f"❌ Typhoon batch call failed ({', '.join(batch)}): {e}")
+                content = ""
+            found = self._accept_batch(items, content, max_tokens, temperature)
+            results.update(found)
+            singles.extend(pair for pair in batch if pair not in found)
+
+        if singles:
+            with ThreadPoolExecutor(max_workers=min(len(singles), self.fanout_workers)) as pool:
+                futures = {pair: pool.submit(self.analyze, pending[pair], max_tokens, temperature) for pair in singles}
+            for pair, future in futures.items():
+                try:
+                    results[pair] = future.result()
+                except Exception as e:
+                    print(f"❌ Typhoon call failed for {pair}: {e}")
+        return {pair: results.get(pair) for pair in analyses}
+
+    async def analyze_many_async(self, analyses, client, max_tokens=2048, temperature=0.3):
+        """analyze_many ผ่าน llm_clients.AsyncLLMClient (batch และ fan-out รันพร้อมกัน)"""
+        results, pending = self._split_cached(analyses, max_tokens, temperature)
+
+        async def run_batch(batch):
+            if len(batch) > 1:
+                items = [(pair, pending[pair]) for pair in batch]
+                try:
+                    with tracing.span("typhoon.batch", pairs=len(items)):
+                        content = await client.chat_text(**self.build_batch_payload(items, temperature))
+                except Exception as e:
+                    print(f"❌ Typhoon batch call failed ({', '.join(batch)}): {e}")
+                    content = ""
+                found = self._accept_batch(items, content, max_tokens, temperature)
+                results.update(found)
+                batch = [pair for pair in batch if pair not in found]
+            outcomes = await asyncio.gather(
+                *(self.analyze_async(pending[pair], client, max_tokens, temperature) for pair in batch),
+                return_exceptions=True,
+            )
+            for pair, outcome in zip(batch, outcomes):
+                if isinstance(outcome, Exception):
+                    print(f"❌ Typhoon call failed for {pair}: {outcome}")
+                else:
+                    results[pair] = outcome
+
+        await asyncio.gather(*(run_batch(batch) for batch in self.plan_batches(pending)))
+        return {pair: results.get(pair) for pair in analyses}
 
 class TelegramNotifier:
-    def __init__(self, bot_token, chat_id):
+    def __init__(self, bot_token, chat_id, outbox=None):
         self.bot_token = bot_token
         self.chat_id = chat_id
+        self.outbox = outbox or TelegramOutbox()
 
     def send_message(self, message, parse_mode="Markdown"):
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        resp = requests.post(url, data={
-            "chat_id": self.chat_id,
-            "text": message,
-            "parse_mode": parse_mode
-        })
-        resp.raise_for_status()
-        return resp.json()
+        """เข้าคิวส่งแบบไม่บล็อก คืน Future ของผล sendMessage"""
+        return self.outbox.enqueue(self.bot_token, self.chat_id, message, parse_mode)
 
 class ForexBot:
     def __init__(self, analyzer: TyphoonForexAnalyzer, notifier: TelegramNotifier):
         self.analyzer = analyzer
         self.notifier = notifier
 
-    def send(self, raw_analysis_text):
+    def summarize(self, raw_analysis_text):
+        """Typhoon summary only (no Telegram). Returns None on failure."""
         try:
-            summary = self.analyzer.analyze(raw_analysis_text)
-            self.notifier.send_message(summary)
-            print("✅ Summary sent to Telegram!")
+            return self.analyzer.analyze(raw_analysis_text)
         except requests.HTTPError as http_err:
             print("❌ HTTP error during API call:", http_err)
             print("Response content:", http_err.response.text)
         except Exception as e:
-            print("❌ Unexpected error:", e)
\ No newline at end of file
+            print("❌ Unexpected error:", e)
+        return None
+
+    async def summarize_async(self, raw_analysis_text, client):
+        """Typhoon summary ผ่าน async client (no Telegram). Returns None on failure."""
+        try:
+            return await self.analyzer.analyze_async(raw_analysis_text, client)
+        except Exception as e:
+            print("❌ Typhoon async call failed:", e)
+        return None
+
+    def summarize_many(self, analyses):
+        """{pair: analysis} -> {pair: summary หรือ None} ด้วย request ให้น้อยที่สุด"""
+        try:
+            return self.analyzer.analyze_many(analyses)
+        except Exception as e:
+            print("❌ Unexpected error:", e)
+        return {pair: None for pair in analyses}
+
+    async def summarize_many_async(self, analyses, client):
+        try:
+            return await self.analyzer.analyze_many_async(analyses, client)
+        except Exception as e:
+            print("❌ Typhoon async batch failed:", e)
+        return {pair: None for pair in analyses}
+
+    def deliver(self, summary):
+        """Queue an already-built summary for Telegram (errors are reported by the outbox)."""
+        self.notifier.send_message(summary)
+        print("✅ Summary queued for Telegram!")
+
+    def send(self, raw_analysis_text):
+        summary = self.summarize(raw_analysis_text)
+        if summary:
+            self.deliver(summary)
@@ -0,0 +1,175 @@
+# telegram_outbox.py
+"""
+คิวส่งข้อความ Telegram แบบ background (worker thread เดียว, FIFO จึงรักษาลำดับข้อความ)
+- requests.Session แบบ keep-alive หนึ่งตัวต่อ bot token
+- token bucket ตาม limit ของ Telegram: ~30 ข้อความ/วินาที ต่อ bot, 1 ข้อความ/วินาที ต่อแชท,
+  20 ข้อความ/นาที ต่อกลุ่ม
+- เจอ 429 จะรอตาม parameters.retry_after แล้วส่งข้อความเดิมซ้ำ
+ผู้เรียก enqueue() แล้วทำงานต่อได้ทันที (ได้ Future กลับไปถ้าต้องการรอผล)
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+TELEGRAM_API = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+GLOBAL_RATE = 30.0        # ข้อความ/วินาที ต่อ bot (ทุกแชทรวมกัน)
+GROUP_RATE_PER_MIN = 20   # ข้อความ/นาที ต่อกลุ่ม (chat_id ติดลบ)
+
+class TokenBucket:
+    """token bucket แบบ thread-safe: reserve() จอง token แล้วบอกว่าต้องรอกี่วินาที"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+def _retry_after(resp, default=5.0):
+    """retry_after (วินาที) จาก body ของ 429 หรือ header Retry-After"""
+    try:
+        return float(resp.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(resp.headers.get("Retry-After", default))
+    except ValueError:
+        return default
+
+class TelegramOutbox:
+    """
+    chat_interval: ระยะห่างขั้นต่ำระหว่างข้อความในแชทเดียวกัน (วินาที)
+    max_attempts: จำนวนครั้งสูงสุดต่อข้อความ (รวม retry หลัง 429 / 5xx / connection error)
+    """
+    def __init__(self, chat_interval=1.0, max_attempts=5, timeout=15, pool_size=4):
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._queue = queue.Queue()
+        self._sessions = {}  # token -> requests.Session
+        self._buckets = {}   # key -> TokenBucket
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def enqueue(self, token, chat_id, text, parse_mode="Markdown"):
+        """ใส่ข้อความเข้าคิวแล้วคืน Future (ผลเป็น JSON ของ sendMessage) โดยไม่บล็อก"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((token, chat_id, text, parse_mode, future))
+        return future
+
+    def flush(self):
+        """รอจนข้อความที่อยู่ในคิวถูกส่ง (หรือล้มเหลว) ครบ"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    def stats(self):
+        return {"sent": self.sent, "failed": self.failed, "rate_limited": self.rate_limited}
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+                self._worker.start()
+
+    def _session(self, token):
+        session = self._sessions.get(token)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            self._sessions[token] = session
+        return session
+
+    def _bucket(self, key, rate, capacity):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _buckets_for(self, token, chat_id):
+        buckets = [
+            self._bucket(("global", token), GLOBAL_RATE, GLOBAL_RATE),
+            self._bucket(("chat", token, chat_id), 1.0 / self.chat_interval, 1),
+        ]
+        if str(chat_id).startswith("-"):
+            buckets.append(self._bucket(("group", token, chat_id), GROUP_RATE_PER_MIN / 60.0, GROUP_RATE_PER_MIN))
+        return buckets
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                token, chat_id, text, parse_mode, future = item
+                try:
+                    future.set_result(self._deliver(token, chat_id, text, parse_mode))
+                    self.sent += 1
+                    print("📨 Telegram message sent successfully.")
+                except Exception as e:
+                    self.failed += 1
+                    print(f"❌ Telegram send failed: {e}")
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, token, chat_id, text, parse_mode):
+        url = f"{TELEGRAM_API}/bot{token}/sendMessage"
+        data = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+        buckets = self._buckets_for(token, chat_id)
+        with tracing.span("telegram.send", bytes=len(text.encode("utf-8"))) as sp:
+            for attempt in range(1, self.max_attempts + 1):
+                wait = max(bucket.reserve() for bucket in buckets)
+                if wait > 0:
+                    sp.add("throttled_s", wait)
+                    time.sleep(wait)
+                if attempt > 1:
+                    sp.add("retries")
+                try:
+                    resp = self._session(token).post(url, data=data, timeout=self.timeout)
+                except requests.RequestException:
+                    if attempt == self.max_attempts:
+                        raise
+                    time.sleep(min(30, 2 ** attempt))
+                    continue
+
+                sp.set(status=resp.status_code)
+                if resp.status_code == 429 and attempt < self.max_attempts:
+                    self.rate_limited += 1
+                    delay = _retry_after(resp)
+                    print(f"⏳ Telegram rate limited, retrying in {delay:.0f}s")
+                    time.sleep(delay)
+                    continue
+                if resp.status_code >= 500 and attempt < self.max_attempts:
+                    time.sleep(min(30, 2 ** attempt))
+                    continue
+                resp.raise_for_status()
+                return resp.json()
@@ -0,0 +1,154 @@
+# tracing.py
+"""
+Span แบบเบาสำหรับวัดแต่ละขั้นของรอบการรัน (scrape, IQ fetch, indicators, GPT, Typhoon, Telegram)
+- span เก็บเวลา, thread, span แม่ และ attribute (bytes, tokens, retries, error, ...)
+- span ปัจจุบันเก็บใน ContextVar จึงแยกกันถูกต้องทั้งข้าม thread และข้าม asyncio task
+- จบรอบเขียนเป็นไฟล์ Chrome trace-event JSON (เปิดด้วย chrome://tracing หรือ Perfetto)
+  และพิมพ์ตารางสรุปได้ (--profile)
+"""
+import os
+import json
+import time
+import threading
+import itertools
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# attribute ที่รวมยอดในตารางสรุป
+SUMMED_ATTRS = ("bytes", "input_tokens", "cached_tokens", "output_tokens", "retries")
+
+class Span:
+    __slots__ = ("id", "parent", "name", "start", "end", "thread", "attrs")
+
+    def __init__(self, span_id, parent, name, attrs):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, amount=1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+class Tracer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._current = ContextVar("current_span", default=None)
+
+    def reset(self):
+        """ล้าง span ทั้งหมดและเริ่มนับเวลาใหม่ (เช่น ระหว่างรอบของ benchmark)"""
+        with self._lock:
+            self.spans = []
+            self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        parent = self._current.get()
+        current = Span(next(self._ids), parent.id if parent else None, name, attrs)
+        token = self._current.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current.end = time.perf_counter()
+            self._current.reset(token)
+            with self._lock:
+                self.spans.append(current)
+
+    def record(self, name, seconds, started=None, **attrs):
+        """บันทึก span ย้อนหลังจากเวลาที่วัดไว้แล้ว (เช่น เวลารอของแต่ละ stream ที่รอพร้อมกัน)"""
+        parent = self._current.get()
+        done = Span(next(self._ids), parent.id if parent else None, name, attrs)
+        done.start = started if started is not None else time.perf_counter() - seconds
+        done.end = done.start + seconds
+        with self._lock:
+            self.spans.append(done)
+        return done
+
+    def current(self):
+        return self._current.get()
+
+    def annotate(self, **attrs):
+        """เพิ่ม attribute ให้ span ปัจจุบัน (ไม่มี span = ไม่ทำอะไร)"""
+        current = self._current.get()
+        if current is not None:
+            current.set(**attrs)
+
+    def count(self, key, amount=1):
+        current = self._current.get()
+        if current is not None:
+            current.add(key, amount)
+
+    def to_trace_events(self):
+        """Chrome trace-event format (ph="X" = complete event, หน่วยไมโครวินาที)"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for s in sorted(spans, key=lambda s: s.start):
+            args = {k: v if isinstance(v, (int, float, str, bool)) or v is None else str(v)
+                    for k, v in s.attrs.items()}
+            args.update({"span_id": s.id, "parent_id": s.parent})
+            events.append({
+                "name": s.name, "cat": s.name.split(".", 1)[0], "ph": "X", "pid": pid, "tid": s.thread,
+                "ts": round((s.start - self.origin) * 1e6), "dur": round(s.seconds * 1e6), "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace_events(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def summary(self):
+        """{name: {count, total, mean, max, errors, <SUMMED_ATTRS>}} เรียงตามเวลารวม"""
+        with self._lock:
+            spans = list(self.spans)
+        rows = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+        for s in spans:
+            row = rows[s.name]
+            row["count"] += 1
+            row["total"] += s.seconds
+            row["max"] = max(row["max"], s.seconds)
+            row["errors"] += 1 if s.attrs.get("error") else 0
+            for key in SUMMED_ATTRS:
+                if isinstance(s.attrs.get(key), (int, float)):
+                    row[key] = row.get(key, 0) + s.attrs[key]
+        for row in rows.values():
+            row["mean"] = row["total"] / row["count"]
+        return dict(sorted(rows.items(), key=lambda item: item[1]["total"], reverse=True))
+
+    def print_summary(self):
+        print("\n📊 Run profile (spans):")
+        print(f"  {'span':<22}{'count':>6}{'total s':>10}{'mean s':>9}{'max s':>9}{'errors':>8}  extra")
+        for name, row in self.summary().items():
+            extra = " ".join(f"{key}={row[key]}" for key in SUMMED_ATTRS if row.get(key))
+            print(f"  {name:<22}{row['count']:>6}{row['total']:>10.2f}{row['mean']:>9.3f}"
+                  f"{row['max']:>9.3f}{row['errors']:>8}  {extra}")
+
+# tracer ของทั้ง process (ทุกโมดูลใช้ร่วมกัน)
+TRACER = Tracer()
+span = TRACER.span
+record = TRACER.record
+annotate = TRACER.annotate
+count = TRACER.count